@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import logging
+from collections import deque
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Пороговые значения (можно переопределить через .env)
+BREAKER_WINDOW = int(os.getenv('BREAKER_WINDOW', '20'))
+BREAKER_MIN_CALLS = int(os.getenv('BREAKER_MIN_CALLS', '5'))
+BREAKER_FAILURE_RATE = float(os.getenv('BREAKER_FAILURE_RATE', '0.5'))
+BREAKER_SLOW_CALL_SECONDS = float(os.getenv('BREAKER_SLOW_CALL_SECONDS', '30'))
+BREAKER_SLOW_CALL_RATE = float(os.getenv('BREAKER_SLOW_CALL_RATE', '0.8'))
+BREAKER_OPEN_SECONDS = float(os.getenv('BREAKER_OPEN_SECONDS', '60'))
+BREAKER_HALF_OPEN_CALLS = int(os.getenv('BREAKER_HALF_OPEN_CALLS', '2'))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Размыкатель: при высокой доле ошибок или медленных ответов перестаёт пускать запросы,
+    через BREAKER_OPEN_SECONDS пропускает пробные запросы (half-open) и по их итогам замыкается или снова размыкается."""
+
+    def __init__(self, name: str, window: int = BREAKER_WINDOW, min_calls: int = BREAKER_MIN_CALLS,
+                 failure_rate: float = BREAKER_FAILURE_RATE, slow_call_seconds: float = BREAKER_SLOW_CALL_SECONDS,
+                 slow_call_rate: float = BREAKER_SLOW_CALL_RATE, open_seconds: float = BREAKER_OPEN_SECONDS,
+                 half_open_calls: int = BREAKER_HALF_OPEN_CALLS):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+
+        self.state = CLOSED
+        self.opened_at = 0.0
+        # Окно последних вызовов: (успех, медленный)
+        self._calls = deque(maxlen=window)
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self.rejected = 0
+        self.transitions = deque(maxlen=50)
+
+    def allow_request(self) -> bool:
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.open_seconds:
+                self.rejected += 1
+                return False
+            self._transition(HALF_OPEN, "истекло время размыкания")
+
+        if self.state == HALF_OPEN:
+            if self._probes_in_flight >= self.half_open_calls:
+                self.rejected += 1
+                return False
+            self._probes_in_flight += 1
+        return True
+
+    def record_success(self, duration: float) -> None:
+        slow = duration >= self.slow_call_seconds
+        if self.state == HALF_OPEN:
+            self._probes_in_flight = max(self._probes_in_flight - 1, 0)
+            if slow:
+                self._transition(OPEN, f"медленный пробный вызов ({duration:.1f} с)")
+                return
+            self._probe_successes += 1
+            if self._probe_successes >= self.half_open_calls:
+                self._transition(CLOSED, "пробные вызовы успешны")
+            return
+        self._calls.append((True, slow))
+        self._evaluate()
+
+    def record_failure(self) -> None:
+        if self.state == HALF_OPEN:
+            self._probes_in_flight = max(self._probes_in_flight - 1, 0)
+            self._transition(OPEN, "ошибка пробного вызова")
+            return
+        self._calls.append((False, False))
+        self._evaluate()
+
+    def record_cancelled(self) -> None:
+        # Отменённый вызов ничего не говорит о состоянии провайдера, только освобождаем слот пробы
+        if self.state == HALF_OPEN:
+            self._probes_in_flight = max(self._probes_in_flight - 1, 0)
+
+    def _evaluate(self) -> None:
+        if self.state != CLOSED or len(self._calls) < self.min_calls:
+            return
+        total = len(self._calls)
+        failures = sum(1 for ok, _ in self._calls if not ok)
+        slow = sum(1 for _, is_slow in self._calls if is_slow)
+        if failures / total >= self.failure_rate:
+            self._transition(OPEN, f"доля ошибок {failures}/{total}")
+        elif slow / total >= self.slow_call_rate:
+            self._transition(OPEN, f"доля медленных вызовов {slow}/{total}")
+
+    def _transition(self, state: str, reason: str) -> None:
+        previous = self.state
+        self.state = state
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+        if state in (OPEN, CLOSED):
+            self._probes_in_flight = 0
+            self._probe_successes = 0
+        if state == CLOSED:
+            self._calls.clear()
+        if state == HALF_OPEN:
+            self._probe_successes = 0
+        self.transitions.append((time.time(), previous, state, reason))
+        logger.warning(f"Circuit breaker {self.name}: {previous} -> {state} ({reason})")
+
+    def snapshot(self) -> dict:
+        total = len(self._calls)
+        failures = sum(1 for ok, _ in self._calls if not ok)
+        slow = sum(1 for _, is_slow in self._calls if is_slow)
+        retry_in: Optional[float] = None
+        if self.state == OPEN:
+            retry_in = max(self.open_seconds - (time.monotonic() - self.opened_at), 0)
+        return {
+            "name": self.name,
+            "state": self.state,
+            "calls": total,
+            "failures": failures,
+            "slow_calls": slow,
+            "rejected": self.rejected,
+            "retry_in": retry_in,
+            "transitions": list(self.transitions)
+        }
@@ -3,11 +3,7 @@
 import os
 import asyncio
 import logging
-import aiohttp
-import json
-import ssl
 from aiogram import Bot, Dispatcher, types, F
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
@@ -15,22 +11,26 @@ from aiogram import Router
 from aiogram.filters import Command
 from dotenv import load_dotenv
 
+import nutrition
+from fsm_storage import SQLiteStorage
+from http_client import init_http_session, close_http_session
+from llm_providers import LLMError, DeepSeekProvider
+
 load_dotenv()
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 DEEPSEEK_API_KEY = os.getenv('DEEPSEEK_API_KEY')
 
+# Провайдер DeepSeek (тот же, что используется для хеджирования в razdel.py)
+deepseek = DeepSeekProvider(DEEPSEEK_API_KEY, max_tokens=1500)
+
 logging.basicConfig(level=logging.INFO)
 bot = Bot(token=BOT_TOKEN)
-storage = MemoryStorage()
+# Состояния анкеты хранятся в SQLite и переживают перезапуск
+storage = SQLiteStorage()
 dp = Dispatcher(storage=storage)
 router = Router()
 dp.include_router(router)
 
-# Создаем кастомный SSL контекст для разработки
-ssl_context = ssl.create_default_context()
-ssl_context.check_hostname = False
-ssl_context.verify_mode = ssl.CERT_NONE
-
 # Временное хранилище данных пользователей
 user_data_storage = {}
 
@@ -161,28 +161,9 @@ async def calculate_calories(message: types.Message):
     activity = data.get("activity", "средний")
     goal = data.get("goal", "поддерживать форму")
     
-    # Расчет BMR (Mifflin-St Jeor Equation)
-    if gender == "мужчина":
-        bmr = 10 * weight + 6.25 * height - 5 * age + 5
-    else:
-        bmr = 10 * weight + 6.25 * height - 5 * age - 161
-    
-    # Коэффициент активности
-    activity_coeffs = {"низкий": 1.2, "средний": 1.55, "высокий": 1.725}
-    tdee = bmr * activity_coeffs.get(activity, 1.2)
-    
-    # Коррекция по цели
-    if goal == "похудеть":
-        daily_calories = tdee - 500
-    elif goal == "набрать массу":
-        daily_calories = tdee + 500
-    else:
-        daily_calories = tdee
-    
-    # Расчет БЖУ
-    protein = weight * 2  # 2г белка на кг веса
-    fat = (daily_calories * 0.25) / 9  # 25% от калорий, 9 ккал/г
-    carbs = (daily_calories - (protein * 4 + fat * 9)) / 4  # остальное углеводы
+    norms = nutrition.calculate_calories(gender, age, weight, height, activity, goal)
+    daily_calories = norms['daily_calories']
+    protein, fat, carbs = norms['protein'], norms['fat'], norms['carbs']
     
     response = (
         f"🍽️ Ваша суточная норма:\n\n"
@@ -205,20 +186,7 @@ async def calc_calories(message: types.Message):
     activity = "средний"
     goal = "поддерживать форму"
     
-    if gender == "мужчина":
-        bmr = 10 * weight + 6.25 * height - 5 * age + 5
-    else:
-        bmr = 10 * weight + 6.25 * height - 5 * age - 161
-    
-    activity_coeffs = {"низкий": 1.2, "средний": 1.55, "высокий": 1.725}
-    tdee = bmr * activity_coeffs.get(activity, 1.2)
-    
-    if goal == "похудеть":
-        daily_calories = tdee - 500
-    elif goal == "набрать массу":
-        daily_calories = tdee + 500
-    else:
-        daily_calories = tdee
+    daily_calories = nutrition.calculate_calories(gender, age, weight, height, activity, goal)['daily_calories']
     
     await message.answer(f"Примерная суточная норма: {int(daily_calories)} ккал.")
 
@@ -227,37 +195,14 @@ async def generate_with_deepseek(prompt: str) -> str:
     if not DEEPSEEK_API_KEY:
         return "Ошибка: API ключ не настроен"
     
-    url = "https://api.deepseek.com/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
-    data = {
-        "model": "deepseek-chat",
-        "messages": [{"role": "user", "content": prompt}],
-        "max_tokens": 1500,
-        "temperature": 0.7,
-        "stream": False
-    }
-    
     try:
-        # Используем кастомный SSL контекст для обхода ошибки сертификата
-        connector = aiohttp.TCPConnector(ssl=ssl_context)
-        
-        async with aiohttp.ClientSession(connector=connector) as session:
-            async with session.post(url, headers=headers, json=data, timeout=60) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    return result['choices'][0]['message']['content']
-                else:
-                    error_text = await response.text()
-                    logging.error(f"DeepSeek API error: {response.status} - {error_text}")
-                    return f"Ошибка API: {response.status}"
-                    
+        return await deepseek.complete(prompt)
     except asyncio.TimeoutError:
         logging.error("DeepSeek API timeout")
         return "Таймаут запроса к AI"
+    except LLMError as e:
+        logging.error(f"DeepSeek API error: {e}")
+        return f"Ошибка API: {e}"
     except Exception as e:
         logging.error(f"DeepSeek error: {e}")
         return f"Ошибка: {str(e)}"
@@ -336,20 +281,7 @@ async def generate_menu(message: types.Message):
     goal = data.get("goal", "поддерживать форму")
     
     # Расчет калорий
-    if gender == "мужчина":
-        bmr = 10 * weight + 6.25 * height - 5 * age + 5
-    else:
-        bmr = 10 * weight + 6.25 * height - 5 * age - 161
-    
-    activity_coeffs = {"низкий": 1.2, "средний": 1.55, "высокий": 1.725}
-    tdee = bmr * activity_coeffs.get(activity, 1.2)
-    
-    if goal == "похудеть":
-        daily_calories = tdee - 500
-    elif goal == "набрать массу":
-        daily_calories = tdee + 500
-    else:
-        daily_calories = tdee
+    daily_calories = nutrition.calculate_calories(gender, age, weight, height, activity, goal)['daily_calories']
     
     # Промпт для DeepSeek
     prompt = f"""
@@ -393,7 +325,12 @@ async def generate_menu(message: types.Message):
         await message.answer(response, reply_markup=main_menu)
 
 async def main():
-    await dp.start_polling(bot)
+    await init_http_session()
+    try:
+        await dp.start_polling(bot)
+    finally:
+        await close_http_session()
+        await storage.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
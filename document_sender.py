@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+import os
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Union
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import BufferedInputFile, Message
+
+logger = logging.getLogger(__name__)
+
+# Сколько file_id загруженных документов помнить
+DOCUMENT_FILE_ID_CACHE_SIZE = int(os.getenv('DOCUMENT_FILE_ID_CACHE_SIZE', '5000'))
+
+
+class DocumentSender:
+    """Отправка документов из памяти без временных файлов. file_id, который вернул Telegram,
+    запоминается по хэшу имени и содержимого: одинаковый документ повторно не загружается."""
+
+    def __init__(self, max_entries: int = DOCUMENT_FILE_ID_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._file_ids: "OrderedDict[str, str]" = OrderedDict()
+        self.uploads = 0
+        self.reused = 0
+
+    @staticmethod
+    def _key(filename: str, data: bytes) -> str:
+        # Имя входит в ключ: у документа, отправленного по file_id, остаётся имя первой загрузки
+        return hashlib.sha256(filename.encode('utf-8') + b'\0' + data).hexdigest()
+
+    async def send(self, message: Message, content: Union[str, bytes], filename: str, caption: str = "") -> Message:
+        data = content.encode('utf-8') if isinstance(content, str) else content
+        key = self._key(filename, data)
+        file_id = self._file_ids.get(key)
+        if file_id is not None:
+            try:
+                sent = await message.answer_document(file_id, caption=caption)
+                self._file_ids.move_to_end(key)
+                self.reused += 1
+                return sent
+            except TelegramBadRequest as e:
+                # file_id устарел или недоступен этому боту — загружаем заново
+                logger.warning(f"Не удалось отправить документ по file_id, загружаем заново: {e}")
+                self._file_ids.pop(key, None)
+
+        sent = await message.answer_document(BufferedInputFile(data, filename=filename), caption=caption)
+        self.uploads += 1
+        if sent.document is not None:
+            self._file_ids[key] = sent.document.file_id
+            while len(self._file_ids) > self.max_entries:
+                self._file_ids.popitem(last=False)
+        return sent
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+logger = logging.getLogger(__name__)
+
+# Состояния анкеты переживают перезапуск; брошенные сессии удаляются после простоя
+FSM_STORAGE_PATH = os.getenv('FSM_STORAGE_PATH', 'fsm_state.db')
+FSM_IDLE_TTL = float(os.getenv('FSM_IDLE_TTL', str(3 * 24 * 3600)))
+# Горячий слой в памяти (последние активные ключи) и период чистки истёкших записей на диске
+FSM_HOT_MAX_KEYS = int(os.getenv('FSM_HOT_MAX_KEYS', '10000'))
+FSM_SWEEP_INTERVAL = float(os.getenv('FSM_SWEEP_INTERVAL', '600'))
+
+_EMPTY: Tuple[Optional[str], Dict[str, Any], float] = (None, {}, 0.0)
+
+
+def _storage_key(key: StorageKey) -> str:
+    return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.business_connection_id or ''}:{key.destiny}"
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM-хранилище aiogram на SQLite: компактный JSON, TTL простоя и ограниченный горячий слой в памяти."""
+
+    def __init__(self, path: str = FSM_STORAGE_PATH, idle_ttl: float = FSM_IDLE_TTL,
+                 hot_max_keys: int = FSM_HOT_MAX_KEYS, sweep_interval: float = FSM_SWEEP_INTERVAL):
+        self.path = path
+        self.idle_ttl = idle_ttl
+        self.hot_max_keys = hot_max_keys
+        self.sweep_interval = sweep_interval
+        # Ключ -> (состояние, данные, время последнего обращения); пустые записи тоже кэшируются,
+        # иначе каждое сообщение пользователя без анкеты читало бы диск
+        self._hot: "OrderedDict[str, Tuple[Optional[str], Dict[str, Any], float]]" = OrderedDict()
+        self._last_sweep = time.time()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS fsm (
+                key TEXT PRIMARY KEY,
+                state TEXT,
+                data TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        ''')
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_fsm_updated ON fsm (updated_at)")
+        self._conn.commit()
+
+    # Синхронная часть выполняется в потоке, чтобы диск не блокировал event loop
+    def _load_sync(self, key: str) -> Tuple[Optional[str], Dict[str, Any], float]:
+        with self._lock:
+            row = self._conn.execute("SELECT state, data, updated_at FROM fsm WHERE key = ?", (key,)).fetchone()
+        if row is None or time.time() - row[2] > self.idle_ttl:
+            return _EMPTY
+        return row[0], json.loads(row[1]), row[2]
+
+    def _save_sync(self, key: str, state: Optional[str], data: Dict[str, Any], now: float) -> None:
+        with self._lock:
+            # Записи одного ключа могут дойти до потока не по порядку — старая не перетирает новую
+            if state is None and not data:
+                self._conn.execute("DELETE FROM fsm WHERE key = ? AND updated_at <= ?", (key, now))
+            else:
+                self._conn.execute('''
+                    INSERT INTO fsm (key, state, data, updated_at) VALUES (?, ?, ?, ?)
+                    ON CONFLICT(key) DO UPDATE SET state = excluded.state, data = excluded.data,
+                        updated_at = excluded.updated_at
+                    WHERE excluded.updated_at >= fsm.updated_at
+                ''', (key, state, json.dumps(data, ensure_ascii=False, separators=(',', ':')), now))
+            if now - self._last_sweep > self.sweep_interval:
+                self._last_sweep = now
+                removed = self._conn.execute("DELETE FROM fsm WHERE updated_at < ?", (now - self.idle_ttl,)).rowcount
+                if removed:
+                    logger.info(f"FSM: удалено {removed} брошенных сессий.")
+            self._conn.commit()
+
+    def _remember(self, key: str, record: Tuple[Optional[str], Dict[str, Any], float]) -> None:
+        self._hot[key] = record
+        self._hot.move_to_end(key)
+        while len(self._hot) > self.hot_max_keys:
+            self._hot.popitem(last=False)
+
+    async def _record(self, key: str) -> Tuple[Optional[str], Dict[str, Any], float]:
+        record = self._hot.get(key)
+        if record is not None and (record[0] is None and not record[1] or time.time() - record[2] <= self.idle_ttl):
+            self._hot.move_to_end(key)
+            return record
+        record = await asyncio.to_thread(self._load_sync, key)
+        self._remember(key, record)
+        return record
+
+    async def _write(self, key: str, state: Optional[str], data: Dict[str, Any]) -> None:
+        now = time.time()
+        self._remember(key, (state, data, now))
+        await asyncio.to_thread(self._save_sync, key, state, data, now)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        name = _storage_key(key)
+        _, data, _ = await self._record(name)
+        await self._write(name, state.state if isinstance(state, State) else state, data)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._record(_storage_key(key)))[0]
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        name = _storage_key(key)
+        state, _, _ = await self._record(name)
+        await self._write(name, state, dict(data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._record(_storage_key(key)))[1].copy()
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM fsm").fetchone()[0]
+        return {"hot": len(self._hot), "stored": size}
+
+    async def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import uuid
+import base64
+import asyncio
+import logging
+from typing import Optional
+
+from tenacity import retry, stop_after_attempt, wait_exponential
+
+from http_client import get_http_session
+
+logger = logging.getLogger(__name__)
+
+GIGACHAT_OAUTH_URL = "https://ngw.devices.sberbank.ru:9443/api/v2/oauth"
+
+# За сколько секунд до истечения токена обновлять его в фоне
+GIGACHAT_TOKEN_REFRESH_MARGIN = float(os.getenv('GIGACHAT_TOKEN_REFRESH_MARGIN', '300'))
+# Пауза перед повтором фонового обновления после ошибки
+GIGACHAT_TOKEN_RETRY_DELAY = float(os.getenv('GIGACHAT_TOKEN_RETRY_DELAY', '30'))
+
+
+class GigaChatTokenManager:
+    """Токен GigaChat: один общий запрос на обновление и фоновое продление до истечения."""
+
+    def __init__(self, client_id: str, client_secret: str, scope: str,
+                 refresh_margin: float = GIGACHAT_TOKEN_REFRESH_MARGIN):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.scope = scope
+        self.refresh_margin = refresh_margin
+        self.access_token: Optional[str] = None
+        self.expires_at: float = 0
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._renewal_task: Optional[asyncio.Task] = None
+
+    def is_valid(self) -> bool:
+        return bool(self.access_token) and self.expires_at - 60 > time.time()
+
+    def invalidate(self) -> None:
+        self.access_token = None
+        self.expires_at = 0
+
+    # Возвращает действующий токен; все конкурентные вызовы ждут один и тот же запрос
+    async def get_token(self, force_refresh: bool = False) -> str:
+        if not force_refresh and self.is_valid():
+            return self.access_token
+        return await self.refresh()
+
+    async def refresh(self) -> str:
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._fetch_token())
+        # shield: отмена одного ожидающего не должна отменять общий запрос
+        return await asyncio.shield(self._refresh_task)
+
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10), reraise=True)
+    async def _fetch_token(self) -> str:
+        credentials = base64.b64encode(f"{self.client_id}:{self.client_secret}".encode()).decode()
+        headers = {
+            "Authorization": f"Basic {credentials}",
+            "RqUID": str(uuid.uuid4()),
+            "Content-Type": "application/x-www-form-urlencoded",
+            "Accept": "application/json"
+        }
+        data = f"scope={self.scope}"
+
+        session = await get_http_session()
+        async with session.post(GIGACHAT_OAUTH_URL, headers=headers, data=data) as response:
+            if response.status != 200:
+                logger.error(f"Ошибка получения токена GigaChat: {response.status} - {await response.text()}")
+                raise Exception(f"Failed to get access token: {response.status}")
+
+            result = await response.json()
+            self.access_token = result.get("access_token")
+            # GigaChat возвращает expires_at в миллисекундах, старые версии API — expires_in
+            if result.get("expires_at"):
+                self.expires_at = result["expires_at"] / 1000
+            else:
+                self.expires_at = time.time() + result.get("expires_in", 1800)
+            logger.info("Токен GigaChat обновлён.")
+            return self.access_token
+
+    # Предварительное получение токена и запуск фонового продления
+    async def start(self) -> None:
+        try:
+            await self.get_token()
+        except Exception as e:
+            logger.warning(f"Не удалось получить токен GigaChat при запуске: {e}")
+        if self._renewal_task is None or self._renewal_task.done():
+            self._renewal_task = asyncio.create_task(self._renewal_loop())
+
+    async def stop(self) -> None:
+        for task in (self._renewal_task, self._refresh_task):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
+        self._renewal_task = None
+        self._refresh_task = None
+
+    async def _renewal_loop(self) -> None:
+        while True:
+            if self.access_token:
+                delay = max(self.expires_at - self.refresh_margin - time.time(), GIGACHAT_TOKEN_RETRY_DELAY)
+            else:
+                delay = 0
+            await asyncio.sleep(delay)
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Фоновое обновление токена GigaChat не удалось: {e}")
+                await asyncio.sleep(GIGACHAT_TOKEN_RETRY_DELAY)
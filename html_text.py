@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+
+import re
+import logging
+from html.parser import HTMLParser
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Элементы без закрывающего тега: в стек открытых элементов не попадают
+_VOID_TAGS = frozenset(('area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'param',
+                        'source', 'track', 'wbr'))
+_HEADINGS = frozenset(('h1', 'h2', 'h3', 'h4', 'h5', 'h6'))
+_PREFORMATTED = frozenset(('pre', 'textarea'))
+_ASCII_SPACES = ' \n\t\f\r'
+# Пустые строки схлопываются до одной, пробелы и табуляции — до одного пробела (один проход вместо трёх)
+_SPACING_RE = re.compile(r'\n\s*\n|[ \t]+')
+
+
+def _spacing(match) -> str:
+    return '\n\n' if match.group(0)[0] == '\n' else ' '
+
+
+class _Row:
+    __slots__ = ('cells', 'open')
+
+    def __init__(self):
+        self.cells: List[List[str]] = []
+        # Индексы открытых ячеек: текст вложенной ячейки попадает и во внешнюю
+        self.open: List[int] = []
+
+
+class _TextBuilder(HTMLParser):
+    """Потоковый разбор HTML меню в текст: строки таблиц через « | », пункты <ul> с «• »,
+    пустые строки вокруг таблиц и заголовков, перенос вокруг абзацев. Дерево не строится."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        # Открытые элементы: (тег, действие при закрытии)
+        self._stack: List[Tuple[str, Optional[str]]] = []
+        self._skip = 0
+        self._preformatted = 0
+        # Открытые списки <ul>: True — список покупок (class="shopping-list")
+        self._lists: List[bool] = []
+        self.shopping: List[str] = []
+        # Для каждой открытой таблицы: ещё не было ни одной строки
+        self._tables: List[bool] = []
+        self._row: Optional[_Row] = None
+        self._item: Optional[List[str]] = None
+
+    # Текст внутри строки таблицы и пункта списка собирается как get_text(strip=True): без пробелов по краям
+    def _emit(self, text: str) -> None:
+        if self._row is not None:
+            return
+        if self._item is not None:
+            text = text.strip()
+            if text:
+                self._item.append(text)
+            return
+        self.parts.append(text)
+
+    def handle_starttag(self, tag: str, attrs) -> None:
+        if tag in _VOID_TAGS:
+            return
+        action = None
+        if tag in ('script', 'style'):
+            self._skip += 1
+            action = 'skip'
+        elif tag in _PREFORMATTED:
+            self._preformatted += 1
+            action = 'preformatted'
+        elif self._row is not None:
+            # Внутри строки таблицы важны только ячейки, остальная разметка уходит в их текст
+            if tag in ('td', 'th'):
+                self._row.open.append(len(self._row.cells))
+                self._row.cells.append([])
+                action = 'cell'
+        elif tag == 'table':
+            self._emit('\n\n')
+            self._tables.append(True)
+            action = 'table'
+        elif tag == 'tr' and self._tables:
+            if self._tables[-1]:
+                self._tables[-1] = False
+                self._emit('\n')
+            self._row = _Row()
+            action = 'row'
+        elif self._item is not None:
+            # Вложенные списки, заголовки и абзацы внутри пункта становятся его текстом
+            pass
+        elif tag == 'ul':
+            self._emit('\n')
+            self._lists.append('shopping-list' in (dict(attrs).get('class') or '').split())
+            action = 'list'
+        elif tag == 'li' and self._lists:
+            self._item = []
+            action = 'item'
+        elif tag in _HEADINGS:
+            self._emit('\n\n')
+            action = 'heading'
+        elif tag == 'p':
+            self._emit('\n')
+            action = 'paragraph'
+        self._stack.append((tag, action))
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag in _VOID_TAGS:
+            return
+        # Как в html.parser-сборщике BeautifulSoup: закрываем до последнего открытого тега с этим именем
+        for depth in range(len(self._stack) - 1, -1, -1):
+            if self._stack[depth][0] == tag:
+                while len(self._stack) > depth:
+                    self._close(*self._stack.pop())
+                return
+
+    def _close(self, tag: str, action: Optional[str]) -> None:
+        if action is None:
+            return
+        if action == 'skip':
+            self._skip -= 1
+        elif action == 'preformatted':
+            self._preformatted -= 1
+        elif action == 'cell':
+            self._row.open.pop()
+        elif action == 'row':
+            row, self._row = self._row, None
+            self._emit(' | '.join(''.join(cell) for cell in row.cells))
+            self._emit('\n')
+        elif action == 'table':
+            self._tables.pop()
+            self._emit('\n\n')
+        elif action == 'list':
+            self._lists.pop()
+            self._emit('\n')
+        elif action == 'item':
+            item, self._item = ''.join(self._item), None
+            if any(self._lists):
+                self.shopping.append(item)
+            self._emit('• ' + item)
+            self._emit('\n')
+        elif action == 'heading':
+            self._emit('\n\n')
+        elif action == 'paragraph':
+            self._emit('\n')
+
+    def handle_data(self, data: str) -> None:
+        if self._skip:
+            return
+        if self._row is not None:
+            text = data.strip()
+            if text:
+                for index in self._row.open:
+                    self._row.cells[index].append(text)
+            return
+        # Пробельный текст между тегами сводится к одному переносу или пробелу (как в BeautifulSoup)
+        if not self._preformatted and not data.strip(_ASCII_SPACES):
+            data = '\n' if '\n' in data else ' '
+        self._emit(data)
+
+    def text(self) -> str:
+        self.close()
+        while self._stack:
+            self._close(*self._stack.pop())
+        return _SPACING_RE.sub(_spacing, ''.join(self.parts)).strip()
+
+
+def parse_menu_html(html_content: str) -> Tuple[str, List[str]]:
+    """Один проход по HTML меню: текст для Telegram и пункты списка покупок (<ul class="shopping-list">)."""
+    try:
+        if isinstance(html_content, bytes):
+            html_content = html_content.decode('utf-8', errors='ignore')
+        builder = _TextBuilder()
+        builder.feed(html_content)
+        return builder.text(), builder.shopping
+    except Exception as e:
+        logger.error(f"Ошибка конвертации HTML в текст: {e}")
+        return html_content, []  # Возвращаем оригинал в случае ошибки
+
+
+def html_to_text(html_content: str) -> str:
+    """HTML меню в текст для сообщения Telegram за один проход парсера."""
+    return parse_menu_html(html_content)[0]
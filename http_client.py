@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+import os
+import ssl
+import logging
+from typing import Optional
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# Настройки HTTP-клиента (можно переопределить через .env)
+HTTP_TOTAL_TIMEOUT = float(os.getenv('HTTP_TOTAL_TIMEOUT', '90'))
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '10'))
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', '60'))
+HTTP_LIMIT = int(os.getenv('HTTP_LIMIT', '100'))
+HTTP_LIMIT_PER_HOST = int(os.getenv('HTTP_LIMIT_PER_HOST', '20'))
+HTTP_DNS_TTL = int(os.getenv('HTTP_DNS_TTL', '300'))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv('HTTP_KEEPALIVE_TIMEOUT', '60'))
+
+# SSL-контекст для GigaChat (сертификаты Минцифры не входят в стандартный набор)
+ssl_context = ssl.create_default_context()
+ssl_context.check_hostname = False
+ssl_context.verify_mode = ssl.CERT_NONE
+
+_session: Optional[aiohttp.ClientSession] = None
+
+
+# Создание общего пула соединений для всех запросов к LLM и OAuth
+async def init_http_session() -> aiohttp.ClientSession:
+    global _session
+
+    if _session is not None and not _session.closed:
+        return _session
+
+    connector = aiohttp.TCPConnector(
+        ssl=ssl_context,
+        limit=HTTP_LIMIT,
+        limit_per_host=HTTP_LIMIT_PER_HOST,
+        ttl_dns_cache=HTTP_DNS_TTL,
+        use_dns_cache=True,
+        keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        enable_cleanup_closed=True
+    )
+    timeout = aiohttp.ClientTimeout(
+        total=HTTP_TOTAL_TIMEOUT,
+        sock_connect=HTTP_CONNECT_TIMEOUT,
+        sock_read=HTTP_READ_TIMEOUT
+    )
+    _session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+    logger.info("HTTP-сессия создана.")
+    return _session
+
+
+# Получение общей сессии (создаётся лениво, если main() ещё не успел)
+async def get_http_session() -> aiohttp.ClientSession:
+    if _session is None or _session.closed:
+        return await init_http_session()
+    return _session
+
+
+# Закрытие пула соединений при остановке бота
+async def close_http_session() -> None:
+    global _session
+
+    if _session is not None and not _session.closed:
+        await _session.close()
+        logger.info("HTTP-сессия закрыта.")
+    _session = None
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import List, Optional, Tuple
+
+from http_client import get_http_session
+from gigachat_auth import GigaChatTokenManager
+
+logger = logging.getLogger(__name__)
+
+# Хеджирование: второй провайдер запускается, если первый не ответил за p95 его задержки
+LLM_HEDGE_PERCENTILE = float(os.getenv('LLM_HEDGE_PERCENTILE', '95'))
+LLM_HEDGE_MIN_DELAY = float(os.getenv('LLM_HEDGE_MIN_DELAY', '3'))
+LLM_HEDGE_DEFAULT_DELAY = float(os.getenv('LLM_HEDGE_DEFAULT_DELAY', '20'))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv('LLM_HEDGE_MIN_SAMPLES', '20'))
+LLM_LATENCY_WINDOW = int(os.getenv('LLM_LATENCY_WINDOW', '200'))
+
+
+class LLMError(Exception):
+    """Провайдер не смог вернуть ответ."""
+
+
+class LatencyTracker:
+    """Скользящее окно задержек успешных запросов. Запрос, отменённый после проигрыша хеджу,
+    попадает в окно временем до отмены: ответ пришёл бы не раньше, и p95 не занижается."""
+
+    def __init__(self, window: int = LLM_LATENCY_WINDOW):
+        self._samples = deque(maxlen=window)
+        self.errors = 0
+        self.censored = 0
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(int(round(p / 100 * (len(ordered) - 1))), len(ordered) - 1)
+        return ordered[index]
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+
+class LLMProvider(ABC):
+    """Базовый провайдер chat/completions."""
+
+    name = "llm"
+
+    def __init__(self):
+        self.latency = LatencyTracker()
+
+    async def complete(self, prompt: str) -> str:
+        text, _ = await self.complete_with_usage(prompt)
+        return text
+
+    async def complete_with_usage(self, prompt: str) -> Tuple[str, Optional[int]]:
+        """(текст, израсходовано токенов или None, если провайдер не сообщил)."""
+        started = time.monotonic()
+        try:
+            result = await self._complete(prompt)
+        except asyncio.CancelledError:
+            # Отменённый запрос (проиграл хеджу) был бы не быстрее, чем прошло до отмены
+            self.latency.record(time.monotonic() - started)
+            self.latency.censored += 1
+            raise
+        except Exception:
+            self.latency.errors += 1
+            raise
+        self.latency.record(time.monotonic() - started)
+        return result
+
+    @abstractmethod
+    async def _complete(self, prompt: str) -> Tuple[str, Optional[int]]:
+        """Один запрос к API: (текст, израсходовано токенов или None)."""
+
+    @staticmethod
+    def _answer(result: dict) -> Tuple[str, Optional[int]]:
+        return result["choices"][0]["message"]["content"], (result.get("usage") or {}).get("total_tokens")
+
+    @staticmethod
+    async def _post_chat(url: str, headers: dict, payload: dict) -> Tuple[int, dict, str]:
+        session = await get_http_session()
+        async with session.post(url, headers=headers, json=payload) as response:
+            if response.status == 200:
+                return response.status, await response.json(), ""
+            return response.status, {}, await response.text()
+
+
+class GigaChatProvider(LLMProvider):
+    name = "gigachat"
+    url = "https://gigachat.devices.sberbank.ru/api/v1/chat/completions"
+
+    def __init__(self, token_manager: GigaChatTokenManager, model: str = "GigaChat", temperature: float = 0.7):
+        super().__init__()
+        self.token_manager = token_manager
+        self.model = model
+        self.temperature = temperature
+
+    async def _complete(self, prompt: str) -> Tuple[str, Optional[int]]:
+        payload = {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": self.temperature
+        }
+        # Второй проход — только если токен отозвали раньше срока (401)
+        for attempt in range(2):
+            token = await self.token_manager.get_token()
+            headers = {
+                "Authorization": f"Bearer {token}",
+                "Content-Type": "application/json"
+            }
+            status, result, error_text = await self._post_chat(self.url, headers, payload)
+            if status == 200:
+                return self._answer(result)
+            if status == 401 and attempt == 0:
+                logger.warning("Токен GigaChat отклонён, получаем новый.")
+                self.token_manager.invalidate()
+                continue
+            raise LLMError(f"GigaChat: {status} - {error_text}")
+        raise LLMError("GigaChat: токен отклонён")
+
+
+class DeepSeekProvider(LLMProvider):
+    name = "deepseek"
+    url = "https://api.deepseek.com/v1/chat/completions"
+
+    def __init__(self, api_key: str, model: str = "deepseek-chat", temperature: float = 0.7,
+                 max_tokens: Optional[int] = None):
+        super().__init__()
+        self.api_key = api_key
+        self.model = model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+
+    async def _complete(self, prompt: str) -> Tuple[str, Optional[int]]:
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        payload = {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": self.temperature,
+            "stream": False
+        }
+        if self.max_tokens:
+            payload["max_tokens"] = self.max_tokens
+        status, result, error_text = await self._post_chat(self.url, headers, payload)
+        if status != 200:
+            raise LLMError(f"DeepSeek: {status} - {error_text}")
+        return self._answer(result)
+
+
+class HedgedLLM:
+    """Запрос к основному провайдеру с хеджированием: если он не ответил за p95 своей задержки,
+    тот же промпт уходит следующему; побеждает первый успешный ответ, остальные отменяются."""
+
+    def __init__(self, providers: List[LLMProvider], percentile: float = LLM_HEDGE_PERCENTILE,
+                 min_delay: float = LLM_HEDGE_MIN_DELAY, default_delay: float = LLM_HEDGE_DEFAULT_DELAY,
+                 min_samples: int = LLM_HEDGE_MIN_SAMPLES):
+        if not providers:
+            raise ValueError("Нужен хотя бы один LLM-провайдер")
+        self.providers = providers
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.default_delay = default_delay
+        self.min_samples = min_samples
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def hedge_delay(self, provider: LLMProvider) -> float:
+        if len(provider.latency) < self.min_samples:
+            return self.default_delay
+        return max(provider.latency.percentile(self.percentile), self.min_delay)
+
+    async def complete(self, prompt: str) -> Tuple[str, str, Optional[int]]:
+        """Возвращает (текст, имя провайдера, израсходовано токенов или None)."""
+        pending = {}
+        errors = []
+        queue = list(self.providers)
+
+        def launch() -> LLMProvider:
+            provider = queue.pop(0)
+            pending[asyncio.create_task(provider.complete_with_usage(prompt))] = provider
+            return provider
+
+        current = launch()
+        try:
+            while pending:
+                timeout = self.hedge_delay(current) if queue else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Основной провайдер медлит — хеджируем следующим
+                    current = launch()
+                    self.hedged += 1
+                    logger.info(f"LLM: хеджирующий запрос к {current.name}.")
+                    continue
+                for task in done:
+                    provider = pending.pop(task)
+                    if task.exception() is None:
+                        if provider is not self.providers[0]:
+                            self.hedge_wins += 1
+                        text, tokens = task.result()
+                        return text, provider.name, tokens
+                    errors.append(f"{provider.name}: {task.exception()}")
+                    logger.warning(f"LLM {provider.name} вернул ошибку: {task.exception()}")
+                # Текущий провайдер упал — не ждём задержку хеджирования, сразу пробуем следующего
+                if queue and current not in pending.values():
+                    current = launch()
+        finally:
+            for task in pending:
+                task.cancel()
+        raise LLMError("; ".join(errors) or "нет доступных провайдеров")
+
+    def stats(self) -> dict:
+        return {
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "providers": {
+                p.name: {
+                    "samples": len(p.latency),
+                    "errors": p.latency.errors,
+                    "censored": p.latency.censored,
+                    "p50": p.latency.percentile(50),
+                    "p95": p.latency.percentile(95)
+                }
+                for p in self.providers
+            }
+        }
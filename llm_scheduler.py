@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+
+import os
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Одновременных запросов к LLM (по квоте провайдера), размер очереди и лимит задач на пользователя
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '4'))
+LLM_MAX_QUEUE = int(os.getenv('LLM_MAX_QUEUE', '100'))
+LLM_MAX_JOBS_PER_USER = int(os.getenv('LLM_MAX_JOBS_PER_USER', '1'))
+
+
+class QueueFullError(Exception):
+    """Общая очередь переполнена — запрос отклонён (load shedding)."""
+
+
+class UserBusyError(Exception):
+    """У пользователя уже есть задачи в очереди."""
+
+
+class _Job:
+    __slots__ = ("user_id", "factory", "future")
+
+    def __init__(self, user_id: int, factory: Callable[[], Awaitable[Any]]):
+        self.user_id = user_id
+        self.factory = factory
+        self.future = asyncio.get_running_loop().create_future()
+
+    async def result(self) -> Any:
+        return await self.future
+
+
+class LLMScheduler:
+    """Очередь задач к LLM: общий лимит параллельности, справедливый round-robin по пользователям,
+    приоритет для новых пользователей и отказ при переполнении."""
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, max_queue: int = LLM_MAX_QUEUE,
+                 max_jobs_per_user: int = LLM_MAX_JOBS_PER_USER):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_jobs_per_user = max_jobs_per_user
+        # Очереди пользователей в порядке обхода; приоритетные обслуживаются первыми
+        self._priority: "OrderedDict[int, Deque[_Job]]" = OrderedDict()
+        self._normal: "OrderedDict[int, Deque[_Job]]" = OrderedDict()
+        self._user_jobs: Dict[int, int] = {}
+        self._queued = 0
+        self._running = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._workers = []
+        self.shed = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+
+    async def start(self) -> None:
+        self._wakeup = asyncio.Event()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.max_concurrency)]
+
+    async def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        for ring in (self._priority, self._normal):
+            for jobs in ring.values():
+                for job in jobs:
+                    if not job.future.done():
+                        job.future.cancel()
+            ring.clear()
+        self._queued = 0
+        self._user_jobs.clear()
+
+    def busy(self, user_id: int) -> bool:
+        """У пользователя исчерпан лимит задач: новая заявка получит UserBusyError."""
+        return self._user_jobs.get(user_id, 0) >= self.max_jobs_per_user
+
+    def submit(self, user_id: int, factory: Callable[[], Awaitable[Any]], priority: bool = False) -> _Job:
+        return self.submit_many(user_id, [factory], priority)[0]
+
+    def submit_many(self, user_id: int, factories: List[Callable[[], Awaitable[Any]]],
+                    priority: bool = False) -> List[_Job]:
+        """Группа задач одного запроса (например, меню на неделю): принимается целиком или отклоняется.
+        Лимит на пользователя проверяется один раз, а задачи группы идут в общем круге по одной,
+        так что общий лимит параллельности и очередность других пользователей сохраняются."""
+        if self.busy(user_id):
+            raise UserBusyError(user_id)
+        if self._queued + len(factories) > self.max_queue:
+            self.shed += 1
+            raise QueueFullError()
+
+        jobs = [_Job(user_id, factory) for factory in factories]
+        ring = self._priority if priority else self._normal
+        ring.setdefault(user_id, deque()).extend(jobs)
+        self._user_jobs[user_id] = self._user_jobs.get(user_id, 0) + len(jobs)
+        self._queued += len(jobs)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return jobs
+
+    def position(self, job: _Job) -> int:
+        """Примерное число задач впереди (0 — выполняется или вот-вот начнётся)."""
+        if job.future.done():
+            return 0
+        ahead = 0
+        for ring in (self._priority, self._normal):
+            for jobs in ring.values():
+                for queued in jobs:
+                    if queued is job:
+                        return max(ahead - (self.max_concurrency - self._running) + 1, 0)
+                    ahead += 1
+        return 0
+
+    async def run(self, user_id: int, factory: Callable[[], Awaitable[Any]], priority: bool = False,
+                  on_queued: Optional[Callable[[int], Awaitable[Any]]] = None) -> Any:
+        job = self.submit(user_id, factory, priority)
+        # Даём воркерам шанс забрать задачу, прежде чем сообщать позицию
+        await asyncio.sleep(0)
+        position = self.position(job)
+        if position > 0 and on_queued is not None:
+            await on_queued(position)
+        return await job.future
+
+    def _next_job(self) -> Optional[_Job]:
+        for ring in (self._priority, self._normal):
+            if ring:
+                user_id, jobs = next(iter(ring.items()))
+                job = jobs.popleft()
+                # Пользователь уходит в конец круга — остальные не ждут, пока он исчерпает свои задачи
+                del ring[user_id]
+                if jobs:
+                    ring[user_id] = jobs
+                self._queued -= 1
+                return job
+        return None
+
+    async def _worker(self) -> None:
+        while True:
+            job = self._next_job()
+            if job is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            if job.future.cancelled():
+                self.cancelled += 1
+                self._release(job)
+                continue
+
+            self._running += 1
+            try:
+                result = await job.factory()
+            except asyncio.CancelledError:
+                self.cancelled += 1
+                if not job.future.done():
+                    job.future.cancel()
+                raise
+            except Exception as e:
+                self.failed += 1
+                if not job.future.done():
+                    job.future.set_exception(e)
+            else:
+                self.completed += 1
+                if not job.future.done():
+                    job.future.set_result(result)
+            finally:
+                self._running -= 1
+                self._release(job)
+
+    def _release(self, job: _Job) -> None:
+        left = self._user_jobs.get(job.user_id, 1) - 1
+        if left > 0:
+            self._user_jobs[job.user_id] = left
+        else:
+            self._user_jobs.pop(job.user_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "running": self._running,
+            "queued": self._queued,
+            "shed": self.shed,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled
+        }
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import asyncio
+import logging
+from typing import AsyncIterator
+
+import aiohttp
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import Message
+
+logger = logging.getLogger(__name__)
+
+# Минимальный интервал между правками одного сообщения (лимиты Telegram на edit)
+STREAM_EDIT_INTERVAL = float(os.getenv('STREAM_EDIT_INTERVAL', '1.5'))
+# Не правим сообщение ради пары новых символов
+STREAM_MIN_DELTA = int(os.getenv('STREAM_MIN_DELTA', '40'))
+TELEGRAM_MESSAGE_LIMIT = 4000
+
+
+async def iter_sse_content(response: aiohttp.ClientResponse) -> AsyncIterator[str]:
+    """Фрагменты текста из SSE-потока chat/completions (строки "data: {...}", конец — "data: [DONE]")."""
+    buffer = b""
+    async for chunk in response.content.iter_any():
+        buffer += chunk
+        while b"\n" in buffer:
+            line, buffer = buffer.split(b"\n", 1)
+            line = line.strip()
+            if not line.startswith(b"data:"):
+                continue
+            data = line[5:].strip()
+            if data == b"[DONE]":
+                return
+            try:
+                event = json.loads(data)
+            except ValueError:
+                logger.warning(f"Некорректное событие SSE: {data[:200]!r}")
+                continue
+            for choice in event.get("choices", []):
+                content = choice.get("delta", {}).get("content")
+                if content:
+                    yield content
+
+
+class ThrottledMessageEditor:
+    """Постепенно дописывает текст в сообщение Telegram, не чаще одного раза в interval секунд."""
+
+    def __init__(self, message: Message, prefix: str = "", interval: float = STREAM_EDIT_INTERVAL,
+                 min_delta: int = STREAM_MIN_DELTA):
+        self.message = message
+        self.prefix = prefix
+        self.interval = interval
+        self.min_delta = min_delta
+        self._shown = ""
+        self._shown_body = ""
+        self._next_edit_at = 0.0
+
+    async def update(self, text: str) -> None:
+        if time.monotonic() < self._next_edit_at or len(text) - len(self._shown) < self.min_delta:
+            return
+        await self._edit(text)
+
+    async def finish(self, text: str) -> None:
+        # Последняя правка обязательна: ждём окончания паузы и повторяем при RetryAfter
+        for _ in range(3):
+            delay = self._next_edit_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if await self._edit(text):
+                return
+
+    async def _edit(self, text: str) -> bool:
+        body = (self.prefix + text)[:TELEGRAM_MESSAGE_LIMIT]
+        if body == self._shown_body:
+            return True
+        try:
+            await self.message.edit_text(body)
+            self._shown = text
+            self._shown_body = body
+        except TelegramRetryAfter as e:
+            logger.warning(f"Telegram ограничил правки сообщения на {e.retry_after} с.")
+            self._next_edit_at = time.monotonic() + e.retry_after
+            return False
+        except TelegramBadRequest as e:
+            # "message is not modified" и подобные ошибки не критичны для стриминга
+            logger.debug(f"Не удалось отредактировать сообщение: {e}")
+        self._next_edit_at = time.monotonic() + self.interval
+        return True
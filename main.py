@@ -1,13 +1,12 @@
 # -*- coding: utf-8 -*-
 
 import os
+import zlib
 import asyncio
 import logging
-import aiohttp
-import ssl
-import base64
+from datetime import datetime
+from typing import Dict
 from aiogram import Bot, Dispatcher, types, F
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
@@ -15,32 +14,39 @@ from aiogram import Router
 from aiogram.filters import Command
 from dotenv import load_dotenv
 
+from fsm_storage import SQLiteStorage
+from http_client import init_http_session, get_http_session, close_http_session
+from gigachat_auth import GigaChatTokenManager
+from user_profile import Profile, ProfileStore, Gender, Activity, Goal, parse_gender, parse_activity, parse_goal
+from nutrition import targets
+from menu_optimizer import MenuOptimizer, load_foods
+from menu_schema import render_menu_text
+from llm_streaming import iter_sse_content, ThrottledMessageEditor, TELEGRAM_MESSAGE_LIMIT
+
 load_dotenv()
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 GIGACHAT_CLIENT_ID = os.getenv('GIGACHAT_CLIENT_ID')
 GIGACHAT_CLIENT_SECRET = os.getenv('GIGACHAT_CLIENT_SECRET')
 GIGACHAT_SCOPE = os.getenv('GIGACHAT_SCOPE', 'GIGACHAT_API_PERS')
+# Потоковая генерация: меню появляется в сообщении по мере ответа модели
+GIGACHAT_STREAMING = os.getenv('GIGACHAT_STREAMING', '1') == '1'
 
-# Кэш для токена
-gigachat_token_cache = {
-    "access_token": None,
-    "expires_at": 0
-}
+# Менеджер токена GigaChat (одно обновление на всех, продление в фоне)
+token_manager = GigaChatTokenManager(GIGACHAT_CLIENT_ID, GIGACHAT_CLIENT_SECRET, GIGACHAT_SCOPE)
 
 logging.basicConfig(level=logging.INFO)
 bot = Bot(token=BOT_TOKEN)
-storage = MemoryStorage()
+# Состояния анкеты хранятся в SQLite и переживают перезапуск
+storage = SQLiteStorage()
 dp = Dispatcher(storage=storage)
 router = Router()
 dp.include_router(router)
 
-# Создаем кастомный SSL контекст для разработки
-ssl_context = ssl.create_default_context()
-ssl_context.check_hostname = False
-ssl_context.verify_mode = ssl.CERT_NONE
+# Хранилище профилей пользователей в памяти (компактные массивы вместо словаря словарей)
+user_profiles = ProfileStore()
 
-# Временное хранилище данных пользователей
-user_data_storage = {}
+# Локальное меню, если GigaChat недоступен: блюда из таблицы продуктов, порции под КБЖУ
+menu_optimizer = MenuOptimizer(load_foods())
 
 # Состояния для сбора данных
 class UserData(StatesGroup):
@@ -63,54 +69,12 @@ main_menu = ReplyKeyboardMarkup(
 
 async def get_gigachat_access_token() -> str:
     """Получаем access token для GigaChat API"""
-    global gigachat_token_cache
-    
-    # Проверяем, есть ли валидный токен в кэше
-    if gigachat_token_cache["access_token"] and gigachat_token_cache["expires_at"] > asyncio.get_event_loop().time():
-        return gigachat_token_cache["access_token"]
-    
     if not GIGACHAT_CLIENT_ID or not GIGACHAT_CLIENT_SECRET:
         logging.error("GigaChat credentials not configured")
         return None
     
-    # Кодируем client_id:client_secret в base64
-    credentials = base64.b64encode(
-        f"{GIGACHAT_CLIENT_ID}:{GIGACHAT_CLIENT_SECRET}".encode()
-    ).decode()
-    
-    url = "https://ngw.devices.sberbank.ru:9443/api/v2/oauth"
-    
-    headers = {
-        "Authorization": f"Basic {credentials}",
-        "Content-Type": "application/x-www-form-urlencoded",
-        "Accept": "application/json"
-    }
-    
-    data = {
-        "scope": GIGACHAT_SCOPE
-    }
-    
     try:
-        connector = aiohttp.TCPConnector(ssl=ssl_context)
-        
-        async with aiohttp.ClientSession(connector=connector) as session:
-            async with session.post(url, headers=headers, data=data, timeout=30) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    access_token = result.get('access_token')
-                    expires_in = result.get('expires_in', 1800)  # 30 минут по умолчанию
-                    
-                    # Сохраняем токен в кэш
-                    gigachat_token_cache["access_token"] = access_token
-                    gigachat_token_cache["expires_at"] = asyncio.get_event_loop().time() + expires_in - 60  # минус 60 секунд для запаса
-                    
-                    logging.info("GigaChat token obtained successfully")
-                    return access_token
-                else:
-                    error_text = await response.text()
-                    logging.error(f"GigaChat auth error: {response.status} - {error_text}")
-                    return None
-                    
+        return await token_manager.get_token()
     except Exception as e:
         logging.error(f"GigaChat auth error: {e}")
         return None
@@ -140,23 +104,21 @@ async def generate_with_gigachat(prompt: str) -> str:
     }
     
     try:
-        connector = aiohttp.TCPConnector(ssl=ssl_context)
-        
-        async with aiohttp.ClientSession(connector=connector) as session:
-            async with session.post(url, headers=headers, json=data, timeout=60) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    return result['choices'][0]['message']['content']
-                else:
-                    error_text = await response.text()
-                    logging.error(f"GigaChat API error: {response.status} - {error_text}")
+        session = await get_http_session()
+        async with session.post(url, headers=headers, json=data) as response:
+            if response.status == 200:
+                result = await response.json()
+                return result['choices'][0]['message']['content']
+            else:
+                error_text = await response.text()
+                logging.error(f"GigaChat API error: {response.status} - {error_text}")
                     
-                    # Если токен просрочен, очищаем кэш и пробуем снова
-                    if response.status == 401:
-                        gigachat_token_cache["access_token"] = None
-                        return await generate_with_gigachat(prompt)
+                # Если токен просрочен, очищаем кэш и пробуем снова
+                if response.status == 401:
+                    token_manager.invalidate()
+                    return await generate_with_gigachat(prompt)
                     
-                    return f"Ошибка API: {response.status}"
+                return f"Ошибка API: {response.status}"
                     
     except asyncio.TimeoutError:
         logging.error("GigaChat API timeout")
@@ -165,6 +127,56 @@ async def generate_with_gigachat(prompt: str) -> str:
         logging.error(f"GigaChat error: {e}")
         return f"Ошибка: {str(e)}"
 
+async def generate_with_gigachat_stream(prompt: str, on_text) -> str:
+    """Потоковый запрос к GigaChat API (при ошибке — обычный запрос)"""
+    # on_text получает весь накопленный текст после каждого фрагмента
+    access_token = await get_gigachat_access_token()
+    
+    if not access_token:
+        return "Ошибка: Не удалось получить доступ к GigaChat API"
+    
+    url = "https://gigachat.devices.sberbank.ru/api/v1/chat/completions"
+    
+    headers = {
+        "Authorization": f"Bearer {access_token}",
+        "Content-Type": "application/json",
+        "Accept": "text/event-stream"
+    }
+    
+    data = {
+        "model": "GigaChat",
+        "messages": [{"role": "user", "content": prompt}],
+        "max_tokens": 2000,
+        "temperature": 0.7,
+        "stream": True
+    }
+    
+    text = ""
+    try:
+        session = await get_http_session()
+        async with session.post(url, headers=headers, json=data) as response:
+            if response.status != 200:
+                error_text = await response.text()
+                logging.error(f"GigaChat stream error: {response.status} - {error_text}")
+                if response.status == 401:
+                    token_manager.invalidate()
+                return await generate_with_gigachat(prompt)
+            
+            async for chunk in iter_sse_content(response):
+                text += chunk
+                await on_text(text)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logging.error(f"GigaChat stream error: {e}, переходим на обычный запрос")
+        return await generate_with_gigachat(prompt)
+    
+    if not text:
+        logging.warning("GigaChat stream returned no content, переходим на обычный запрос")
+        return await generate_with_gigachat(prompt)
+    
+    return text
+
 @router.message(Command("start"))
 async def start(message: types.Message):
     await message.answer("Привет! Я твой нутрициолог-ассистент. Выбери опцию:", reply_markup=main_menu)
@@ -176,12 +188,13 @@ async def fill_data(message: types.Message, state: FSMContext):
 
 @router.message(UserData.gender)
 async def process_gender(message: types.Message, state: FSMContext):
-    gender = message.text.lower()
-    if gender not in ["мужчина", "женщина"]:
+    gender = parse_gender(message.text)
+    if gender is None:
         await message.answer("Пожалуйста, укажите 'мужчина' или 'женщина'.")
         return
     
-    await state.update_data(gender=gender)
+    # В состоянии анкеты храним коды, а не строки
+    await state.update_data(gender=int(gender))
     await message.answer("Укажите Ваш возраст:")
     await state.set_state(UserData.age)
 
@@ -232,69 +245,47 @@ async def process_height(message: types.Message, state: FSMContext):
 
 @router.message(UserData.activity)
 async def process_activity(message: types.Message, state: FSMContext):
-    activity = message.text.lower()
-    if activity not in ["низкий", "средний", "высокий"]:
+    activity = parse_activity(message.text)
+    if activity is None:
         await message.answer("Пожалуйста, выберите из предложенных вариантов: низкий/средний/высокий.")
         return
     
-    await state.update_data(activity=activity)
+    await state.update_data(activity=int(activity))
     await message.answer("Выберите цель (поддерживать форму/похудеть/набрать массу):")
     await state.set_state(UserData.goal)
 
 @router.message(UserData.goal)
 async def process_goal(message: types.Message, state: FSMContext):
-    goal = message.text.lower()
-    if goal not in ["поддерживать форму", "похудеть", "набрать массу"]:
+    goal = parse_goal(message.text)
+    if goal is None:
         await message.answer("Пожалуйста, выберите из предложенных вариантов: поддерживать форму/похудеть/набрать массу.")
         return
     
     # Сохраняем данные во временное хранилище
     user_id = message.from_user.id
     data = await state.get_data()
-    data["goal"] = goal
-    user_data_storage[user_id] = data
+    data["goal"] = int(goal)
+    user_profiles.put(user_id, Profile.from_dict(data))
     
     await message.answer("Данные сохранены! Вернитесь в меню.", reply_markup=main_menu)
     await state.clear()
 
+# Нормы КБЖУ для профиля (общий расчёт из nutrition)
+def profile_targets(profile: Profile) -> Dict[str, float]:
+    return targets(profile.gender, profile.age, profile.weight, profile.height, profile.activity, profile.goal)
+
 @router.message(F.text == "2. Расчет калорийности")
 async def calculate_calories(message: types.Message):
     user_id = message.from_user.id
-    data = user_data_storage.get(user_id)
+    profile = user_profiles.get(user_id)
     
-    if not data:
+    if not profile:
         await message.answer("Сначала заполните данные в опции 1. Или используйте /calculate с примером.")
         return
     
-    gender = data.get("gender", "мужчина")
-    age = data.get("age", 30)
-    weight = data.get("weight", 70)
-    height = data.get("height", 175)
-    activity = data.get("activity", "средний")
-    goal = data.get("goal", "поддерживать форму")
-    
-    # Расчет BMR (Mifflin-St Jeor Equation)
-    if gender == "мужчина":
-        bmr = 10 * weight + 6.25 * height - 5 * age + 5
-    else:
-        bmr = 10 * weight + 6.25 * height - 5 * age - 161
-    
-    # Коэффициент активности
-    activity_coeffs = {"низкий": 1.2, "средний": 1.55, "высокий": 1.725}
-    tdee = bmr * activity_coeffs.get(activity, 1.2)
-    
-    # Коррекция по цели
-    if goal == "похудеть":
-        daily_calories = tdee - 500
-    elif goal == "набрать массу":
-        daily_calories = tdee + 500
-    else:
-        daily_calories = tdee
-    
-    # Расчет БЖУ
-    protein = weight * 2  # 2г белка на кг веса
-    fat = (daily_calories * 0.25) / 9  # 25% от калорий, 9 ккал/г
-    carbs = (daily_calories - (protein * 4 + fat * 9)) / 4  # остальное углеводы
+    norms = profile_targets(profile)
+    daily_calories = norms['daily_calories']
+    protein, fat, carbs = norms['protein'], norms['fat'], norms['carbs']
     
     response = (
         f"🍽️ Ваша суточная норма:\n\n"
@@ -310,187 +301,40 @@ async def calculate_calories(message: types.Message):
 @router.message(Command("calculate"))
 async def calc_calories(message: types.Message):
     # Пример расчета без данных (для тестирования)
-    gender = "мужчина"
-    age = 30
-    weight = 70
-    height = 175
-    activity = "средний"
-    goal = "поддерживать форму"
-    
-    if gender == "мужчина":
-        bmr = 10 * weight + 6.25 * height - 5 * age + 5
-    else:
-        bmr = 10 * weight + 6.25 * height - 5 * age - 161
-    
-    activity_coeffs = {"низкий": 1.2, "средний": 1.55, "высокий": 1.725}
-    tdee = bmr * activity_coeffs.get(activity, 1.2)
-    
-    if goal == "похудеть":
-        daily_calories = tdee - 500
-    elif goal == "набрать массу":
-        daily_calories = tdee + 500
-    else:
-        daily_calories = tdee
+    profile = Profile(Gender.MALE, 30, 70, 175, Activity.MEDIUM, Goal.MAINTAIN)
+    daily_calories = profile_targets(profile)['daily_calories']
     
     await message.answer(f"Примерная суточная норма: {int(daily_calories)} ккал.")
 
-async def generate_local_menu(user_data: dict) -> str:
-    """Локальная генерация меню на основе данных пользователя"""
-    gender = user_data.get("gender", "мужчина")
-    age = user_data.get("age", 30)
-    weight = user_data.get("weight", 70)
-    height = user_data.get("height", 175)
-    activity = user_data.get("activity", "средний")
-    goal = user_data.get("goal", "поддерживать форму")
-    
-    # Расчет калорий
-    if gender == "мужчина":
-        bmr = 10 * weight + 6.25 * height - 5 * age + 5
-    else:
-        bmr = 10 * weight + 6.25 * height - 5 * age - 161
-    
-    activity_coeffs = {"низкий": 1.2, "средний": 1.55, "высокий": 1.725}
-    tdee = bmr * activity_coeffs.get(activity, 1.2)
-    
-    if goal == "похудеть":
-        daily_calories = tdee - 500
-    elif goal == "набрать массу":
-        daily_calories = tdee + 500
-    else:
-        daily_calories = tdee
-    
-    # Генерация меню на основе цели
-    if goal == "похудеть":
-        menu = f"""
-🥗 ПЕРСОНАЛИЗИРОВАННОЕ МЕНЮ ДЛЯ ПОХУДЕНИЯ
-👤 {gender}, {age} лет, {weight}кг, {height}см
-🔥 Активность: {activity}
-🎯 Цель: {goal}
-
-📊 СУТОЧНАЯ НОРМА: {int(daily_calories)} ккал
-
-🍳 ЗАВТРАК (300-350 ккал):
-• Овсяная каша на воде 50г + ягоды 100г + мед 1 ч.л.
-• Или: Омлет из 2 яиц + овощной салат
-• Белки: 15-20г, Углеводы: 40-50г
-
-🍲 ОБЕД (400-450 ккал):
-• Куриная грудка 150г + гречка 100г + свежие овощи
-• Или: Рыба на пару 150г + бурый рис 80г + тушеные овощи
-• Белки: 30-35г, Углеводы: 45-55г
-
-🥗 УЖИН (300-350 ккал):
-• Творог 5% 150г + овощной салат
-• Или: Запеченная индейка 120г + овощи на гриле
-• Белки: 25-30г, Углеводы: 15-20г
-
-🍎 ПЕРЕКУСЫ (150-200 ккал каждый):
-• Яблоко + греческий йогурт 100г
-• Горсть орехов (20г)
-• Овощные палочки с хумусом
-
-💧 Пейте 2-2.5 литра воды в день!
-"""
-    
-    elif goal == "набрать массу":
-        menu = f"""
-💪 ПЕРСОНАЛИЗИРОВАННОЕ МЕНЮ ДЛЯ НАБОРА МАССЫ
-👤 {gender}, {age} лет, {weight}кг, {height}см
-🔥 Активность: {activity}
-🎯 Цель: {goal}
-
-📊 СУТОЧНАЯ НОРМА: {int(daily_calories)} ккал
-
-🍳 ЗАВТРАК (600-700 ккал):
-• Овсянка на молоке 80г + банан + орехи 30г + мед
-• Или: Яичница из 3 яиц + сыр 50г + цельнозерновой хлеб
-• Белки: 30-35г, Углеводы: 80-90г
-
-🍲 ОБЕД (700-800 ккал):
-• Говядина 200г + рис 150г + овощной салат с оливковым маслом
-• Или: Лосось 180г + картофель 200г + тушеные овощи
-• Белки: 40-45г, Углеводы: 90-100г
-
-🍗 УЖИН (500-600 ккал):
-• Куриные грудки 200г + гречка 120г + авокадо
-• Или: Творог 9% 200г + фрукты + орехи 20г
-• Белки: 35-40г, Углеводы: 50-60г
-
-🥛 ПЕРЕКУСЫ (300-400 ккал каждый):
-• Протеиновый коктейль (молоко + протеин + банан)
-• Бутерброды с арахисовой пастой
-• Сырники с медом
-
-💪 Силовые тренировки 3-4 раза в неделю!
-"""
-    
-    else:  # поддерживать форму
-        menu = f"""
-⚖️ ПЕРСОНАЛИЗИРОВАННОЕ СБАЛАНСИРОВАННОЕ МЕНЮ
-👤 {gender}, {age} лет, {weight}кг, {height}см
-🔥 Активность: {activity}
-🎯 Цель: {goal}
-
-📊 СУТОЧНАЯ НОРМА: {int(daily_calories)} ккал
-
-🍳 ЗАВТРАК (400-500 ккал):
-• Творог 5% 150г + фрукты 100г + мед 1 ч.л.
-• Или: Овсянка на молоке 60г + ягоды + орехи 20г
-• Белки: 20-25г, Углеводы: 60-70г
-
-🍲 ОБЕД (500-600 ккал):
-• Индейка 150г + киноа 100г + овощной салат
-• Или: Рыба 170г + булгур 120г + тушеные овощи
-• Белки: 35-40г, Углеводы: 70-80г
-
-🥗 УЖИН (400-450 ккал):
-• Запеченная курица 150г + овощи на гриле
-• Или: Морепродукты 180г + салат из свежих овощей
-• Белки: 30-35г, Углеводы: 30-40г
-
-🍎 ПЕРЕКУСЫ (200-250 ккал каждый):
-• Йогурт + горсть ягод
-• Орехи + сухофрукты (30г)
-• Овощные палочки с гуакамоле
-
-🚴 Поддерживайте активность каждый день!
-"""
-    
-    return menu
+async def generate_local_menu(profile: Profile) -> str:
+    """Локальная генерация меню: порции подбираются оптимизатором под КБЖУ пользователя"""
+    date = datetime.now().strftime('%d.%m.%Y')
+    # Набор блюд постоянен для профиля в течение дня
+    seed = zlib.crc32(f"{profile!r}|{date}".lower().encode('utf-8'))
+    title = (f"Меню на {date} для {profile.gender_label}, {profile.age} лет, {profile.weight}кг, {profile.height}см, "
+             f"активность: {profile.activity_label}, цель: {profile.goal_label}")
+    return render_menu_text(menu_optimizer.build(profile_targets(profile), seed, title))
 
 @router.message(F.text == "3. Расчет меню питания")
 async def generate_menu(message: types.Message):
     user_id = message.from_user.id
-    data = user_data_storage.get(user_id)
+    profile = user_profiles.get(user_id)
     
-    if not data:
+    if not profile:
         await message.answer("Сначала заполните данные в опции 1.")
         return
     
-    await message.answer("🍽️ Генерирую персонализированное меню...")
+    status_message = await message.answer("🍽️ Генерирую персонализированное меню...")
     
-    gender = data.get("gender", "мужчина")
-    age = data.get("age", 30)
-    weight = data.get("weight", 70)
-    height = data.get("height", 175)
-    activity = data.get("activity", "средний")
-    goal = data.get("goal", "поддерживать форму")
+    gender = profile.gender_label
+    age = profile.age
+    weight = profile.weight
+    height = profile.height
+    activity = profile.activity_label
+    goal = profile.goal_label
     
     # Расчет калорий
-    if gender == "мужчина":
-        bmr = 10 * weight + 6.25 * height - 5 * age + 5
-    else:
-        bmr = 10 * weight + 6.25 * height - 5 * age - 161
-    
-    activity_coeffs = {"низкий": 1.2, "средний": 1.55, "высокий": 1.725}
-    tdee = bmr * activity_coeffs.get(activity, 1.2)
-    
-    if goal == "похудеть":
-        daily_calories = tdee - 500
-    elif goal == "набрать массу":
-        daily_calories = tdee + 500
-    else:
-        daily_calories = tdee
+    daily_calories = profile_targets(profile)['daily_calories']
     
     # Промпт для GigaChat
     prompt = f"""
@@ -514,16 +358,29 @@ async def generate_menu(message: types.Message):
 Сделай меню сбалансированным, полезным и практичным для приготовления в домашних условиях.
 """
     
-    # Сначала пробуем GigaChat
-    menu_text = await generate_with_gigachat(prompt)
+    gigachat_header = "🍽️ Ваше персонализированное меню (сгенерировано GigaChat):\n\n"
+    
+    # Сначала пробуем GigaChat (в потоковом режиме меню дописывается в сообщение по мере генерации)
+    editor = None
+    if GIGACHAT_STREAMING:
+        editor = ThrottledMessageEditor(status_message, prefix=gigachat_header)
+        menu_text = await generate_with_gigachat_stream(prompt, editor.update)
+    else:
+        menu_text = await generate_with_gigachat(prompt)
     
     # Если GigaChat не ответил, используем локальную генерацию
     if menu_text.startswith("Ошибка") or menu_text.startswith("Таймаут"):
         logging.warning(f"GigaChat не ответил, используем локальное меню. Ошибка: {menu_text}")
-        menu_text = await generate_local_menu(data)
-        response = f"⚠️ Используем шаблонное меню:\n\n{menu_text}"
+        menu_text = await generate_local_menu(profile)
+        response = f"⚠️ GigaChat недоступен, меню составлено локально:\n\n{menu_text}"
     else:
-        response = f"🍽️ Ваше персонализированное меню (сгенерировано GigaChat):\n\n{menu_text}"
+        response = f"{gigachat_header}{menu_text}"
+        if editor is not None:
+            # Первая часть уже в отредактированном сообщении, остальное досылаем
+            await editor.finish(menu_text)
+            for i in range(TELEGRAM_MESSAGE_LIMIT, len(response), TELEGRAM_MESSAGE_LIMIT):
+                await message.answer(response[i:i+TELEGRAM_MESSAGE_LIMIT])
+            return
     
     # Разбиваем длинное сообщение на части (ограничение Telegram)
     if len(response) > 4000:
@@ -534,7 +391,15 @@ async def generate_menu(message: types.Message):
         await message.answer(response, reply_markup=main_menu)
 
 async def main():
-    await dp.start_polling(bot)
+    await init_http_session()
+    if GIGACHAT_CLIENT_ID and GIGACHAT_CLIENT_SECRET:
+        await token_manager.start()
+    try:
+        await dp.start_polling(bot)
+    finally:
+        await token_manager.stop()
+        await close_http_session()
+        await storage.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
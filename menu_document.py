@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from html_text import parse_menu_html
+from menu_schema import render_menu_text, shopping_items
+from products import ProductIndex, merge_shopping_list
+
+
+@dataclass
+class MenuDocument:
+    """Меню, разобранное один раз при генерации: текст, файл для печати и список покупок
+    берутся отсюда без повторного разбора HTML."""
+    html: str
+    text: str
+    # Объединённый список покупок на день и исходные строки до объединения и округления:
+    # их складывают заново, когда нужен общий список на несколько дней
+    shopping: List[Dict[str, str]]
+    items: List[Dict[str, str]]
+    # Приёмы пищи, блюда, итоги и рекомендации (формат menu_schema); для HTML-ответов LLM — None
+    menu: Optional[Dict[str, Any]] = None
+
+
+def build_document(html: str, menu: Optional[Dict[str, Any]], index: ProductIndex) -> MenuDocument:
+    if menu:
+        items = shopping_items(menu)
+        return MenuDocument(html, render_menu_text(menu), merge_shopping_list(items, index), items, menu)
+    text, lines = parse_menu_html(html)
+    items = [{'product': line} for line in lines]
+    return MenuDocument(html, text, merge_shopping_list(items, index), items)
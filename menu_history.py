@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+import json
+import zlib
+import hashlib
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+# Способ упаковки payload в таблице menus (хранится в каждой строке, старые записи остаются читаемыми)
+CODEC_ZLIB = 0
+CODEC_ZLIB_DICT = 1
+
+# Общий словарь для zlib: обёртки, стили и типовые фрагменты меню почти одинаковы во всех ответах,
+# поэтому сжимаются даже короткие payload. Не менять — на него ссылаются записи с CODEC_ZLIB_DICT;
+# для нового словаря нужен новый код упаковки.
+MENU_ZDICT = (
+    '{"html": "<html><head><meta charset=\\"UTF-8\\"><style>body {font-family: Arial; font-size: 12pt; margin: 1cm;} '
+    'table {width: 100%; border-collapse: collapse;} th, td {border: 1px solid black; padding: 8px; text-align: left;} '
+    'th {background-color: #f2f2f2;}</style></head><body>'
+    '<table width=\\"100%\\" style=\\"border-collapse: collapse; margin-bottom: 15px;\\">'
+    '<tr style=\\"background-color: #f2f2f2;\\">'
+    '<th style=\\"border: 1px solid black; padding: 8px; text-align: left; width: 35%;\\">Блюдо</th>'
+    '<th style=\\"border: 1px solid black; padding: 8px; text-align: center; width: 15%;\\">Вес</th>'
+    '<th style=\\"border: 1px solid black; padding: 8px; text-align: center; width: 20%;\\">Калорийность</th>'
+    '<th style=\\"border: 1px solid black; padding: 8px; text-align: left; width: 30%;\\">КБЖУ</th></tr>'
+    '<tr><td style=\\"border: 1px solid black; padding: 6px;\\">'
+    '<td style=\\"border: 1px solid black; padding: 6px; text-align: center;\\">г</td>'
+    '<td style=\\"border: 1px solid black; padding: 6px; text-align: center;\\"> ккал</td>'
+    '<td style=\\"border: 1px solid black; padding: 6px;\\">Белки:г, Жиры:г, Углеводы:г</td></tr></table>'
+    '<h2>🍳 ЗАВТРАК</h2><h2>🍲 ОБЕД</h2><h2>🍽️ УЖИН</h2><h2>🍎 ПЕРЕКУС</h2>'
+    '<h2>📊 Итого за день</h2><p>Калории:  ккал. </p><h2>🛒 Список продуктов для покупки</h2>'
+    '<ul class=\\"shopping-list\\"><li></li></ul><h2>💡 Рекомендации</h2><ul><li></li></ul></body></html>", '
+    '"menu": {"title": "Сегодня , . Калории: ", "meals": [{"name": "Завтрак", "emoji": "🍳", "dishes": '
+    '[{"name": "", "grams": 150.0, "kcal": 300.0, "protein": 12.0, "fat": 5.0, "carbs": 50.0}], '
+    '"drink": "Зелёный чай"}, {"name": "Обед", "emoji": "🍲", "dishes": [{"name": "Куриная грудка", '
+    '"grams": 100.0, "kcal": 200.0}]}, {"name": "Ужин", "emoji": "🍽️", "dishes": []}, '
+    '{"name": "Перекус", "emoji": "🍎", "dishes": []}], "shopping_list": [{"product": "", "amount": "г"}], '
+    '"tips": ["Пейте 2 литра воды"], "totals": {"grams": , "kcal": , "protein": , "fat": , "carbs": }}}'
+).encode('utf-8')
+
+
+@dataclass
+class MenuRecord:
+    menu_id: int
+    day: str
+    provider: str
+    latency: Optional[float]
+    tokens: Optional[int]
+    created_at: float
+
+
+def profile_hash(data: Dict[str, Any]) -> str:
+    """Короткий хеш профиля: по нему видно, для каких данных пользователя было составлено меню."""
+    raw = "|".join(str(data[field]).lower() for field in ('gender', 'age', 'weight', 'height', 'activity', 'goal'))
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
+
+
+def pack_menu(html: str, menu: Optional[dict]) -> Tuple[int, bytes]:
+    """Сжатие меню для таблицы menus: (код упаковки, payload)."""
+    raw = json.dumps({'html': html, 'menu': menu}, ensure_ascii=False).encode('utf-8')
+    compressor = zlib.compressobj(level=9, zdict=MENU_ZDICT)
+    return CODEC_ZLIB_DICT, compressor.compress(raw) + compressor.flush()
+
+
+def unpack_menu(codec: int, payload: bytes) -> Tuple[str, Optional[dict]]:
+    if codec == CODEC_ZLIB_DICT:
+        decompressor = zlib.decompressobj(zdict=MENU_ZDICT)
+        raw = decompressor.decompress(payload) + decompressor.flush()
+    elif codec == CODEC_ZLIB:
+        raw = zlib.decompress(payload)
+    else:
+        raise ValueError(f"Неизвестный код упаковки меню: {codec}")
+    value = json.loads(raw)
+    return value['html'], value.get('menu')
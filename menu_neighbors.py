@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import copy
+import logging
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sklearn.neighbors import KDTree
+
+from menu_schema import menu_totals
+
+logger = logging.getLogger(__name__)
+
+# Максимальное расстояние до соседа, при котором меню переиспользуется (в масштабированных единицах)
+MENU_NEIGHBOR_MAX_DISTANCE = float(os.getenv('MENU_NEIGHBOR_MAX_DISTANCE', '1.0'))
+# Верхняя граница доли запросов, обслуженных соседями (чтобы меню не становились однообразными)
+MENU_NEIGHBOR_MAX_HIT_RATE = float(os.getenv('MENU_NEIGHBOR_MAX_HIT_RATE', '0.8'))
+MENU_NEIGHBOR_MAX_ENTRIES = int(os.getenv('MENU_NEIGHBOR_MAX_ENTRIES', '5000'))
+
+# Категориальные признаки с большим весом: соседом может быть только профиль с тем же полом и целью
+_CATEGORY_WEIGHT = 100.0
+_GENDER_CODES = {"мужчина": 0, "женщина": 1}
+_ACTIVITY_COEFFS = {"низкий": 1.2, "средний": 1.55, "высокий": 1.725}
+_GOAL_CODES = {"поддерживать форму": 0, "похудеть": 1, "набрать массу": 2}
+
+# Масштаб числовых признаков: единица расстояния ≈ 10 лет / 10 кг / 10 см / 200 ккал / 20 г белка ...
+_SCALES = np.array([10.0, 10.0, 10.0, 0.175, 200.0, 20.0, 10.0, 25.0])
+
+_AMOUNT_RE = re.compile(r'^\s*(\d+)(?:([.,])(\d+))?')
+# Крупные единицы: количество в них пересчитывается хотя бы с одним знаком после запятой
+_LARGE_UNIT_RE = re.compile(r'^\s*(кг|килограмм|л\b|литр)', re.IGNORECASE)
+_MAX_DECIMALS = 3
+
+
+def profile_features(gender: str, age: int, weight: float, height: float, activity: str, goal: str,
+                     calories_dict: Dict[str, float]) -> np.ndarray:
+    numeric = np.array([
+        age, weight, height, _ACTIVITY_COEFFS.get(activity.lower(), 1.2),
+        calories_dict['daily_calories'], calories_dict['protein'], calories_dict['fat'], calories_dict['carbs']
+    ], dtype=float) / _SCALES
+    categories = np.array([
+        _GENDER_CODES.get(gender.lower(), 0),
+        _GOAL_CODES.get(goal.lower(), 0)
+    ], dtype=float) * _CATEGORY_WEIGHT
+    return np.concatenate([categories, numeric])
+
+
+def _scale_amount(amount: str, factor: float) -> str:
+    """Количество из списка покупок, умноженное на factor, с точностью исходного («0.3 кг» -> «0.4 кг»)."""
+    match = _AMOUNT_RE.match(amount)
+    if not match:
+        return amount
+    whole, separator, fraction = match.groups()
+    rest = amount[match.end():]
+    value = float(f"{whole}.{fraction or 0}") * factor
+    decimals = len(fraction or '')
+    if _LARGE_UNIT_RE.match(rest):
+        decimals = max(decimals, 1)
+    # Маленькое количество не должно округлиться до нуля
+    while decimals < _MAX_DECIMALS and value > 0 and round(value, decimals) == 0:
+        decimals += 1
+    text = f"{value:.{decimals}f}"
+    if decimals:
+        text = text.rstrip('0').rstrip('.')
+    return text.replace('.', separator or '.') + rest
+
+
+def rescale_menu(menu: Dict[str, Any], daily_calories: float) -> Dict[str, Any]:
+    """Копия меню с порциями, пересчитанными под новую суточную калорийность."""
+    scaled = copy.deepcopy(menu)
+    current = menu_totals(scaled)['kcal']
+    if current <= 0:
+        return scaled
+    factor = daily_calories / current
+    for meal in scaled['meals']:
+        for dish in meal['dishes']:
+            for field in ('grams', 'kcal', 'protein', 'fat', 'carbs'):
+                dish[field] = round(dish[field] * factor, 1)
+    for item in scaled['shopping_list']:
+        item['amount'] = _scale_amount(item['amount'], factor)
+    scaled['totals'] = menu_totals(scaled)
+    return scaled
+
+
+class MenuNeighborIndex:
+    """KD-дерево по признакам профиля и целям КБЖУ для уже сгенерированных структурированных меню."""
+
+    def __init__(self, max_distance: float = MENU_NEIGHBOR_MAX_DISTANCE,
+                 max_hit_rate: float = MENU_NEIGHBOR_MAX_HIT_RATE, max_entries: int = MENU_NEIGHBOR_MAX_ENTRIES):
+        self.max_distance = max_distance
+        self.max_hit_rate = max_hit_rate
+        self._features: deque = deque(maxlen=max_entries)
+        self._menus: deque = deque(maxlen=max_entries)
+        self._tree: Optional[KDTree] = None
+        self._dirty = False
+        self.lookups = 0
+        self.hits = 0
+
+    def add(self, features: np.ndarray, menu: Dict[str, Any]) -> None:
+        self._features.append(np.asarray(features, dtype=float))
+        self._menus.append(menu)
+        self._dirty = True
+
+    def _rebuild(self) -> None:
+        self._tree = KDTree(np.vstack(self._features)) if self._features else None
+        self._dirty = False
+
+    def find(self, features: np.ndarray) -> Optional[Tuple[Dict[str, Any], float]]:
+        """Ближайшее меню и расстояние до него, если сосед достаточно близко."""
+        self.lookups += 1
+        if not self._features:
+            return None
+        # Не даём соседям вытеснить генерацию полностью
+        if self.hits / self.lookups > self.max_hit_rate:
+            return None
+        if self._dirty or self._tree is None:
+            self._rebuild()
+        distances, indices = self._tree.query(np.asarray(features, dtype=float).reshape(1, -1), k=1)
+        distance = float(distances[0][0])
+        if distance > self.max_distance:
+            return None
+        self.hits += 1
+        return self._menus[int(indices[0][0])], distance
+
+    def __len__(self) -> int:
+        return len(self._menus)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._menus),
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+            "max_distance": self.max_distance,
+            "max_hit_rate": self.max_hit_rate
+        }
+
+
+def load_index_entries(values: List[Dict[str, Any]], index: MenuNeighborIndex) -> int:
+    """Наполнение индекса из сохранённых ответов (значения кэша LLM с признаками профиля)."""
+    loaded = 0
+    for value in values:
+        if value.get('menu') and value.get('features'):
+            index.add(np.array(value['features'], dtype=float), value['menu'])
+            loaded += 1
+    return loaded
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+
+import os
+import csv
+import random
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy.optimize import lsq_linear
+
+from menu_schema import validate_menu
+
+logger = logging.getLogger(__name__)
+
+# Таблица состава продуктов: КБЖУ на 100 г готового блюда, допустимые порции и шаг округления,
+# raw_factor — сколько граммов продукта купить на грамм готового блюда (крупы развариваются)
+FOODS_PATH = os.getenv('FOODS_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'foods.csv'))
+
+# Приёмы пищи: название, эмодзи, доля суточных калорий, слоты (группы продуктов), напитки.
+# Коды приёмов в столбце meals таблицы: B — завтрак, L — обед, D — ужин, S — перекус
+MEAL_PLAN: Tuple[Tuple[str, str, str, float, Tuple[Tuple[str, ...], ...], Tuple[str, ...]], ...] = (
+    ("Завтрак", "🍳", "B", 0.25, (("grain",), ("protein", "dairy"), ("fruit",), ("bread", "dairy")),
+     ("Зелёный чай", "Кофе без сахара", "Чай с лимоном")),
+    ("Обед", "🍲", "L", 0.35, (("soup",), ("protein",), ("grain",), ("veg",), ("bread",)),
+     ("Компот без сахара", "Вода с лимоном", "Травяной чай")),
+    ("Ужин", "🍽️", "D", 0.25, (("protein",), ("veg",), ("veg", "grain"), ("oil",)),
+     ("Травяной чай", "Вода", "Зелёный чай")),
+    ("Перекус", "🍎", "S", 0.15, (("dairy",), ("fruit", "nuts")),
+     ("Вода", "Зелёный чай")),
+)
+
+MENU_TIPS = (
+    "Пейте 1,5–2 литра воды в течение дня",
+    "Овощи и зелень можно добавлять без ограничений",
+    "Последний приём пищи — за 2–3 часа до сна",
+    "Готовьте на пару, запекайте или тушите вместо жарки",
+    "Ешьте медленно: чувство сытости приходит через 15–20 минут",
+)
+
+# Веса отклонений в задаче наименьших квадратов: калории важнее БЖУ, доли приёмов пищи — ориентир,
+# а слабая тяга к средней порции не даёт решателю уводить порции на границы
+_WEIGHT_KCAL = 3.0
+_WEIGHT_PROTEIN = 2.0
+_WEIGHT_FAT = 1.0
+_WEIGHT_CARBS = 1.0
+_WEIGHT_MEAL = 0.5
+_WEIGHT_PORTION = 0.05
+
+# Диапазоны порций в таблице рассчитаны на ~2200 ккал; для других норм они сдвигаются пропорционально
+PORTION_BASE_KCAL = 2200.0
+_PORTION_SCALE_LIMITS = (0.5, 2.0)
+
+
+@dataclass(frozen=True)
+class Food:
+    name: str
+    product: str
+    group: str
+    meals: str
+    kcal: float
+    protein: float
+    fat: float
+    carbs: float
+    min_g: float
+    max_g: float
+    step: float
+    raw_factor: float
+
+
+def load_foods(path: str = FOODS_PATH) -> List[Food]:
+    with open(path, encoding='utf-8', newline='') as f:
+        return [
+            Food(row['name'], row['product'], row['group'], row['meals'],
+                 *(float(row[column]) for column in ('kcal', 'protein', 'fat', 'carbs', 'min_g', 'max_g', 'step', 'raw_factor')))
+            for row in csv.DictReader(f)
+        ]
+
+
+def _fmt_grams(value: float) -> str:
+    return f"{value:.0f}г"
+
+
+class MenuOptimizer:
+    """Меню на день из таблицы продуктов: набор блюд выбирается по seed, порции — решением задачи
+    наименьших квадратов с границами (калории, БЖУ и доли приёмов пищи). Работает за миллисекунды."""
+
+    def __init__(self, foods: Sequence[Food]):
+        self.foods = list(foods)
+        # Кандидаты для каждого (приём пищи, группа) заранее, чтобы выбор блюд не перебирал всю таблицу
+        self._candidates: Dict[Tuple[str, str], List[int]] = {}
+        for index, food in enumerate(self.foods):
+            for meal_code in food.meals:
+                self._candidates.setdefault((meal_code, food.group), []).append(index)
+        self._nutrients = np.array([[food.kcal, food.protein, food.fat, food.carbs] for food in self.foods]) / 100.0
+        self._bounds = np.array([[food.min_g, food.max_g] for food in self.foods])
+
+    def _pick(self, rng: random.Random) -> List[List[int]]:
+        """Индексы блюд по приёмам пищи; одно блюдо не повторяется в течение дня."""
+        used = set()
+        meals = []
+        for _, _, meal_code, _, slots, _ in MEAL_PLAN:
+            chosen = []
+            for groups in slots:
+                options = [index for group in groups for index in self._candidates.get((meal_code, group), ())
+                           if index not in used]
+                if options:
+                    index = rng.choice(options)
+                    used.add(index)
+                    chosen.append(index)
+            meals.append(chosen)
+        return meals
+
+    def _solve(self, meals: List[List[int]], goals: Dict[str, float]) -> np.ndarray:
+        """Граммы для выбранных блюд (в порядке обхода приёмов пищи)."""
+        items = [index for chosen in meals for index in chosen]
+        nutrients = self._nutrients[items]
+        kcal = goals['daily_calories']
+        bounds = self._bounds[items] * np.clip(kcal / PORTION_BASE_KCAL, *_PORTION_SCALE_LIMITS)
+        weights = np.array([
+            _WEIGHT_KCAL / kcal,
+            _WEIGHT_PROTEIN / max(goals['protein'], 1.0),
+            _WEIGHT_FAT / max(goals['fat'], 1.0),
+            _WEIGHT_CARBS / max(goals['carbs'], 1.0)
+        ])
+        rows = [nutrients.T * weights[:, None]]
+        targets = [np.array([kcal, goals['protein'], goals['fat'], goals['carbs']]) * weights]
+
+        # Калорийность каждого приёма пищи около своей доли суток
+        meal_rows = np.zeros((len(meals), len(items)))
+        position = 0
+        for row, chosen in enumerate(meals):
+            meal_rows[row, position:position + len(chosen)] = nutrients[position:position + len(chosen), 0]
+            position += len(chosen)
+        rows.append(meal_rows * (_WEIGHT_MEAL / kcal))
+        targets.append(np.array([plan[3] for plan in MEAL_PLAN]) * _WEIGHT_MEAL)
+
+        # Слабая регуляризация к середине допустимого диапазона порции
+        middle = bounds.mean(axis=1)
+        scale = _WEIGHT_PORTION / np.maximum(bounds[:, 1], 1.0)
+        rows.append(np.diag(scale))
+        targets.append(middle * scale)
+
+        result = lsq_linear(np.vstack(rows), np.concatenate(targets), bounds=(bounds[:, 0], bounds[:, 1]), method='bvls')
+        return result.x
+
+    def build(self, goals: Dict[str, float], seed: Optional[int] = None, title: str = "") -> Dict[str, Any]:
+        """Структурированное меню (формат menu_schema) под нормы calculate_calories."""
+        rng = random.Random(seed)
+        meals = self._pick(rng)
+        grams = iter(self._solve(meals, goals))
+
+        menu_meals = []
+        shopping: Dict[str, float] = {}
+        for (name, emoji, _, _, _, drinks), chosen in zip(MEAL_PLAN, meals):
+            dishes = []
+            for index in chosen:
+                food = self.foods[index]
+                portion = round(next(grams) / food.step) * food.step
+                if portion <= 0:
+                    continue
+                dishes.append({
+                    "name": food.name,
+                    "grams": portion,
+                    "kcal": round(food.kcal * portion / 100.0),
+                    "protein": round(food.protein * portion / 10.0) / 10.0,
+                    "fat": round(food.fat * portion / 10.0) / 10.0,
+                    "carbs": round(food.carbs * portion / 10.0) / 10.0
+                })
+                shopping[food.product] = shopping.get(food.product, 0.0) + portion * food.raw_factor
+            menu_meals.append({"name": name, "emoji": emoji, "dishes": dishes, "drink": rng.choice(drinks)})
+
+        tips = ["Вес круп, гарниров и супов указан в готовом виде"] + rng.sample(MENU_TIPS, 2)
+        menu = validate_menu({
+            "title": title,
+            "meals": [meal for meal in menu_meals if meal["dishes"]],
+            "shopping_list": [{"product": product, "amount": _fmt_grams(round(amount / 10.0) * 10.0)}
+                              for product, amount in shopping.items()],
+            "tips": tips
+        })
+        logger.debug(f"Локальное меню: {menu['totals']['kcal']:.0f} из {goals['daily_calories']:.0f} ккал.")
+        return menu
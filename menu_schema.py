@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+import json
+from html import escape
+from typing import Any, Dict, List
+
+# Описание формата для промпта: модель возвращает только компактный JSON, оформление делаем сами
+MENU_JSON_FORMAT = (
+    '{"meals":[{"name":"Завтрак","emoji":"🍳","dishes":[{"name":"Овсяная каша с ягодами","grams":150,'
+    '"kcal":300,"protein":12,"fat":5,"carbs":50}],"drink":"Зелёный чай"}],'
+    '"shopping_list":[{"product":"Овсянка","amount":"150г"}],"tips":["Пейте 2 литра воды"]}'
+)
+
+MENU_STYLE = (
+    "body {font-family: Arial; font-size: 12pt; margin: 1cm;} "
+    "h1 {font-size: 14pt;} h2 {font-size: 13pt; margin: 12px 0 6px;} "
+    "table {width: 100%; border-collapse: collapse; margin-bottom: 15px;} "
+    "th, td {border: 1px solid black; padding: 6px; text-align: left;} "
+    "th {background-color: #f2f2f2; padding: 8px;} "
+    "td.num, th.num {text-align: center;}"
+)
+
+_DISH_NUMBERS = ("grams", "kcal", "protein", "fat", "carbs")
+
+
+class MenuValidationError(ValueError):
+    """Ответ модели не соответствует схеме меню."""
+
+
+def _number(value: Any, field: str) -> float:
+    if isinstance(value, str):
+        value = value.replace(',', '.').rstrip('гккалмл ').strip()
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise MenuValidationError(f"Поле {field}: ожидалось число, получено {value!r}")
+    if number < 0:
+        raise MenuValidationError(f"Поле {field}: отрицательное значение {number}")
+    return number
+
+
+def parse_menu_json(text: str) -> Dict[str, Any]:
+    """Разбор и проверка JSON-меню из ответа модели (допускаются ```json-обёртки и текст вокруг)."""
+    start = text.find('{')
+    end = text.rfind('}')
+    if start == -1 or end <= start:
+        raise MenuValidationError("В ответе нет JSON-объекта")
+    try:
+        raw = json.loads(text[start:end + 1])
+    except ValueError as e:
+        raise MenuValidationError(f"Некорректный JSON: {e}")
+    return validate_menu(raw)
+
+
+def validate_menu(raw: Any) -> Dict[str, Any]:
+    """Приводит меню к канонической форме и считает итоги; бросает MenuValidationError."""
+    if not isinstance(raw, dict):
+        raise MenuValidationError("Меню должно быть JSON-объектом")
+    meals_raw = raw.get("meals")
+    if not isinstance(meals_raw, list) or not meals_raw:
+        raise MenuValidationError("Нет приёмов пищи (meals)")
+
+    meals = []
+    for meal in meals_raw:
+        if not isinstance(meal, dict) or not meal.get("name"):
+            raise MenuValidationError("Приём пищи без названия")
+        dishes_raw = meal.get("dishes")
+        if not isinstance(dishes_raw, list) or not dishes_raw:
+            raise MenuValidationError(f"Нет блюд в приёме пищи {meal.get('name')}")
+        dishes = []
+        for dish in dishes_raw:
+            if not isinstance(dish, dict) or not dish.get("name"):
+                raise MenuValidationError("Блюдо без названия")
+            clean = {"name": str(dish["name"]).strip()}
+            for field in _DISH_NUMBERS:
+                clean[field] = _number(dish.get(field, 0), field)
+            dishes.append(clean)
+        meals.append({
+            "name": str(meal["name"]).strip(),
+            "emoji": str(meal.get("emoji") or "").strip(),
+            "dishes": dishes,
+            "drink": str(meal.get("drink") or "").strip()
+        })
+
+    shopping_list = []
+    for item in raw.get("shopping_list") or []:
+        if isinstance(item, dict) and item.get("product"):
+            shopping_list.append({"product": str(item["product"]).strip(), "amount": str(item.get("amount") or "Не указано").strip()})
+        elif isinstance(item, str) and item.strip():
+            shopping_list.append({"product": item.strip(), "amount": "Не указано"})
+
+    tips = [str(tip).strip() for tip in raw.get("tips") or [] if str(tip).strip()]
+
+    menu = {"title": str(raw.get("title") or "").strip(), "meals": meals, "shopping_list": shopping_list, "tips": tips}
+    menu["totals"] = menu_totals(menu)
+    return menu
+
+
+def menu_totals(menu: Dict[str, Any]) -> Dict[str, float]:
+    totals = {field: 0.0 for field in _DISH_NUMBERS}
+    for meal in menu["meals"]:
+        for dish in meal["dishes"]:
+            for field in _DISH_NUMBERS:
+                totals[field] += dish[field]
+    return totals
+
+
+def _fmt(value: float) -> str:
+    return f"{value:.0f}" if abs(value - round(value)) < 0.05 else f"{value:.1f}"
+
+
+def _macros(item: Dict[str, float]) -> str:
+    return f"Белки:{_fmt(item['protein'])}г, Жиры:{_fmt(item['fat'])}г, Углеводы:{_fmt(item['carbs'])}г"
+
+
+def render_menu_html(menu: Dict[str, Any]) -> str:
+    """HTML для печати (A4, 12 pt); стили вынесены в <style>, а не в каждую ячейку."""
+    parts = [f"<html><head><meta charset=\"UTF-8\"><style>{MENU_STYLE}</style></head><body>"]
+    if menu["title"]:
+        parts.append(f"<h1>{escape(menu['title'])}</h1>")
+    for meal in menu["meals"]:
+        parts.append(f"<h2>{escape((meal['emoji'] + ' ' + meal['name'].upper()).strip())}</h2>")
+        parts.append("<table><tr><th style=\"width: 35%;\">Блюдо</th><th class=\"num\" style=\"width: 15%;\">Вес</th>"
+                     "<th class=\"num\" style=\"width: 20%;\">Калорийность</th><th style=\"width: 30%;\">КБЖУ</th></tr>")
+        for dish in meal["dishes"]:
+            parts.append(f"<tr><td>{escape(dish['name'])}</td><td class=\"num\">{_fmt(dish['grams'])}г</td>"
+                         f"<td class=\"num\">{_fmt(dish['kcal'])} ккал</td><td>{_macros(dish)}</td></tr>")
+        if meal["drink"]:
+            parts.append(f"<tr><td colspan=\"4\">🥤 {escape(meal['drink'])}</td></tr>")
+        parts.append("</table>")
+
+    totals = menu["totals"]
+    parts.append(f"<h2>📊 Итого за день</h2><p>Калории: {_fmt(totals['kcal'])} ккал. {_macros(totals)}</p>")
+    if menu["shopping_list"]:
+        parts.append("<h2>🛒 Список продуктов для покупки</h2><ul class=\"shopping-list\">")
+        parts.extend(f"<li>{escape(item['product'])} {escape(item['amount'])}</li>" for item in menu["shopping_list"])
+        parts.append("</ul>")
+    if menu["tips"]:
+        parts.append("<h2>💡 Рекомендации</h2><ul>")
+        parts.extend(f"<li>{escape(tip)}</li>" for tip in menu["tips"])
+        parts.append("</ul>")
+    parts.append("</body></html>")
+    return "".join(parts)
+
+
+def render_menu_text(menu: Dict[str, Any]) -> str:
+    """Текст для сообщения Telegram в том же виде, что и html_to_text: строки таблиц через |, пункты через •."""
+    lines = [menu["title"]] if menu["title"] else []
+    for meal in menu["meals"]:
+        if lines:
+            lines.append("")
+        lines.append((meal['emoji'] + ' ' + meal['name'].upper()).strip())
+        lines.append("Блюдо | Вес | Калорийность | КБЖУ")
+        for dish in meal["dishes"]:
+            lines.append(f"{dish['name']} | {_fmt(dish['grams'])}г | {_fmt(dish['kcal'])} ккал | {_macros(dish)}")
+        if meal["drink"]:
+            lines.append(f"🥤 {meal['drink']}")
+
+    totals = menu["totals"]
+    lines += ["", "📊 Итого за день", f"Калории: {_fmt(totals['kcal'])} ккал. {_macros(totals)}"]
+    if menu["shopping_list"]:
+        lines += ["", "🛒 Список продуктов для покупки"]
+        lines += [f"• {item['product']} {item['amount']}" for item in menu["shopping_list"]]
+    if menu["tips"]:
+        lines += ["", "💡 Рекомендации"]
+        lines += [f"• {tip}" for tip in menu["tips"]]
+    return "\n".join(lines)
+
+
+def shopping_items(menu: Dict[str, Any]) -> List[Dict[str, str]]:
+    """Список продуктов меню: [{'product': ..., 'amount': ...}]."""
+    return [dict(item) for item in menu["shopping_list"]]
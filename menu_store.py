@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Optional, Tuple
+
+from menu_document import MenuDocument
+
+# Время жизни сгенерированного меню и максимальное число пользователей в памяти
+MENU_STORE_TTL = float(os.getenv('MENU_STORE_TTL', str(6 * 3600)))
+MENU_STORE_MAX_USERS = int(os.getenv('MENU_STORE_MAX_USERS', '10000'))
+
+
+def profile_key(data: dict) -> Tuple:
+    """Ключ профиля: меню действительно, пока не изменились данные пользователя."""
+    return (
+        str(data['gender']).lower(),
+        int(data['age']),
+        float(data['weight']),
+        float(data['height']),
+        str(data['activity']).lower(),
+        str(data['goal']).lower()
+    )
+
+
+@dataclass
+class MenuEntry:
+    profile: Tuple
+    day: str
+    # Разобранное меню: текст, HTML для печати и список покупок
+    document: MenuDocument
+    created_at: float = field(default_factory=time.time)
+
+    @property
+    def html(self) -> str:
+        return self.document.html
+
+    @property
+    def menu(self) -> Optional[dict]:
+        """Структурированное меню (JSON-ответ LLM или локальный оптимизатор), иначе None."""
+        return self.document.menu
+
+
+class MenuStore:
+    """Последнее сгенерированное меню пользователя (TTL + вытеснение LRU)."""
+
+    def __init__(self, ttl: float = MENU_STORE_TTL, max_users: int = MENU_STORE_MAX_USERS):
+        self.ttl = ttl
+        self.max_users = max_users
+        self._entries: "OrderedDict[int, MenuEntry]" = OrderedDict()
+
+    def get(self, user_id: int, data: dict, day: Optional[date] = None) -> Optional[MenuEntry]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        day = (day or date.today()).isoformat()
+        if entry.profile != profile_key(data) or entry.day != day or time.time() - entry.created_at > self.ttl:
+            del self._entries[user_id]
+            return None
+        self._entries.move_to_end(user_id)
+        return entry
+
+    def put(self, user_id: int, data: dict, document: MenuDocument, day: Optional[date] = None) -> MenuEntry:
+        entry = MenuEntry(profile_key(data), (day or date.today()).isoformat(), document)
+        self._entries[user_id] = entry
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_users:
+            self._entries.popitem(last=False)
+        return entry
+
+    def pop(self, user_id: int) -> None:
+        self._entries.pop(user_id, None)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
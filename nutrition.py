@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+import logging
+from typing import Dict, Iterable
+
+import numpy as np
+
+from user_profile import ACTIVITY_COEFFS, Activity, Gender, Goal, parse_activity, parse_gender, parse_goal
+
+logger = logging.getLogger(__name__)
+
+# Mifflin-St Jeor: поправка по полу (индекс = код Gender) и коррекция калорий по цели (индекс = код Goal)
+GENDER_OFFSETS = (5.0, -161.0)
+GOAL_DELTAS = (0.0, -500.0, 500.0)
+PROTEIN_PER_KG = 2.0
+FAT_SHARE = 0.25
+
+_GENDER_OFFSETS = np.array(GENDER_OFFSETS)
+_ACTIVITY_COEFFS = np.array(ACTIVITY_COEFFS)
+_GOAL_DELTAS = np.array(GOAL_DELTAS)
+
+# Скалярный и пакетный расчёт выполняют одни и те же операции в одном порядке над float64,
+# поэтому результаты совпадают побитно. Округление до 0.1 — round(x * 10) / 10 в обоих путях
+# (банковское округление, как np.rint), а не round(x, 1), который считает по десятичной записи.
+
+
+def targets(gender: int, age: float, weight: float, height: float, activity: int, goal: int) -> Dict[str, float]:
+    """Нормы для одного профиля (коды Gender/Activity/Goal): bmr, tdee, daily_calories и БЖУ в граммах."""
+    age, weight, height = float(age), float(weight), float(height)
+    bmr = 10.0 * weight + 6.25 * height - 5.0 * age + GENDER_OFFSETS[gender]
+    tdee = bmr * ACTIVITY_COEFFS[activity]
+    daily_calories = tdee + GOAL_DELTAS[goal]
+    protein = weight * PROTEIN_PER_KG
+    fat = daily_calories * FAT_SHARE / 9.0
+    carbs = (daily_calories - (protein * 4.0 + fat * 9.0)) / 4.0
+    return {
+        'bmr': bmr,
+        'tdee': tdee,
+        'daily_calories': daily_calories,
+        'protein': round(protein * 10.0) / 10.0,
+        'fat': round(fat * 10.0) / 10.0,
+        'carbs': round(carbs * 10.0) / 10.0
+    }
+
+
+def targets_batch(gender, age, weight, height, activity, goal) -> Dict[str, np.ndarray]:
+    """То же для массивов профилей одним векторным проходом (коды — целочисленные массивы)."""
+    age = np.asarray(age, dtype=np.float64)
+    weight = np.asarray(weight, dtype=np.float64)
+    height = np.asarray(height, dtype=np.float64)
+    bmr = 10.0 * weight + 6.25 * height - 5.0 * age + _GENDER_OFFSETS[np.asarray(gender, dtype=np.intp)]
+    tdee = bmr * _ACTIVITY_COEFFS[np.asarray(activity, dtype=np.intp)]
+    daily_calories = tdee + _GOAL_DELTAS[np.asarray(goal, dtype=np.intp)]
+    protein = weight * PROTEIN_PER_KG
+    fat = daily_calories * FAT_SHARE / 9.0
+    carbs = (daily_calories - (protein * 4.0 + fat * 9.0)) / 4.0
+    return {
+        'bmr': bmr,
+        'tdee': tdee,
+        'daily_calories': daily_calories,
+        'protein': np.rint(protein * 10.0) / 10.0,
+        'fat': np.rint(fat * 10.0) / 10.0,
+        'carbs': np.rint(carbs * 10.0) / 10.0
+    }
+
+
+def encode_labels(labels: Iterable[str], parse, default: int) -> np.ndarray:
+    """Столбец подписей ('мужчина', 'средний', ...) в массив кодов; неизвестные — default."""
+    codes = {}
+    result = []
+    for label in labels:
+        code = codes.get(label)
+        if code is None:
+            parsed = parse(str(label))
+            code = codes[label] = default if parsed is None else int(parsed)
+        result.append(code)
+    return np.array(result, dtype=np.int8)
+
+
+# Расчёт по данным анкеты в виде строк (как в таблице users)
+def calculate_calories(gender: str, age: int, weight: float, height: float, activity: str, goal: str) -> Dict[str, float]:
+    gender_code = parse_gender(gender)
+    if gender_code is None:
+        logger.warning(f"Некорректный gender: {gender}")
+        gender_code = Gender.MALE
+    activity_code = parse_activity(activity)
+    if activity_code is None:
+        logger.warning(f"Некорректный activity: {activity}")
+        activity_code = Activity.MEDIUM
+    goal_code = parse_goal(goal)
+    if goal_code is None:
+        logger.warning(f"Некорректный goal: {goal}")
+        goal_code = Goal.MAINTAIN
+    return targets(gender_code, age, weight, height, activity_code, goal_code)
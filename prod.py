@@ -3,23 +3,27 @@
 import os
 import asyncio
 import logging
-import sqlite3
-import aiohttp
-import ssl
-import base64
 import re
-import time
+import zlib
 from datetime import datetime  # Добавлено для получения текущей даты и дня недели
-from typing import Optional, Dict, Any
+from typing import Optional
 
 from aiogram import Bot, Dispatcher, F
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.fsm.storage.memory import MemoryStorage
-from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton, FSInputFile  # Добавлен FSInputFile для отправки файла
+from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton
 from aiogram.filters import Command
 from dotenv import load_dotenv
-from tenacity import retry, stop_after_attempt, wait_exponential
+
+from nutrition import calculate_calories
+from user_db import create_user_db
+from profile_cache import ProfileCache
+from fsm_storage import SQLiteStorage
+from http_client import init_http_session, get_http_session, close_http_session
+from gigachat_auth import GigaChatTokenManager
+from menu_optimizer import MenuOptimizer, load_foods
+from menu_schema import render_menu_text
+from document_sender import DocumentSender
 
 # Загрузка переменных окружения
 load_dotenv()
@@ -31,11 +35,14 @@ GIGACHAT_SCOPE = os.getenv('GIGACHAT_SCOPE', 'GIGACHAT_API_PERS')
 if not BOT_TOKEN or not GIGACHAT_CLIENT_ID or not GIGACHAT_CLIENT_SECRET:
     raise ValueError("Отсутствуют токены! Проверь .env файл.")
 
-# Кэш для токена GigaChat
-gigachat_token_cache: Dict[str, Any] = {
-    "access_token": None,
-    "expires_at": 0
-}
+# Токен GigaChat: общий для всех пользователей, обновляется в фоне
+token_manager = GigaChatTokenManager(GIGACHAT_CLIENT_ID, GIGACHAT_CLIENT_SECRET, GIGACHAT_SCOPE)
+
+# Локальное меню по таблице продуктов foods.csv (при ошибке GigaChat)
+menu_optimizer = MenuOptimizer(load_foods())
+
+# Файлы для печати собираются в памяти; одинаковые повторно отправляются по file_id Telegram
+documents = DocumentSender()
 
 # Настройка логирования
 logging.basicConfig(
@@ -50,28 +57,12 @@ logger = logging.getLogger(__name__)
 
 # Инициализация бота
 bot = Bot(token=BOT_TOKEN)
-storage = MemoryStorage()
+# Состояния анкеты хранятся в SQLite и переживают перезапуск
+storage = SQLiteStorage()
 dp = Dispatcher(storage=storage)
 
-# SQLite: Подключение и создание таблицы
-def init_db():
-    conn = sqlite3.connect('user_data.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            user_id INTEGER PRIMARY KEY,
-            gender TEXT,
-            age INTEGER,
-            weight REAL,
-            height REAL,
-            activity TEXT,
-            goal TEXT
-        )
-    ''')
-    conn.commit()
-    conn.close()
-
-init_db()
+# Хранилище пользователей (SQLite или PostgreSQL по USER_DB_BACKEND), схема мигрируется при открытии
+user_db = create_user_db()
 
 # FSM состояния
 class UserData(StatesGroup):
@@ -93,79 +84,12 @@ main_menu = ReplyKeyboardMarkup(
     resize_keyboard=True
 )
 
-# Функция расчёта BMR и TDEE
-def calculate_calories(gender: str, age: int, weight: float, height: float, activity: str, goal: str) -> Dict[str, float]:
-    if gender.lower() not in ["мужчина", "женщина"]:
-        logger.warning(f"Некорректный gender: {gender}")
-        gender = "мужчина"
-    if activity.lower() not in ["низкий", "средний", "высокий"]:
-        logger.warning(f"Некорректный activity: {activity}")
-        activity = "средний"
-    if goal.lower() not in ["поддерживать форму", "похудеть", "набрать массу"]:
-        logger.warning(f"Некорректный goal: {goal}")
-        goal = "поддерживать форму"
-    
-    if gender.lower() == "мужчина":
-        bmr = 10 * weight + 6.25 * height - 5 * age + 5
-    else:
-        bmr = 10 * weight + 6.25 * height - 5 * age - 161
-    
-    activity_coeffs = {"низкий": 1.2, "средний": 1.55, "высокий": 1.725}
-    tdee = bmr * activity_coeffs.get(activity.lower(), 1.2)
-    
-    if goal.lower() == "похудеть":
-        daily_calories = tdee - 500
-    elif goal.lower() == "набрать массу":
-        daily_calories = tdee + 500
-    else:
-        daily_calories = tdee
-    
-    protein = weight * 2
-    fat = (daily_calories * 0.25) / 9
-    carbs = (daily_calories - (protein * 4 + fat * 9)) / 4
-    
-    return {
-        'bmr': bmr,
-        'tdee': tdee,
-        'daily_calories': daily_calories,
-        'protein': round(protein, 1),
-        'fat': round(fat, 1),
-        'carbs': round(carbs, 1)
-    }
-
-# SSL-контекст для GigaChat
-ssl_context = ssl.create_default_context()
-ssl_context.check_hostname = False
-ssl_context.verify_mode = ssl.CERT_NONE
+# Профили пользователей в памяти вместе с рассчитанными калориями
+profiles = ProfileCache(user_db, calculate_calories)
 
-# Получение токена GigaChat с retry
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
+# Получение токена GigaChat (одно обновление на всех ожидающих)
 async def get_gigachat_access_token() -> Optional[str]:
-    global gigachat_token_cache
-    
-    if gigachat_token_cache["access_token"] and gigachat_token_cache["expires_at"] > time.time():
-        return gigachat_token_cache["access_token"]
-    
-    credentials = base64.b64encode(f"{GIGACHAT_CLIENT_ID}:{GIGACHAT_CLIENT_SECRET}".encode()).decode()
-    url = "https://ngw.devices.sberbank.ru:9443/api/v2/oauth"
-    headers = {
-        "Authorization": f"Basic {credentials}",
-        "RqUID": "12345678-1234-1234-1234-123456789012",
-        "Content-Type": "application/x-www-form-urlencoded"
-    }
-    data = f"scope={GIGACHAT_SCOPE}"
-    
-    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=ssl_context)) as session:
-        async with session.post(url, headers=headers, data=data) as response:
-            if response.status == 200:
-                result = await response.json()
-                gigachat_token_cache["access_token"] = result.get("access_token")
-                gigachat_token_cache["expires_at"] = time.time() + result.get("expires_in", 3600) - 60
-                logger.info("Токен GigaChat обновлён.")
-                return gigachat_token_cache["access_token"]
-            else:
-                logger.error(f"Ошибка получения токена GigaChat: {response.status} - {await response.text()}")
-                raise Exception(f"Failed to get access token: {response.status}")
+    return await token_manager.get_token()
 
 # Функция для генерации меню с GigaChat
 async def generate_menu(gender: str, age: int, weight: float, height: float, activity: str, goal: str) -> str:
@@ -212,29 +136,25 @@ async def generate_menu(gender: str, age: int, weight: float, height: float, act
         "temperature": 0.7
     }
     
-    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=ssl_context)) as session:
-        async with session.post(url, headers=headers, json=payload) as response:
-            if response.status == 200:
-                result = await response.json()
-                menu = result["choices"][0]["message"]["content"]
-                logger.info("Меню успешно сформировано с помощью GigaChat.")
-                return f"Меню сгенерировано с помощью GigaChat:\n\n{menu}"
-            elif response.status == 401:
-                logger.warning("Токен GigaChat истёк, сбрасываем кэш и переходим на локальную генерацию.")
-                gigachat_token_cache["access_token"] = None
-                raise Exception("Token expired")
-            else:
-                logger.error(f"Ошибка GigaChat: {response.status} - {await response.text()}")
-                logger.info("Переходим на локальную генерацию меню из-за ошибки GigaChat.")
-                return "Меню сгенерировано локально (ошибка GigaChat):\n\n" + await generate_local_menu(gender, age, weight, height, activity, goal)
+    session = await get_http_session()
+    async with session.post(url, headers=headers, json=payload) as response:
+        if response.status == 200:
+            result = await response.json()
+            menu = result["choices"][0]["message"]["content"]
+            logger.info("Меню успешно сформировано с помощью GigaChat.")
+            return f"Меню сгенерировано с помощью GigaChat:\n\n{menu}"
+        elif response.status == 401:
+            logger.warning("Токен GigaChat истёк, сбрасываем кэш и переходим на локальную генерацию.")
+            token_manager.invalidate()
+            raise Exception("Token expired")
+        else:
+            logger.error(f"Ошибка GigaChat: {response.status} - {await response.text()}")
+            logger.info("Переходим на локальную генерацию меню из-за ошибки GigaChat.")
+            return "Меню сгенерировано локально (ошибка GigaChat):\n\n" + await generate_local_menu(gender, age, weight, height, activity, goal)
 
 # Функция для генерации меню локально
 async def generate_local_menu(gender: str, age: int, weight: float, height: float, activity: str, goal: str) -> str:
     calories_dict = calculate_calories(gender, age, weight, height, activity, goal)
-    daily_calories = int(calories_dict['daily_calories'])
-    protein = calories_dict['protein']
-    fat = calories_dict['fat']
-    carbs = calories_dict['carbs']
     
     # Получаем текущую дату и день недели
     now = datetime.now()
@@ -246,21 +166,12 @@ async def generate_local_menu(gender: str, age: int, weight: float, height: floa
     day_of_week = now.strftime('%A')
     date = now.strftime('%d.%m.%Y')
     
-    menu = f"""
-Меню на день для {gender}, {age} лет, вес {weight} кг, рост {height} см, активность: {activity}, цель: {goal}. Сегодня {day_of_week}, {date}.
-
-Калории: {daily_calories} ккал.
-Белки: {protein} г.
-Жиры: {fat} г.
-Углеводы: {carbs} г.
-
-Завтрак: Овсянка с фруктами (300 ккал).
-Обед: Курица с овощами (500 ккал).
-Ужин: Рыба с салатом (400 ккал).
-Перекусы: Орехи и йогурт (300 ккал).
-    """
+    # Порции подбираются под КБЖУ пользователя; набор блюд постоянен для профиля в течение дня
+    seed = zlib.crc32(f"{gender}|{age}|{weight}|{height}|{activity}|{goal}|{date}".lower().encode('utf-8'))
+    title = f"Меню на день для {gender}, {age} лет, вес {weight} кг, рост {height} см, активность: {activity}, цель: {goal}. Сегодня {day_of_week}, {date}."
+    menu = render_menu_text(menu_optimizer.build(calories_dict, seed, title))
     logger.info("Меню успешно сформировано локально.")
-    return f"Меню сгенерировано локально:\n\n{menu.strip()}"
+    return f"Меню сгенерировано локально:\n\n{menu}"
 
 # Обработчики
 @dp.message(Command("start"))
@@ -337,14 +248,7 @@ async def process_goal(message: Message, state: FSMContext):
     data = await state.update_data(goal=message.text.lower())
     user_id = message.from_user.id
     
-    conn = sqlite3.connect('user_data.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT OR REPLACE INTO users (user_id, gender, age, weight, height, activity, goal)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (user_id, data['gender'], data['age'], data['weight'], data['height'], data['activity'], data['goal']))
-    conn.commit()
-    conn.close()
+    await profiles.save(user_id, data)
     
     await message.answer("Данные сохранены! Теперь вы можете рассчитать калории или меню.", reply_markup=main_menu)
     await state.clear()
@@ -352,18 +256,12 @@ async def process_goal(message: Message, state: FSMContext):
 @dp.message(F.text == "2. Расчет калорийности")
 async def process_calculate_calories(message: Message):
     user_id = message.from_user.id
-    conn = sqlite3.connect('user_data.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT gender, age, weight, height, activity, goal FROM users WHERE user_id = ?", (user_id,))
-    row = cursor.fetchone()
-    conn.close()
-    
-    if not row:
+    profile = await profiles.get(user_id)
+    if not profile:
         await message.answer("Сначала заполните данные! Выберите '1. Заполнить физические данные здоровья'.")
         return
-    
-    data = dict(zip(['gender', 'age', 'weight', 'height', 'activity', 'goal'], row))
-    calories_dict = calculate_calories(data['gender'], data['age'], data['weight'], data['height'], data['activity'], data['goal'])
+    data = profile.data
+    calories_dict = profile.calories
     
     response = f"""
 Расчёт калорий для {data['gender']}, {data['age']} лет, вес {data['weight']} кг, рост {data['height']} см, активность: {data['activity']}, цель: {data['goal']}.
@@ -380,34 +278,22 @@ TDEE: {calories_dict['tdee']:.1f} ккал.
 @dp.message(F.text == "3. Расчет меню питания")
 async def process_generate_menu(message: Message):
     user_id = message.from_user.id
-    conn = sqlite3.connect('user_data.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT gender, age, weight, height, activity, goal FROM users WHERE user_id = ?", (user_id,))
-    row = cursor.fetchone()
-    conn.close()
-    
-    if not row:
+    profile = await profiles.get(user_id)
+    if not profile:
         await message.answer("Сначала заполните данные! Выберите '1. Заполнить физические данные здоровья'.")
         return
-    
-    data = dict(zip(['gender', 'age', 'weight', 'height', 'activity', 'goal'], row))
+    data = profile.data
     menu = await generate_menu(data['gender'], data['age'], data['weight'], data['height'], data['activity'], data['goal'])
     await message.answer(menu)
 
 @dp.message(F.text == "4. Печать меню")
 async def process_print_menu(message: Message):
     user_id = message.from_user.id
-    conn = sqlite3.connect('user_data.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT gender, age, weight, height, activity, goal FROM users WHERE user_id = ?", (user_id,))
-    row = cursor.fetchone()
-    conn.close()
-    
-    if not row:
+    profile = await profiles.get(user_id)
+    if not profile:
         await message.answer("Сначала заполните данные! Выберите '1. Заполнить физические данные здоровья'.")
         return
-    
-    data = dict(zip(['gender', 'age', 'weight', 'height', 'activity', 'goal'], row))
+    data = profile.data
     
     try:
         menu_content = await generate_menu(data['gender'], data['age'], data['weight'], data['height'], data['activity'], data['goal'])
@@ -415,25 +301,28 @@ async def process_print_menu(message: Message):
         logger.warning(f"Ошибка при генерации меню для печати: {e}. Используем локальное.")
         menu_content = await generate_local_menu(data['gender'], data['age'], data['weight'], data['height'], data['activity'], data['goal'])
     
-    # Сохраняем меню в файл и отправляем как документ
-    file_path = f"menu_{user_id}.txt"
-    with open(file_path, 'w', encoding='utf-8') as f:
-        f.write(menu_content.replace('Меню сгенерировано с помощью GigaChat:', '').replace('Меню сгенерировано локально:', '').strip())
+    # Отправляем меню как документ прямо из памяти
+    menu_text = menu_content.replace('Меню сгенерировано с помощью GigaChat:', '').replace('Меню сгенерировано локально:', '').strip()
     
     try:
-        document = FSInputFile(file_path)
-        await message.answer_document(document, caption="Меню для печати. Скачайте и распечатайте!")
+        await documents.send(message, menu_text, "menu.txt", caption="Меню для печати. Скачайте и распечатайте!")
         logger.info(f"Меню отправлено как файл для пользователя {user_id}.")
     except Exception as e:
         logger.error(f"Ошибка отправки файла: {e}")
         await message.answer(f"Ошибка при отправке файла: {e}. Попробуйте позже.")
-    finally:
-        if os.path.exists(file_path):
-            os.remove(file_path)  # Удаляем временный файл
 
 # Запуск бота
 async def main():
-    await dp.start_polling(bot)
+    await user_db.open()
+    await init_http_session()
+    await token_manager.start()
+    try:
+        await dp.start_polling(bot)
+    finally:
+        await token_manager.stop()
+        await close_http_session()
+        await storage.close()
+        await user_db.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import csv
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Словарь продуктов: каноническое название и синонимы через «|»; дополняется продуктами из foods.csv
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PRODUCTS_PATH = os.getenv('PRODUCTS_PATH', os.path.join(_BASE_DIR, 'products.csv'))
+FOODS_PATH = os.getenv('FOODS_PATH', os.path.join(_BASE_DIR, 'foods.csv'))
+
+# Количество: число (или диапазон — берём верхнюю границу) и единица; единица не может быть началом
+# слова («г» в «гречка»). Всё приводится к базовым единицам: граммы, миллилитры, штуки
+_QUANTITY_RE = re.compile(
+    r'(?P<value>\d+(?:[.,]\d+)?)(?:\s*[-–—]\s*(?P<upper>\d+(?:[.,]\d+)?))?\s*'
+    r'(?P<unit>килограмм\w*|кг|грамм\w*|гр|г|миллилитр\w*|мл|литр\w*|л|штук\w*|шт)\.?(?![а-яёa-z])',
+    re.IGNORECASE
+)
+_UNITS: Dict[str, Tuple[str, float]] = {
+    'кг': ('g', 1000.0), 'килограмм': ('g', 1000.0),
+    'г': ('g', 1.0), 'гр': ('g', 1.0), 'грамм': ('g', 1.0),
+    'л': ('ml', 1000.0), 'литр': ('ml', 1000.0),
+    'мл': ('ml', 1.0), 'миллилитр': ('ml', 1.0),
+    'шт': ('pcs', 1.0), 'штук': ('pcs', 1.0)
+}
+_UNIT_FORMS = re.compile(r'^(килограмм|грамм|миллилитр|литр|штук)')
+
+_TOKEN_RE = re.compile(r'[а-яёa-z0-9%]+(?:[.,]\d+%?)?')
+_STOP_WORDS = frozenset(('и', 'или', 'с', 'со', 'без', 'для', 'из', 'на', 'по', 'в'))
+# Окончания для грубого стемминга: «куриное»/«куриная»/«куриные» дают одну основу
+_ENDINGS = ('ями', 'ами', 'ыми', 'ими', 'ого', 'его', 'ому', 'ему', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ый',
+            'ий', 'ой', 'ых', 'их', 'ую', 'юю', 'ов', 'ев', 'ам', 'ям', 'ах', 'ях',
+            'а', 'я', 'ы', 'и', 'о', 'е', 'у', 'ю', 'ь', 'й')
+_MIN_STEM = 3
+_SEPARATORS = ' \t-–—:;,.'
+_NOTE_SEPARATOR_RE = re.compile(r'\s[-–—]\s|:')
+# Скобки, от которых после удаления количеств ничего не осталось: «Лук (100 г)» -> «Лук ( )»
+_EMPTY_PARENS_RE = re.compile(r'\(\s*[,;/]?\s*\)')
+_TERMINAL = ''
+
+
+def _stem(word: str) -> str:
+    if any(char.isdigit() for char in word):
+        return word.replace(',', '.')
+    for ending in _ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= _MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+def name_tokens(name: str) -> Tuple[str, ...]:
+    """Основы слов названия без скобок и служебных слов, по алфавиту: порядок слов не важен."""
+    text = re.sub(r'\([^)]*\)', ' ', name.lower().replace('ё', 'е'))
+    return tuple(sorted({_stem(word) for word in _TOKEN_RE.findall(text) if word not in _STOP_WORDS}))
+
+
+def parse_quantities(text: str) -> List[Tuple[float, str]]:
+    """Все количества в строке в базовых единицах: «1 шт (100 г)» -> [(1, 'pcs'), (100, 'g')]."""
+    return [_quantity(match) for match in _QUANTITY_RE.finditer(text)]
+
+
+def parse_quantity(text: str) -> Optional[Tuple[float, str]]:
+    """Последнее количество в строке в базовых единицах: (значение, 'g' | 'ml' | 'pcs')."""
+    quantities = parse_quantities(text)
+    return quantities[-1] if quantities else None
+
+
+def _quantity(match) -> Tuple[float, str]:
+    unit = match.group('unit').lower()
+    forms = _UNIT_FORMS.match(unit)
+    base, factor = _UNITS[forms.group(1) if forms else unit]
+    value = float((match.group('upper') or match.group('value')).replace(',', '.'))
+    return value * factor, base
+
+
+def format_quantity(value: float, unit: str) -> str:
+    """Количество в базовых единицах для показа: 1500 г -> 1.5кг, 250 мл -> 250мл, 3 шт -> 3 шт."""
+    if unit == 'pcs':
+        return f"{value:g} шт"
+    large, small = ('кг', 'г') if unit == 'g' else ('л', 'мл')
+    if value >= 1000:
+        return f"{round(value / 100.0) / 10.0:g}{large}"
+    return f"{value:.0f}{small}"
+
+
+def split_item(text: str) -> Tuple[str, str]:
+    """Строка списка покупок («Куриное филе - 250г», «Специи: по вкусу») -> (название, количество).
+    Из названия убираются все количества: «Лук 1 шт (100 г)» -> («Лук», «1 шт 100 г»)."""
+    matches = list(_QUANTITY_RE.finditer(text))
+    if matches:
+        name = _QUANTITY_RE.sub(' ', text)
+        name = " ".join(_EMPTY_PARENS_RE.sub(' ', name).split())
+        return name.strip(_SEPARATORS), " ".join(match.group(0).strip() for match in matches)
+    parts = _NOTE_SEPARATOR_RE.split(text, maxsplit=1)
+    if len(parts) == 2:
+        return parts[0].strip(_SEPARATORS), parts[1].strip(_SEPARATORS)
+    return text.strip(_SEPARATORS), ''
+
+
+class ProductIndex:
+    """Канонические названия продуктов: префиксное дерево по отсортированным основам слов.
+    Ищется самое длинное каноническое название, все основы которого есть в запросе,
+    поэтому «Филе куриное охлаждённое» находит «Куриное филе»."""
+
+    def __init__(self):
+        self._root: dict = {}
+        self.size = 0
+
+    def add(self, canonical: str, *aliases: str) -> None:
+        for name in (canonical,) + aliases:
+            tokens = name_tokens(name)
+            if not tokens:
+                continue
+            node = self._root
+            for token in tokens:
+                node = node.setdefault(token, {})
+            # Первое добавленное название не перетирается более поздними синонимами
+            if _TERMINAL not in node:
+                node[_TERMINAL] = canonical
+                self.size += 1
+
+    def canonical(self, name: str) -> Optional[str]:
+        tokens = name_tokens(name)
+        # Числовые основы («5%», «1.5%») пропускать нельзя: «Творог 9%» — не «Творог 5%»
+        numeric = [any(char.isdigit() for char in token) for token in tokens]
+        best: Tuple[int, Optional[str]] = (0, None)
+        stack = [(self._root, 0, 0)]
+        while stack:
+            node, start, depth = stack.pop()
+            if _TERMINAL in node and depth > best[0] and not any(numeric[start:]):
+                best = (depth, node[_TERMINAL])
+            for i in range(start, len(tokens)):
+                child = node.get(tokens[i])
+                if child is not None:
+                    stack.append((child, i + 1, depth + 1))
+                if numeric[i]:
+                    break
+        return best[1]
+
+
+def load_product_index(path: str = PRODUCTS_PATH, foods_path: Optional[str] = FOODS_PATH) -> ProductIndex:
+    index = ProductIndex()
+    with open(path, encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            index.add(row['product'], *(alias for alias in (row.get('aliases') or '').split('|') if alias.strip()))
+    if foods_path and os.path.exists(foods_path):
+        with open(foods_path, encoding='utf-8', newline='') as f:
+            for row in csv.DictReader(f):
+                index.add(row['product'])
+    logger.info(f"Словарь продуктов загружен: {index.size} названий.")
+    return index
+
+
+def merge_shopping_list(items: Iterable[Dict[str, str]], index: ProductIndex) -> List[Dict[str, str]]:
+    """Один проход по списку: названия приводятся к каноническим, количества одного продукта
+    в одной базовой единице складываются. Порядок — по первому упоминанию продукта.
+    Если у строки несколько количеств («1 шт (100 г)»), берётся то, чья единица уже встречалась
+    у этого продукта, иначе последнее."""
+    merged: Dict[Tuple[str, Optional[str]], list] = {}
+    for item in items:
+        name, inline_amount = split_item(str(item.get('product') or ''))
+        amount = str(item.get('amount') or '').strip()
+        if not amount or amount == 'Не указано':
+            amount = inline_amount
+        product = index.canonical(name) or name
+        if not product:
+            continue
+        quantities = parse_quantities(amount)
+        parsed = next((quantity for quantity in quantities if (product.lower(), quantity[1]) in merged),
+                      quantities[-1] if quantities else None)
+        key = (product.lower(), parsed[1] if parsed else None)
+        slot = merged.get(key)
+        if slot is None:
+            merged[key] = [product, parsed[0] if parsed else 0.0, amount if not parsed else '']
+        elif parsed:
+            slot[1] += parsed[0]
+    return [
+        {'product': product, 'amount': format_quantity(total, unit) if unit else (note or 'Не указано')}
+        for (_, unit), (product, total, note) in merged.items()
+    ]
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+from user_db import PROFILE_FIELDS, UserDB
+
+# Сколько профилей держать в памяти
+PROFILE_CACHE_MAX_USERS = int(os.getenv('PROFILE_CACHE_MAX_USERS', '50000'))
+
+
+@dataclass
+class CachedProfile:
+    data: Dict[str, Any]
+    # Результат calculate_calories для этого профиля, посчитанный один раз при загрузке
+    calories: Dict[str, float]
+
+
+class ProfileCache:
+    """LRU-кэш профилей перед таблицей users: повторные нажатия кнопок не ходят в базу."""
+
+    def __init__(self, db: UserDB, calories_func: Callable[..., Dict[str, float]],
+                 max_users: int = PROFILE_CACHE_MAX_USERS):
+        self.db = db
+        self.calories_func = calories_func
+        self.max_users = max_users
+        self._entries: "OrderedDict[int, CachedProfile]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _store(self, user_id: int, data: Dict[str, Any]) -> CachedProfile:
+        data = {field: data[field] for field in PROFILE_FIELDS}
+        entry = CachedProfile(data, self.calories_func(*(data[field] for field in PROFILE_FIELDS)))
+        self._entries[user_id] = entry
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_users:
+            self._entries.popitem(last=False)
+        return entry
+
+    async def get(self, user_id: int) -> Optional[CachedProfile]:
+        """Профиль с рассчитанными калориями или None, если пользователь ещё не заполнил данные."""
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry
+        self.misses += 1
+        data = await self.db.get_profile(user_id)
+        # Пока шло чтение, save() мог положить более свежий профиль — прочитанную строку не используем
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            return entry
+        if data is None:
+            return None
+        return self._store(user_id, data)
+
+    async def save(self, user_id: int, data: Dict[str, Any]) -> CachedProfile:
+        """Сквозная запись: новый профиль сразу в кэше, в базу — через очередь UserDB."""
+        await self.db.save_profile(user_id, data)
+        return self._store(user_id, data)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
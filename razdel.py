@@ -3,26 +3,40 @@
 import os
 import asyncio
 import logging
-import sqlite3
-import aiohttp
-import ssl
-import base64
-import re
 import time
-from datetime import datetime
-from typing import Optional, Dict, Any
+import zlib
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, Tuple
 
 from aiogram import Bot, Dispatcher, F
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.fsm.storage.memory import MemoryStorage
-from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton, FSInputFile, BotCommand, BotCommandScopeDefault
+from aiogram.types import (Message, CallbackQuery, ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup,
+                           InlineKeyboardButton, BotCommand, BotCommandScopeDefault)
 from aiogram.filters import Command
 from dotenv import load_dotenv
-from tenacity import retry, stop_after_attempt, wait_exponential
 
-# Добавлен для парсинга HTML
-from bs4 import BeautifulSoup
+from nutrition import calculate_calories
+from user_db import create_user_db
+from profile_cache import ProfileCache
+from fsm_storage import SQLiteStorage
+from http_client import init_http_session, close_http_session
+from gigachat_auth import GigaChatTokenManager
+from menu_store import MenuStore, MenuEntry
+from menu_document import MenuDocument, build_document
+from document_sender import DocumentSender
+from singleflight import SingleFlight
+from llm_providers import LLMError, GigaChatProvider, DeepSeekProvider, HedgedLLM
+from circuit_breaker import CircuitBreaker
+from llm_scheduler import LLMScheduler, QueueFullError, UserBusyError
+from llm_cache import LLMCache, cache_key
+from menu_neighbors import MenuNeighborIndex, profile_features, rescale_menu, load_index_entries
+from menu_history import profile_hash
+from menu_optimizer import MenuOptimizer, load_foods
+from products import load_product_index, merge_shopping_list
+from menu_schema import MENU_JSON_FORMAT, MenuValidationError, parse_menu_json, render_menu_html
 
 # Загрузка переменных окружения
 load_dotenv()
@@ -30,15 +44,37 @@ BOT_TOKEN = os.getenv('BOT_TOKEN')
 GIGACHAT_CLIENT_ID = os.getenv('GIGACHAT_CLIENT_ID')
 GIGACHAT_CLIENT_SECRET = os.getenv('GIGACHAT_CLIENT_SECRET')
 GIGACHAT_SCOPE = os.getenv('GIGACHAT_SCOPE', 'GIGACHAT_API_PERS')
+DEEPSEEK_API_KEY = os.getenv('DEEPSEEK_API_KEY')
+# Максимальное время ожидания меню от LLM, после которого показываем локальное
+LLM_CALL_TIMEOUT = float(os.getenv('LLM_CALL_TIMEOUT', '45'))
+# Формат ответа модели: html — готовая разметка, json — компактные данные, разметку строим сами
+MENU_OUTPUT_FORMAT = os.getenv('MENU_OUTPUT_FORMAT', 'html').lower()
+# Доля запросов меню, которые сразу обслуживает локальный оптимизатор, без обращения к LLM (0..1)
+LOCAL_MENU_SHARE = float(os.getenv('LOCAL_MENU_SHARE', '0'))
+# Число дней в плане питания на неделю (пункт 8)
+WEEK_PLAN_DAYS = int(os.getenv('WEEK_PLAN_DAYS', '7'))
+# Telegram id администраторов через запятую: только им доступна служебная команда /status
+ADMIN_IDS = frozenset(int(user_id) for user_id in os.getenv('ADMIN_IDS', '').replace(' ', '').split(',') if user_id)
 
 if not BOT_TOKEN or not GIGACHAT_CLIENT_ID or not GIGACHAT_CLIENT_SECRET:
     raise ValueError("Отсутствуют токены! Проверь .env файл.")
 
-# Кэш для токена GigaChat
-gigachat_token_cache: Dict[str, Any] = {
-    "access_token": None,
-    "expires_at": 0
-}
+# Токен GigaChat: общий для всех пользователей, обновляется в фоне
+token_manager = GigaChatTokenManager(GIGACHAT_CLIENT_ID, GIGACHAT_CLIENT_SECRET, GIGACHAT_SCOPE)
+
+# LLM-провайдеры: GigaChat основной, DeepSeek (если задан ключ) — для хеджирования медленных ответов
+llm_providers = [GigaChatProvider(token_manager)]
+if DEEPSEEK_API_KEY:
+    llm_providers.append(DeepSeekProvider(DEEPSEEK_API_KEY))
+llm = HedgedLLM(llm_providers)
+llm_breaker = CircuitBreaker("llm")
+llm_cache = LLMCache()
+# Индекс ранее сгенерированных структурированных меню для переиспользования соседями
+menu_index = MenuNeighborIndex()
+# Локальное меню: порции подбираются под КБЖУ пользователя по таблице продуктов foods.csv
+menu_optimizer = MenuOptimizer(load_foods())
+# Словарь продуктов: канонические названия и единицы для списка покупок
+product_index = load_product_index()
 
 # Настройка логирования
 logging.basicConfig(
@@ -53,28 +89,12 @@ logger = logging.getLogger(__name__)
 
 # Инициализация бота
 bot = Bot(token=BOT_TOKEN)
-storage = MemoryStorage()
+# Состояния анкеты хранятся в SQLite и переживают перезапуск
+storage = SQLiteStorage()
 dp = Dispatcher(storage=storage)
 
-# SQLite: Подключение и создание таблицы
-def init_db():
-    conn = sqlite3.connect('user_data.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            user_id INTEGER PRIMARY KEY,
-            gender TEXT,
-            age INTEGER,
-            weight REAL,
-            height REAL,
-            activity TEXT,
-            goal TEXT
-        )
-    ''')
-    conn.commit()
-    conn.close()
-
-init_db()
+# Хранилище пользователей (SQLite или PostgreSQL по USER_DB_BACKEND), схема мигрируется при открытии
+user_db = create_user_db()
 
 # FSM состояния
 class UserData(StatesGroup):
@@ -92,169 +112,31 @@ main_menu = ReplyKeyboardMarkup(
         [KeyboardButton(text="2. Расчет калорийности")],
         [KeyboardButton(text="3. Расчет меню питания")],
         [KeyboardButton(text="4. Печать меню")],
-        [KeyboardButton(text="5. Список продуктов для покупки")]
+        [KeyboardButton(text="5. Список продуктов для покупки")],
+        [KeyboardButton(text="6. Сгенерировать новое меню")],
+        [KeyboardButton(text="7. История меню")],
+        [KeyboardButton(text="8. Меню на неделю")]
     ],
     resize_keyboard=True
 )
 
-# Функция расчёта BMR и TDEE
-def calculate_calories(gender: str, age: int, weight: float, height: float, activity: str, goal: str) -> Dict[str, float]:
-    if gender.lower() not in ["мужчина", "женщина"]:
-        logger.warning(f"Некорректный gender: {gender}")
-        gender = "мужчина"
-    if activity.lower() not in ["низкий", "средний", "высокий"]:
-        logger.warning(f"Некорректный activity: {activity}")
-        activity = "средний"
-    if goal.lower() not in ["поддерживать форму", "похудеть", "набрать массу"]:
-        logger.warning(f"Некорректный goal: {goal}")
-        goal = "поддерживать форму"
-    
-    if gender.lower() == "мужчина":
-        bmr = 10 * weight + 6.25 * height - 5 * age + 5
-    else:
-        bmr = 10 * weight + 6.25 * height - 5 * age - 161
-    
-    activity_coeffs = {"низкий": 1.2, "средний": 1.55, "высокий": 1.725}
-    tdee = bmr * activity_coeffs.get(activity.lower(), 1.2)
-    
-    if goal.lower() == "похудеть":
-        daily_calories = tdee - 500
-    elif goal.lower() == "набрать массу":
-        daily_calories = tdee + 500
-    else:
-        daily_calories = tdee
-    
-    protein = weight * 2
-    fat = (daily_calories * 0.25) / 9
-    carbs = (daily_calories - (protein * 4 + fat * 9)) / 4
-    
-    return {
-        'bmr': bmr,
-        'tdee': tdee,
-        'daily_calories': daily_calories,
-        'protein': round(protein, 1),
-        'fat': round(fat, 1),
-        'carbs': round(carbs, 1)
-    }
-
-# SSL-контекст для GigaChat
-ssl_context = ssl.create_default_context()
-ssl_context.check_hostname = False
-ssl_context.verify_mode = ssl.CERT_NONE
-
-# Получение токена GigaChat с retry
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
+# Профили пользователей в памяти вместе с рассчитанными калориями
+profiles = ProfileCache(user_db, calculate_calories)
+
+# Получение токена GigaChat (одно обновление на всех ожидающих)
 async def get_gigachat_access_token() -> Optional[str]:
-    global gigachat_token_cache
-    
-    if gigachat_token_cache["access_token"] and gigachat_token_cache["expires_at"] > time.time():
-        return gigachat_token_cache["access_token"]
-    
-    credentials = base64.b64encode(f"{GIGACHAT_CLIENT_ID}:{GIGACHAT_CLIENT_SECRET}".encode()).decode()
-    url = "https://ngw.devices.sberbank.ru:9443/api/v2/oauth"
-    headers = {
-        "Authorization": f"Basic {credentials}",
-        "RqUID": "12345678-1234-1234-1234-123456789012",
-        "Content-Type": "application/x-www-form-urlencoded"
-    }
-    data = f"scope={GIGACHAT_SCOPE}"
-    
-    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=ssl_context)) as session:
-        async with session.post(url, headers=headers, data=data) as response:
-            if response.status == 200:
-                result = await response.json()
-                gigachat_token_cache["access_token"] = result.get("access_token")
-                gigachat_token_cache["expires_at"] = time.time() + result.get("expires_in", 3600) - 60
-                logger.info("Токен GigaChat обновлён.")
-                return gigachat_token_cache["access_token"]
-            else:
-                logger.error(f"Ошибка получения токена GigaChat: {response.status} - {await response.text()}")
-                raise Exception(f"Failed to get access token: {response.status}")
-
-# Функция для конвертации HTML в читаемый текст
-def html_to_text(html_content: str) -> str:
-    try:
-        # Убедитесь, что контент в правильной кодировке
-        if isinstance(html_content, bytes):
-            html_content = html_content.decode('utf-8', errors='ignore')
-        
-        soup = BeautifulSoup(html_content, 'html.parser')
-        
-        # Удаляем скрипты и стили
-        for script in soup(["script", "style"]):
-            script.decompose()
-        
-        # Обрабатываем таблицы для лучшего форматирования
-        for table in soup.find_all('table'):
-            # Добавляем переносы строк вокруг таблиц
-            table.insert_before(soup.new_string('\n\n'))
-            table.insert_after(soup.new_string('\n\n'))
-            
-            # Обрабатываем строки таблицы
-            for i, row in enumerate(table.find_all('tr')):
-                if i == 0:  # Заголовок таблицы
-                    row.insert_before(soup.new_string('\n'))
-                cells = row.find_all(['th', 'td'])
-                row_text = ' | '.join(cell.get_text(strip=True) for cell in cells)
-                row.string = row_text
-                row.insert_after(soup.new_string('\n'))
-        
-        # Обрабатываем списки
-        for ul in soup.find_all('ul'):
-            ul.insert_before(soup.new_string('\n'))
-            for li in ul.find_all('li'):
-                li.string = '• ' + li.get_text(strip=True)
-                li.insert_after(soup.new_string('\n'))
-            ul.insert_after(soup.new_string('\n'))
-        
-        # Обрабатываем заголовки
-        for tag in soup.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6']):
-            tag.insert_before(soup.new_string('\n\n'))
-            tag.insert_after(soup.new_string('\n\n'))
-        
-        # Обрабатываем параграфы
-        for p in soup.find_all('p'):
-            p.insert_before(soup.new_string('\n'))
-            p.insert_after(soup.new_string('\n'))
-        
-        # Получаем текст с сохранением структуры
-        text = soup.get_text()
-        
-        # Заменяем множественные переносы на двойные для лучшей читаемости
-        text = re.sub(r'\n\s*\n\s*\n', '\n\n', text)
-        text = re.sub(r'\n\s*\n', '\n\n', text)
-        
-        # Убираем лишние пробелы, но сохраняем структуру
-        text = re.sub(r'[ \t]+', ' ', text)
-        
-        return text.strip()
-    except Exception as e:
-        logger.error(f"Ошибка конвертации HTML в текст: {e}")
-        return html_content  # Возвращаем оригинал в случае ошибки
-
-# Функция для генерации меню с GigaChat
-async def generate_menu(gender: str, age: int, weight: float, height: float, activity: str, goal: str) -> str:
-    token = await get_gigachat_access_token()
-    if not token:
-        logger.warning("Не удалось получить токен GigaChat, переходим на локальную генерацию.")
-        return "Ошибка авторизации с GigaChat. Попробуйте позже."
-    
-    calories_dict = calculate_calories(gender, age, weight, height, activity, goal)
-    
-    # Текущая дата и день недели
-    now = datetime.now()
-    try:
-        import locale
-        locale.setlocale(locale.LC_TIME, 'ru_RU.UTF-8')
-    except:
-        pass
-    day_of_week = now.strftime('%A')
-    date = now.strftime('%d.%m.%Y')
-    
-    prompt = f"""
+    return await token_manager.get_token()
+
+# Выполняющиеся запросы меню, сгруппированные по промпту
+menu_requests = SingleFlight("menu")
+
+# Промпт для меню в виде готового HTML
+def build_html_menu_prompt(gender: str, age: int, weight: float, height: float, activity: str, goal: str, day_of_week: str, date: str, calories_dict: Dict[str, float], heading: Optional[str] = None) -> str:
+    heading = heading or f"Сегодня {day_of_week}, {date}"
+    return f"""
         Действуй как провессиональный врач-диетолог и нутрициолог. 
         Информация должна содержать только меню и список продуктов.
-        Создай меню на день для {gender}, {age} лет, вес {weight} кг, рост {height} см, активность: {activity}, цель: {goal}. Жирным шрифтом 14 pt: Сегодня {day_of_week}, {date}. Жирным шрифтом 14 pt: Калории: {int(calories_dict['daily_calories'])}.
+        Создай меню на день для {gender}, {age} лет, вес {weight} кг, рост {height} см, активность: {activity}, цель: {goal}. Жирным шрифтом 14 pt: {heading}. Жирным шрифтом 14 pt: Калории: {int(calories_dict['daily_calories'])}.
 
         Сгенерируй в формате HTML для печати: шрифт 12 pt, умести на одном листе A4 (портрет, margins 1cm, без лишних слов), текст меню должен начинаться с даты. 
 
@@ -305,44 +187,23 @@ async def generate_menu(gender: str, age: int, weight: float, height: float, act
         Не нужно писать как использовать этот код!
         Только факты, без лишних слов и примеров!
         """
-    
-    url = "https://gigachat.devices.sberbank.ru/api/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "model": "GigaChat",
-        "messages": [{"role": "user", "content": prompt}],
-        "temperature": 0.7
-    }
-    
-    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=ssl_context)) as session:
-        async with session.post(url, headers=headers, json=payload) as response:
-            if response.status == 200:
-                result = await response.json()
-                menu = result["choices"][0]["message"]["content"]
-                logger.info("Меню успешно сформировано с помощью.")
-                return f"<html><head><meta charset=\"UTF-8\"><style>body {{font-family: Arial; font-size: 12pt; margin: 1cm;}} table {{width: 100%; border-collapse: collapse;}} th, td {{border: 1px solid black; padding: 8px; text-align: left;}} th {{background-color: #f2f2f2;}}</style></head><body>{menu}</body></html>"
-            elif response.status == 401:
-                logger.warning("Токен GigaChat истёк, сбрасываем кэш и переходим на локальную генерацию.")
-                gigachat_token_cache["access_token"] = None
-                raise Exception("Token expired")
-            else:
-                logger.error(f"Ошибка GigaChat: {response.status} - {await response.text()}")
-                logger.info("Переходим на локальную генерацию меню из-за ошибки GigaChat.")
-                return await generate_local_menu(gender, age, weight, height, activity, goal)
 
-# Функция для генерации меню локально
-async def generate_local_menu(gender: str, age: int, weight: float, height: float, activity: str, goal: str) -> str:
-    calories_dict = calculate_calories(gender, age, weight, height, activity, goal)
-    daily_calories = int(calories_dict['daily_calories'])
-    protein = calories_dict['protein']
-    fat = calories_dict['fat']
-    carbs = calories_dict['carbs']
-    
-    # Текущая дата и день недели
-    now = datetime.now()
+# Промпт для меню в виде компактного JSON (оформление делаем сами, модель генерирует в разы меньше токенов)
+def build_json_menu_prompt(gender: str, age: int, weight: float, height: float, activity: str, goal: str, day_of_week: str, date: str, calories_dict: Dict[str, float]) -> str:
+    return (
+        "Действуй как профессиональный врач-диетолог и нутрициолог. "
+        f"Создай меню на {day_of_week}, {date} для {gender}, {age} лет, вес {weight} кг, рост {height} см, "
+        f"активность: {activity}, цель: {goal}. Калории за день: {int(calories_dict['daily_calories'])}, "
+        f"белки {calories_dict['protein']} г, жиры {calories_dict['fat']} г, углеводы {calories_dict['carbs']} г.\n"
+        "Приёмы пищи: завтрак, обед (с супом, если уместно), ужин и 2 перекуса; российские продукты; "
+        "к названию блюда добавь подходящий эмодзи; для каждого приёма пищи — напиток. "
+        "Вес в граммах в готовом виде. В shopping_list — продукты на весь день с количеством, в tips — 2-3 коротких совета.\n"
+        f"Ответь ТОЛЬКО JSON без пояснений и без markdown, строго по схеме:\n{MENU_JSON_FORMAT}"
+    )
+
+# Дата и день недели меню (по умолчанию — сегодня) и заголовок дня: «Сегодня среда, 01.01.2025»
+def menu_day(day: Optional[datetime] = None) -> Tuple[datetime, str, str, str]:
+    now = day or datetime.now()
     try:
         import locale
         locale.setlocale(locale.LC_TIME, 'ru_RU.UTF-8')
@@ -350,88 +211,186 @@ async def generate_local_menu(gender: str, age: int, weight: float, height: floa
         pass
     day_of_week = now.strftime('%A')
     date = now.strftime('%d.%m.%Y')
+    heading = f"Сегодня {day_of_week}, {date}" if now.date() == datetime.now().date() else f"{day_of_week.capitalize()}, {date}"
+    return now, day_of_week, date, heading
+
+# Промпт, ключ кэша и признаки профиля для меню на день
+@dataclass
+class MenuRequest:
+    prompt: str
+    key: str
+    day_title: str
+    daily_calories: float
+    features: Any
+
+def menu_request(gender: str, age: int, weight: float, height: float, activity: str, goal: str, day: Optional[datetime] = None) -> MenuRequest:
+    calories_dict = calculate_calories(gender, age, weight, height, activity, goal)
     
-    menu = f"""
-    <h2>Меню на {date} ({day_of_week})</h2>
-    
-    <table border="1" width="100%">
-        <tr><th style="background-color: #f2f2f2; text-align: left;">Приём пищи</th><th style="background-color: #f2f2f2; text-align: left;">Блюдо</th><th style="background-color: #f2f2f2; text-align: left;">Граммы</th><th style="background-color: #f2f2f2; text-align: left;">Ккал</th></tr>
-        <tr><td style="text-align: left;">🍳 Завтрак</td><td style="text-align: left;">Овсянка с фруктами</td><td style="text-align: left;">150г</td><td style="text-align: left;">300</td></tr>
-        <tr><td style="text-align: left;">🍲 Обед</td><td style="text-align: left;">Курица с овощами</td><td style="text-align: left;">200г</td><td style="text-align: left;">500</td></tr>
-        <tr><td style="text-align: left;">🍽️ Ужин</td><td style="text-align: left;">Рыба с салатом</td><td style="text-align: left;">150г</td><td style="text-align: left;">400</td></tr>
-        <tr><td style="text-align: left;">🥨 Перекусы</td><td style="text-align: left;">Орехи и йогурт</td><td style="text-align: left;">100г</td><td style="text-align: left;">300</td></tr>
-    </table>
-    
-    <h3>📊 Общий КБЖУ:</h3>
-    <p>Калории: {daily_calories} ккал</p>
-    <p>Белки: {protein} г</p>
-    <p>Жиры: {fat} г</p>
-    <p>Углеводы: {carbs} г</p>
-    
-    <h3>🛒 Список продуктов для покупки:</h3>
-    <ul class="shopping-list">
-        <li>Овсянка - 150г</li>
-        <li>Фрукты (яблоки, бананы) - 200г</li>
-        <li>Куриное филе - 250г</li>
-        <li>Овощи (морковь, брокколи) - 300г</li>
-        <li>Рыба (лосось) - 200г</li>
-        <li>Салат (листовой) - 150г</li>
-        <li>Орехи (миндаль) - 100г</li>
-        <li>Йогурт греческий - 200г</li>
-        <li>Масло оливковое - 50мл</li>
-        <li>Специи - по вкусу</li>
-    </ul>
+    now, day_of_week, date, heading = menu_day(day)
+    day_title = f"{heading}. Калории: {int(calories_dict['daily_calories'])}"
+    if MENU_OUTPUT_FORMAT == 'json':
+        prompt = build_json_menu_prompt(gender, age, weight, height, activity, goal, day_of_week, date, calories_dict)
+    else:
+        prompt = build_html_menu_prompt(gender, age, weight, height, activity, goal, day_of_week, date, calories_dict, heading)
+    features = profile_features(gender, age, weight, height, activity, goal, calories_dict)
+    return MenuRequest(prompt, cache_key(prompt, now.date().isoformat()), day_title, calories_dict['daily_calories'], features)
+
+# Готовое меню без LLM: из дискового кэша ответов или пересчётом меню близкого профиля; None — нужен запрос.
+# Вызывается до постановки в очередь LLM, чтобы попадания в кэш не занимали её слоты.
+# use_neighbors=False — не брать меню соседнего профиля (в плане на неделю все дни получили бы одно меню)
+async def lookup_menu(request: MenuRequest, use_neighbors: bool = True) -> Optional[Tuple[str, Optional[Dict[str, Any]], Dict[str, Any]]]:
+    cached = await llm_cache.get(request.key)
+    if cached:
+        logger.info("Меню взято из кэша LLM.")
+        return cached['html'], cached.get('menu'), {'provider': 'cache', 'tokens': None}
+    
+    # Близкий профиль уже получал меню — пересчитываем порции под свою калорийность без LLM
+    if use_neighbors and MENU_OUTPUT_FORMAT == 'json':
+        neighbor = menu_index.find(request.features)
+        if neighbor:
+            neighbor_menu, distance = neighbor
+            menu_data = rescale_menu(neighbor_menu, request.daily_calories)
+            menu_data['title'] = request.day_title
+            logger.info(f"Меню построено по соседнему профилю (расстояние {distance:.2f}).")
+            return render_menu_html(menu_data), menu_data, {'provider': 'neighbor', 'tokens': None}
+    return None
+
+# Функция для генерации меню с GigaChat: возвращает (HTML, структурированное меню или None, источник).
+# Источник — {'provider': 'local' | имя LLM, 'tokens': число или None}. Выполняется в слоте очереди LLM;
+# кэш проверяет lookup_menu, а одинаковые промпты объединяет menu_requests — оба до очереди
+async def generate_menu(request: MenuRequest, gender: str, age: int, weight: float, height: float, activity: str, goal: str, day: Optional[datetime] = None) -> Tuple[str, Optional[Dict[str, Any]], Dict[str, Any]]:
+    return await request_llm_menu(request.prompt, request.key, request.features, request.day_title, gender, age, weight, height, activity, goal, day)
+
+LOCAL_SOURCE = {'provider': 'local', 'tokens': None}
+
+# Запрос меню к LLM по готовому промпту (GigaChat, при долгом ответе — хеджирование DeepSeek)
+async def request_llm_menu(prompt: str, key: str, features, day_title: str, gender: str, age: int, weight: float, height: float, activity: str, goal: str, day: Optional[datetime] = None) -> Tuple[str, Optional[Dict[str, Any]], Dict[str, Any]]:
+    # Размыкатель открыт — LLM деградировал, сразу отдаём локальное меню
+    if not llm_breaker.allow_request():
+        logger.info("LLM недоступен (circuit breaker разомкнут), используем локальное меню.")
+        return await generate_local_menu(gender, age, weight, height, activity, goal, day=day)
+    
+    started = time.monotonic()
+    try:
+        menu, provider, tokens = await asyncio.wait_for(llm.complete(prompt), timeout=LLM_CALL_TIMEOUT)
+    except asyncio.CancelledError:
+        llm_breaker.record_cancelled()
+        raise
+    except (LLMError, asyncio.TimeoutError) as e:
+        llm_breaker.record_failure()
+        logger.error(f"Ошибка LLM: {e!r}")
+        logger.info("Переходим на локальную генерацию меню из-за ошибки LLM.")
+        return await generate_local_menu(gender, age, weight, height, activity, goal, day=day)
+    elapsed = time.monotonic() - started
+    
+    if MENU_OUTPUT_FORMAT == 'json':
+        try:
+            menu_data = parse_menu_json(menu)
+        except MenuValidationError as e:
+            # Некорректный ответ бесполезен так же, как ошибка: модель, которая стабильно ломает JSON, размыкает цепь
+            llm_breaker.record_failure()
+            logger.error(f"LLM ({provider}) вернул некорректное JSON-меню: {e}. Используем локальное.")
+            return await generate_local_menu(gender, age, weight, height, activity, goal, day=day)
+        llm_breaker.record_success(elapsed)
+        menu_data['title'] = day_title
+        menu_html = render_menu_html(menu_data)
+        logger.info(f"Меню (JSON) успешно сформировано с помощью {provider}.")
+    else:
+        llm_breaker.record_success(elapsed)
+        menu_data = None
+        menu_html = f"<html><head><meta charset=\"UTF-8\"><style>body {{font-family: Arial; font-size: 12pt; margin: 1cm;}} table {{width: 100%; border-collapse: collapse;}} th, td {{border: 1px solid black; padding: 8px; text-align: left;}} th {{background-color: #f2f2f2;}}</style></head><body>{menu}</body></html>"
+        logger.info(f"Меню успешно сформировано с помощью {provider}.")
     
-    <p>💡 Рекомендация: Пейте достаточное количество воды в течение дня!</p>
-    """
+    # В кэш попадают только ответы LLM, локальные меню не сохраняем
+    await llm_cache.set(key, {'html': menu_html, 'menu': menu_data, 'features': features.tolist()})
+    if menu_data:
+        menu_index.add(features, menu_data)
+    return menu_html, menu_data, {'provider': provider, 'tokens': tokens}
+
+# Функция для генерации меню локально
+async def generate_local_menu(gender: str, age: int, weight: float, height: float, activity: str, goal: str, seed: Optional[int] = None, day: Optional[datetime] = None) -> Tuple[str, Dict[str, Any], Dict[str, Any]]:
+    calories_dict = calculate_calories(gender, age, weight, height, activity, goal)
+    _, _, date, heading = menu_day(day)
+    # Без seed набор блюд постоянен для профиля в течение дня, перегенерация передаёт случайный
+    if seed is None:
+        seed = zlib.crc32(f"{gender}|{age}|{weight}|{height}|{activity}|{goal}|{date}".lower().encode('utf-8'))
+    menu_data = menu_optimizer.build(
+        calories_dict, seed, f"{heading}. Калории: {int(calories_dict['daily_calories'])}"
+    )
     logger.info("Меню успешно сформировано локально.")
-    return f"<html><head><meta charset=\"UTF-8\"><style>body {{font-family: Arial; font-size: 12pt; margin: 1cm;}} table {{width: 100%; border-collapse: collapse;}} th, td {{border: 1px solid black; padding: 8px; text-align: left;}} th {{background-color: #f2f2f2;}}</style></head><body>{menu}</body></html>"
+    return render_menu_html(menu_data), menu_data, LOCAL_SOURCE
+
+# Последнее сгенерированное меню пользователя: его же используют печать и список продуктов
+user_menus = MenuStore()
 
-# Функция для генерации списка продуктов отдельно
-def generate_shopping_list(menu_html: str) -> list:
+# Документы (меню, список покупок) собираются в памяти; повторно отправляются по file_id Telegram
+documents = DocumentSender()
+
+# Очередь запросов к LLM: общий лимит параллельности и справедливость между пользователями
+llm_scheduler = LLMScheduler()
+
+# Меню пользователя: из хранилища или новая генерация (regenerate=True — всегда новая).
+# Возвращает None, если у пользователя уже готовится меню.
+async def get_user_menu(message: Message, data: Dict[str, Any], regenerate: bool = False) -> Optional[MenuEntry]:
+    user_id = message.from_user.id
+    if not regenerate:
+        entry = user_menus.get(user_id, data)
+        if entry:
+            logger.info(f"Меню для пользователя {user_id} взято из хранилища.")
+            return entry
+    
+    async def notify_queued(position: int):
+        await message.answer(f"⏳ Много запросов, ваше меню в очереди: перед вами {position}.")
+    
+    # Пользователи без сгенерированного меню идут в приоритетную очередь
+    first_time = user_id not in user_menus
+    started = time.monotonic()
+    local_seed = random.getrandbits(32) if regenerate else None
+    args = (data['gender'], data['age'], data['weight'], data['height'], data['activity'], data['goal'])
     try:
-        soup = BeautifulSoup(menu_html, 'html.parser')
-        # Ищем <ul> с классом shopping-list
-        ul = soup.find('ul', class_='shopping-list')
-        if ul:
-            products = []
-            for li in ul.find_all('li'):
-                text = li.get_text(strip=True)
-                # Убираем дефисы из текста
-                text = text.replace('-', '').strip()
-                
-                # Разделяем на продукт и количество
-                match = re.search(r'(.+?)\s*(\d+\.?\d*\s*[гкгмлшт]+\.?)$', text)
-                if match:
-                    product = match.group(1).strip()
-                    amount = match.group(2).strip()
-                    products.append({'product': product, 'amount': amount})
-                else:
-                    # Если не нашли количество, проверяем наличие "шт" в тексте
-                    if 'шт' in text.lower():
-                        parts = re.split(r'шт', text, flags=re.IGNORECASE)
-                        if len(parts) >= 2:
-                            product = parts[0].strip()
-                            amount = parts[1].strip()
-                            if amount.isdigit():
-                                amount = f"{amount} шт"
-                            else:
-                                amount = "шт"
-                            products.append({'product': product, 'amount': amount})
-                        else:
-                            products.append({'product': text, 'amount': 'шт'})
-                    else:
-                        products.append({'product': text, 'amount': 'Не указано'})
-            return products if products else []
+        request = menu_request(*args)
+        # Кэш и соседние профили проверяются до очереди: готовое меню не ждёт слот LLM
+        found = None if regenerate else await lookup_menu(request)
+        if found:
+            menu_html, menu_data, source = found
+        # Часть трафика сразу уходит в локальный оптимизатор — без очереди и без LLM
+        elif random.random() < LOCAL_MENU_SHARE:
+            menu_html, menu_data, source = await generate_local_menu(*args, local_seed)
         else:
-            logger.warning("Не найден список продуктов в HTML")
-            return []
+            if llm_scheduler.busy(user_id):
+                raise UserBusyError(user_id)
+            # Одинаковые промпты (тот же профиль и та же дата) объединяются до очереди:
+            # слот LLM занимает только первый запрос, остальные ждут его результат, не занимая воркеров
+            menu_html, menu_data, source = await menu_requests.run(
+                request.prompt,
+                lambda: llm_scheduler.run(
+                    user_id,
+                    lambda: generate_menu(request, *args),
+                    priority=first_time,
+                    on_queued=notify_queued
+                )
+            )
+    except UserBusyError:
+        await message.answer("⏳ Ваше меню уже готовится, подождите немного.")
+        return None
+    except QueueFullError:
+        logger.warning(f"Очередь LLM переполнена, пользователю {user_id} отдаём локальное меню.")
+        await message.answer("⚠️ Сервис перегружен, показываем меню, составленное без нейросети. Новое можно сгенерировать позже (пункт 6).")
+        menu_html, menu_data, source = await generate_local_menu(data['gender'], data['age'], data['weight'], data['height'], data['activity'], data['goal'], local_seed)
     except Exception as e:
-        logger.error(f"Ошибка парсинга HTML для списка продуктов: {e}")
-        return []
-
-# Глобальные переменные для хранения данных
-user_menus = {}
+        logger.warning(f"Ошибка при генерации меню: {e}. Используем локальное.")
+        menu_html, menu_data, source = await generate_local_menu(data['gender'], data['age'], data['weight'], data['height'], data['activity'], data['goal'], local_seed)
+    
+    # Меню разбирается один раз: текст, печать и список покупок строятся из документа
+    entry = user_menus.put(user_id, data, build_document(menu_html, menu_data, product_index))
+    
+    # Каждое показанное меню сохраняется в историю (пункт 7), ошибка записи не мешает ответу
+    try:
+        await user_db.add_menu(user_id, entry.day, profile_hash(data), source['provider'],
+                               time.monotonic() - started, source['tokens'], menu_html, menu_data)
+    except Exception as e:
+        logger.error(f"Ошибка сохранения меню в историю для пользователя {user_id}: {e}")
+    return entry
 
 # Обработчики сообщений
 @dp.message(Command("start"))
@@ -449,6 +408,8 @@ async def cmd_help(message: Message):
 <b>Основные команды:</b>
 /start - Запустить бота и показать главное меню
 /help - Показать эту справку
+/history - История меню
+/week - Меню на неделю
 
 <b>Функции бота:</b>
 1️⃣ Заполнить физические данные здоровья
@@ -456,14 +417,56 @@ async def cmd_help(message: Message):
 3️⃣ Расчет меню питания
 4️⃣ Печать меню в формате HTML
 5️⃣ Список продуктов для покупки
+6️⃣ Сгенерировать новое меню
+7️⃣ История меню
+8️⃣ Меню на неделю со списком продуктов
 
 <b>Как использовать:</b>
 1. Сначала заполните свои данные через пункт 1
 2. Затем можете рассчитать калории или меню
-3. Для печати используйте пункты 4 и 5
+3. Для печати используйте пункты 4 и 5 — они берут последнее показанное меню
+4. Чтобы получить другое меню, используйте пункт 6
+5. Прошлые меню доступны в пункте 7 (/history)
+6. План на неделю (пункт 8, /week) приходит по дням по мере готовности, в конце — общий список продуктов
     """
     await message.answer(help_text, parse_mode="HTML")
 
+@dp.message(Command("status"))
+async def cmd_status(message: Message):
+    # Телеметрия внутренняя: остальным пользователям не отвечаем
+    if message.from_user is None or message.from_user.id not in ADMIN_IDS:
+        logger.info(f"Команда /status от пользователя {message.from_user.id if message.from_user else None} проигнорирована.")
+        return
+    breaker = llm_breaker.snapshot()
+    hedging = llm.stats()
+    lines = [
+        f"LLM circuit breaker: {breaker['state']}",
+        f"Вызовов в окне: {breaker['calls']}, ошибок: {breaker['failures']}, медленных: {breaker['slow_calls']}",
+        f"Отклонено (локальное меню): {breaker['rejected']}"
+    ]
+    if breaker['retry_in'] is not None:
+        lines.append(f"Пробный запрос через: {breaker['retry_in']:.0f} с")
+    for ts, previous, state, reason in breaker['transitions'][-5:]:
+        lines.append(f"{datetime.fromtimestamp(ts):%d.%m %H:%M:%S} {previous} → {state}: {reason}")
+    lines.append(f"Хеджирование: {hedging['hedged']} запросов, побед резервного провайдера: {hedging['hedge_wins']}")
+    for name, p in hedging['providers'].items():
+        p95 = f"{p['p95']:.1f} с" if p['p95'] is not None else "—"
+        lines.append(f"{name}: ответов {p['samples']}, ошибок {p['errors']}, p95 {p95}")
+    queue = llm_scheduler.stats()
+    lines.append(f"Очередь LLM: выполняется {queue['running']}, ждут {queue['queued']}, отклонено {queue['shed']}, "
+                 f"выполнено {queue['completed']}, ошибок {queue['failed']}, отменено {queue['cancelled']}")
+    cache = llm_cache.stats()
+    lines.append(f"Кэш LLM: записей {cache['entries']}, попаданий {cache['hits']}, промахов {cache['misses']} ({cache['hit_rate']:.0%})")
+    writes = user_db.stats()
+    lines.append(f"Профили ({writes['backend']}): ждут записи {writes['pending']}, записано {writes['writes']} за {writes['batches']} транзакций")
+    cached = profiles.stats()
+    lines.append(f"Кэш профилей: записей {cached['entries']}, попаданий {cached['hits']}, промахов {cached['misses']} ({cached['hit_rate']:.0%})")
+    sessions = storage.stats()
+    lines.append(f"Анкеты (FSM): в памяти {sessions['hot']}, сохранено {sessions['stored']}")
+    neighbors = menu_index.stats()
+    lines.append(f"Соседние меню: записей {neighbors['entries']}, использовано {neighbors['hits']} из {neighbors['lookups']} ({neighbors['hit_rate']:.0%}), порог {neighbors['max_distance']}")
+    await message.answer("\n".join(lines))
+
 @dp.message(F.text == "1. Заполнить физические данные здоровья")
 async def process_fill_data(message: Message, state: FSMContext):
     # Создаем клавиатуру для выбора пола
@@ -552,14 +555,8 @@ async def process_goal(message: Message, state: FSMContext):
     data = await state.update_data(goal=message.text.lower())
     user_id = message.from_user.id
     
-    conn = sqlite3.connect('user_data.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT OR REPLACE INTO users (user_id, gender, age, weight, height, activity, goal)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (user_id, data['gender'], data['age'], data['weight'], data['height'], data['activity'], data['goal']))
-    conn.commit()
-    conn.close()
+    await profiles.save(user_id, data)
+    user_menus.pop(user_id)
     
     await message.answer("Данные сохранены! Теперь вы можете рассчитать калории или меню.", reply_markup=main_menu)
     await state.clear()
@@ -567,18 +564,12 @@ async def process_goal(message: Message, state: FSMContext):
 @dp.message(F.text == "2. Расчет калорийности")
 async def process_calculate_calories(message: Message):
     user_id = message.from_user.id
-    conn = sqlite3.connect('user_data.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT gender, age, weight, height, activity, goal FROM users WHERE user_id = ?", (user_id,))
-    row = cursor.fetchone()
-    conn.close()
-    
-    if not row:
+    profile = await profiles.get(user_id)
+    if not profile:
         await message.answer("Сначала заполните данные! Выберите '1. Заполнить физические данные здоровья'.")
         return
-    
-    data = dict(zip(['gender', 'age', 'weight', 'height', 'activity', 'goal'], row))
-    calories_dict = calculate_calories(data['gender'], data['age'], data['weight'], data['height'], data['activity'], data['goal'])
+    data = profile.data
+    calories_dict = profile.calories
     
     response = f"""
 Расчёт калорий для {data['gender']}, {data['age']} лет, вес {data['weight']} кг, рост {data['height']} см, активность: {data['activity']}, цель: {data['goal']}.
@@ -595,108 +586,207 @@ TDEE: {calories_dict['tdee']:.1f} ккал.
 @dp.message(F.text == "3. Расчет меню питания")
 async def process_generate_menu(message: Message):
     user_id = message.from_user.id
-    conn = sqlite3.connect('user_data.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT gender, age, weight, height, activity, goal FROM users WHERE user_id = ?", (user_id,))
-    row = cursor.fetchone()
-    conn.close()
-    
-    if not row:
+    profile = await profiles.get(user_id)
+    if not profile:
         await message.answer("Сначала заполните данные! Выберите '1. Заполнить физические данные здоровья'.")
         return
-    
-    data = dict(zip(['gender', 'age', 'weight', 'height', 'activity', 'goal'], row))
-    
-    try:
-        menu_html = await generate_menu(data['gender'], data['age'], data['weight'], data['height'], data['activity'], data['goal'])
-    except Exception as e:
-        logger.warning(f"Ошибка при генерации меню: {e}. Используем локальное.")
-        menu_html = await generate_local_menu(data['gender'], data['age'], data['weight'], data['height'], data['activity'], data['goal'])
-    
-    # Конвертируем HTML в читаемый текст для отображения в боте
-    menu_text = html_to_text(menu_html)
+    data = profile.data
+    await send_menu(message, user_id, data, regenerate=False)
+
+@dp.message(F.text == "6. Сгенерировать новое меню")
+async def process_regenerate_menu(message: Message):
+    user_id = message.from_user.id
+    profile = await profiles.get(user_id)
+    if not profile:
+        await message.answer("Сначала заполните данные! Выберите '1. Заполнить физические данные здоровья'.")
+        return
+    data = profile.data
+    await send_menu(message, user_id, data, regenerate=True)
+
+# Отправка меню пользователю: текстом или файлом, если текст слишком длинный
+async def send_menu(message: Message, user_id: int, data: Dict[str, Any], regenerate: bool):
+    entry = await get_user_menu(message, data, regenerate=regenerate)
+    if entry is None:
+        return
+    await deliver_menu(message, user_id, entry.document)
+
+async def deliver_menu(message: Message, user_id: int, document: MenuDocument):
+    menu_text = document.text
+    menu_html = document.html
     
     # Проверяем длину и отправляем как файл, если слишком длинное
     if len(menu_text) > 4000:
-        file_path = f"temp_menu_{user_id}.html"
         try:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(menu_html)
-            document = FSInputFile(file_path)
-            await message.answer_document(
-                document,
+            await documents.send(
+                message, menu_html, "menu.html",
                 caption="Меню слишком длинное для сообщения. Скачайте файл для просмотра (шрифт 12 pt, A4). Откройте в браузере!"
             )
             logger.info(f"Меню отправлено как файл для пользователя {user_id} (длина текста: {len(menu_text)} символов).")
         except Exception as e:
             logger.error(f"Ошибка отправки файла: {e}")
             await message.answer(f"Ошибка при отправке меню: {e}. Попробуйте позже.")
-        finally:
-            if os.path.exists(file_path):
-                os.remove(file_path)
     else:
         await message.answer(menu_text)
         logger.info(f"Меню отправлено как текст для пользователя {user_id} (длина: {len(menu_text)} символов).")
 
+HISTORY_PAGE_SIZE = 5
+HISTORY_PROVIDERS = {'cache': 'из кэша', 'neighbor': 'по похожему профилю', 'local': 'базовое'}
+
+# Страница истории меню: кнопка на каждое меню и переход между страницами
+async def history_page(user_id: int, offset: int) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    records, total = await user_db.list_menus(user_id, HISTORY_PAGE_SIZE, offset)
+    if not total:
+        return "История пуста: сгенерируйте меню через пункт 3.", None
+    rows = []
+    for record in records:
+        source = HISTORY_PROVIDERS.get(record.provider, record.provider)
+        created = datetime.fromtimestamp(record.created_at)
+        rows.append([InlineKeyboardButton(text=f"{record.day} {created:%H:%M} ({source})", callback_data=f"menu:{record.menu_id}")])
+    navigation = []
+    if offset > 0:
+        navigation.append(InlineKeyboardButton(text="◀ Новее", callback_data=f"history:{max(offset - HISTORY_PAGE_SIZE, 0)}"))
+    if offset + HISTORY_PAGE_SIZE < total:
+        navigation.append(InlineKeyboardButton(text="Старее ▶", callback_data=f"history:{offset + HISTORY_PAGE_SIZE}"))
+    if navigation:
+        rows.append(navigation)
+    last = min(offset + HISTORY_PAGE_SIZE, total)
+    return f"История меню: {offset + 1}–{last} из {total}", InlineKeyboardMarkup(inline_keyboard=rows)
+
+@dp.message(F.text == "7. История меню")
+@dp.message(Command("history"))
+async def process_menu_history(message: Message):
+    text, keyboard = await history_page(message.from_user.id, 0)
+    await message.answer(text, reply_markup=keyboard)
+
+@dp.callback_query(F.data.startswith("history:"))
+async def process_history_page(callback: CallbackQuery):
+    text, keyboard = await history_page(callback.from_user.id, int(callback.data.split(":", 1)[1]))
+    await callback.message.edit_text(text, reply_markup=keyboard)
+    await callback.answer()
+
+@dp.callback_query(F.data.startswith("menu:"))
+async def process_history_menu(callback: CallbackQuery):
+    user_id = callback.from_user.id
+    stored = await user_db.get_menu(user_id, int(callback.data.split(":", 1)[1]))
+    if stored is None:
+        await callback.answer("Меню не найдено.", show_alert=True)
+        return
+    await callback.answer()
+    menu_html, menu_data = stored
+    await deliver_menu(callback.message, user_id, build_document(menu_html, menu_data, product_index))
+
+# План на неделю: дни генерируются параллельно в общей очереди LLM и отправляются по мере готовности,
+# в конце — список продуктов на все дни с суммированием количеств
+@dp.message(F.text == "8. Меню на неделю")
+@dp.message(Command("week"))
+async def process_week_plan(message: Message):
+    user_id = message.from_user.id
+    profile = await profiles.get(user_id)
+    if not profile:
+        await message.answer("Сначала заполните данные! Выберите '1. Заполнить физические данные здоровья'.")
+        return
+    data = profile.data
+    args = (data['gender'], data['age'], data['weight'], data['height'], data['activity'], data['goal'])
+    today = datetime.now()
+    days = [today + timedelta(days=i) for i in range(WEEK_PLAN_DAYS)]
+    
+    # Дни из кэша (и первый — по соседнему профилю) готовы сразу и в очередь LLM не попадают
+    day_requests = [menu_request(*args, day=day) for day in days]
+    found = await asyncio.gather(*(lookup_menu(request, use_neighbors=i == 0) for i, request in enumerate(day_requests)))
+    missing = [i for i, result in enumerate(found) if result is None]
+    
+    # Остальные дни — одна заявка пользователя; они проходят через общий лимит параллельности по одному.
+    # День, чей промпт уже генерируется для другого запроса, присоединяется к нему и слот не занимает.
+    # Дни приходят не по порядку, но каждое меню начинается со своей даты
+    flights = [None] * len(days)
+    try:
+        pending = [i for i in missing if day_requests[i].prompt not in menu_requests]
+        jobs = dict(zip(pending, llm_scheduler.submit_many(
+            user_id,
+            [lambda i=i: generate_menu(day_requests[i], *args, day=days[i]) for i in pending]
+        ))) if pending else {}
+        for i in missing:
+            flights[i] = menu_requests.start(day_requests[i].prompt, lambda job=jobs.get(i): job.result())
+    except UserBusyError:
+        await message.answer("⏳ Ваше меню уже готовится, подождите немного.")
+        return
+    except QueueFullError:
+        logger.warning(f"Очередь LLM переполнена, пользователю {user_id} план на неделю составляется локально.")
+    await message.answer(f"⏳ Составляю меню на {len(days)} дней, дни будут приходить по мере готовности.")
+    
+    async def plan_day(i: int) -> Tuple[datetime, Tuple[str, Optional[Dict[str, Any]], Dict[str, Any]], float]:
+        day, flight = days[i], flights[i]
+        if found[i] is not None:
+            return day, found[i], 0.0
+        started = time.monotonic()
+        try:
+            if flight is None:
+                return day, await generate_local_menu(*args, day=day), 0.0
+            result = await asyncio.shield(flight)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Ошибка при генерации меню на {day:%d.%m}: {e}. Используем локальное.")
+            result = await generate_local_menu(*args, day=day)
+        return day, result, time.monotonic() - started
+    
+    shopping = []
+    for next_day in asyncio.as_completed([plan_day(i) for i in range(len(days))]):
+        day, (menu_html, menu_data, source), latency = await next_day
+        document = build_document(menu_html, menu_data, product_index)
+        await deliver_menu(message, user_id, document)
+        # Исходные строки дня, а не уже округлённый список: складываем один раз за всю неделю
+        shopping.extend(document.items)
+        try:
+            await user_db.add_menu(user_id, day.date().isoformat(), profile_hash(data), source['provider'],
+                                   latency, source['tokens'], menu_html, menu_data)
+        except Exception as e:
+            logger.error(f"Ошибка сохранения меню в историю для пользователя {user_id}: {e}")
+    
+    week_list = merge_shopping_list(shopping, product_index)
+    if week_list:
+        lines = [f"🛒 Список продуктов на {len(days)} дней:", ""]
+        lines += [f"{i}. {item['product']} - {item['amount']}" for i, item in enumerate(week_list, 1)]
+        await message.answer("\n".join(lines))
+    logger.info(f"План на неделю отправлен пользователю {user_id} ({len(days)} дней, продуктов {len(week_list)}).")
+
 @dp.message(F.text == "4. Печать меню")
 async def process_print_menu(message: Message):
     user_id = message.from_user.id
-    conn = sqlite3.connect('user_data.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT gender, age, weight, height, activity, goal FROM users WHERE user_id = ?", (user_id,))
-    row = cursor.fetchone()
-    conn.close()
-    
-    if not row:
+    profile = await profiles.get(user_id)
+    if not profile:
         await message.answer("Сначала заполните данные! Выберите '1. Заполнить физические данные здоровья'.")
         return
+    data = profile.data
     
-    data = dict(zip(['gender', 'age', 'weight', 'height', 'activity', 'goal'], row))
-    
-    try:
-        menu_content = await generate_menu(data['gender'], data['age'], data['weight'], data['height'], data['activity'], data['goal'])
-    except Exception as e:
-        logger.warning(f"Ошибка при генерации меню для печати: {e}. Используем локальное.")
-        menu_content = await generate_local_menu(data['gender'], data['age'], data['weight'], data['height'], data['activity'], data['goal'])
+    entry = await get_user_menu(message, data)
+    if entry is None:
+        return
+    menu_content = entry.document.html
     
-    # Сохраняем меню в HTML-файл с явным указанием кодировки
-    file_path = f"menu_{user_id}.html"
+    # Отправляем HTML-файл из памяти (UTF-8)
     try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(menu_content)
-        
-        document = FSInputFile(file_path)
-        await message.answer_document(document, caption="Меню для печати (шрифт 12 pt, A4). Откройте в браузере и распечатайте!")
+        await documents.send(message, menu_content, "menu.html",
+                             caption="Меню для печати (шрифт 12 pt, A4). Откройте в браузере и распечатайте!")
         logger.info(f"Меню отправлено как файл для пользователя {user_id}.")
     except Exception as e:
         logger.error(f"Ошибка создания/отправки файла: {e}")
         await message.answer(f"Ошибка при отправке файла: {e}. Попробуйте позже.")
-    finally:
-        if os.path.exists(file_path):
-            os.remove(file_path)
 
 @dp.message(F.text == "5. Список продуктов для покупки")
 async def process_print_shopping_list(message: Message):
     user_id = message.from_user.id
-    conn = sqlite3.connect('user_data.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT gender, age, weight, height, activity, goal FROM users WHERE user_id = ?", (user_id,))
-    row = cursor.fetchone()
-    conn.close()
-    
-    if not row:
+    profile = await profiles.get(user_id)
+    if not profile:
         await message.answer("Сначала заполните данные! Выберите '1. Заполнить физические данные здоровья'.")
         return
+    data = profile.data
     
-    data = dict(zip(['gender', 'age', 'weight', 'height', 'activity', 'goal'], row))
-    
-    try:
-        menu_content = await generate_menu(data['gender'], data['age'], data['weight'], data['height'], data['activity'], data['goal'])
-    except Exception as e:
-        logger.warning(f"Ошибка при генерации меню для списка: {e}. Используем локальное.")
-        menu_content = await generate_local_menu(data['gender'], data['age'], data['weight'], data['height'], data['activity'], data['goal'])
+    entry = await get_user_menu(message, data)
+    if entry is None:
+        return
     
-    shopping_list = generate_shopping_list(menu_content)
+    shopping_list = entry.document.shopping
     
     if not shopping_list:
         await message.answer("Список продуктов не найден в сгенерированном меню. Попробуйте сгенерировать меню заново.")
@@ -727,15 +817,10 @@ async def process_print_shopping_list(message: Message):
     
     table_html += "</table></body></html>"
     
-    # Сохраняем с явным указанием кодировки UTF-8
-    file_path = f"shopping_list_{user_id}.html"
+    # Отправляем из памяти в кодировке UTF-8
     try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(table_html)
-        
-        document = FSInputFile(file_path)
-        await message.answer_document(
-            document, 
+        await documents.send(
+            message, table_html, "shopping_list.html",
             caption="Список продуктов для покупки в таблице (шрифт 12 pt, A4)."
         )
         logger.info(f"Список продуктов отправлен как файл для пользователя {user_id}.")
@@ -748,23 +833,35 @@ async def process_print_shopping_list(message: Message):
             text_response += f"{i}. {item['product']} - {item['amount']}\n"
         
         await message.answer(text_response)
-        
-    finally:
-        if os.path.exists(file_path):
-            os.remove(file_path)
 
 # Настройка команд бота
 async def set_bot_commands(bot: Bot):
     commands = [
         BotCommand(command="/start", description="Запустить бота и показать меню"),
-        BotCommand(command="/help", description="Помощь по использованию бота")
+        BotCommand(command="/help", description="Помощь по использованию бота"),
+        BotCommand(command="/history", description="История меню"),
+        BotCommand(command="/week", description="Меню на неделю")
     ]
     await bot.set_my_commands(commands, BotCommandScopeDefault())
 
 # Запуск бота
 async def main():
-    await set_bot_commands(bot)
-    await dp.start_polling(bot)
+    await user_db.open()
+    await init_http_session()
+    await token_manager.start()
+    await llm_scheduler.start()
+    loaded = load_index_entries(await asyncio.to_thread(llm_cache.values_sync), menu_index)
+    logger.info(f"Индекс соседних меню: загружено {loaded} записей из кэша.")
+    try:
+        await set_bot_commands(bot)
+        await dp.start_polling(bot)
+    finally:
+        await llm_scheduler.stop()
+        await token_manager.stop()
+        await close_http_session()
+        await storage.close()
+        await user_db.close()
+        llm_cache.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Объединение одинаковых конкурентных запросов: одна задача, результат получают все ожидающие."""
+
+    def __init__(self, name: str = "singleflight"):
+        self.name = name
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        # shield: отмена одного ожидающего не отменяет общий запрос для остальных
+        return await asyncio.shield(self.start(key, factory))
+
+    def start(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        """Общая задача для ключа: уже выполняющаяся или новая. Регистрируется сразу, до первого await,
+        поэтому запросы, пришедшие следом, к ней присоединяются."""
+        task = self._tasks.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.create_task(factory())
+            self._tasks[key] = task
+            task.add_done_callback(lambda t, key=key: self._forget(key, t))
+        else:
+            self.shared += 1
+            logger.info(f"{self.name}: запрос присоединён к уже выполняющемуся.")
+        return task
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        # Забираем исключение, чтобы asyncio не ругался, если ожидающих не осталось
+        if not task.cancelled():
+            task.exception()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._tasks
+
+    def in_flight(self) -> int:
+        return len(self._tasks)
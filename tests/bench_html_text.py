@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+
+# Замер html_to_text: прежняя реализация на BeautifulSoup против однопроходной на html.parser.
+#   python tests/bench_html_text.py
+
+import os
+import sys
+import timeit
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from html_text import html_to_text
+from html_text_legacy import html_to_text as legacy_html_to_text
+from html_menus import menus
+
+NUMBER = 10
+REPEAT = 5
+
+
+def bench(func, documents) -> float:
+    """Лучшее из REPEAT время на одно меню, мс."""
+    best = min(timeit.repeat(lambda: [func(html) for html in documents], number=NUMBER, repeat=REPEAT))
+    return best / (NUMBER * len(documents)) * 1000
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    documents = menus()
+    print(f"Меню: {len(documents)}, средний размер {sum(map(len, documents)) // len(documents)} символов")
+    legacy = bench(legacy_html_to_text, documents)
+    current = bench(html_to_text, documents)
+    print(f"BeautifulSoup: {legacy:.3f} мс/меню")
+    print(f"html.parser:   {current:.3f} мс/меню")
+    print(f"Ускорение:     {legacy / current:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
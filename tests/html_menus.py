@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+# Набор HTML-меню для сравнения html_to_text с прежней реализацией и для замера скорости
+
+import random
+from typing import List
+
+from menu_optimizer import MenuOptimizer, load_foods
+from menu_schema import render_menu_html
+from nutrition import calculate_calories
+
+_WRAPPER = ("<html><head><meta charset=\"UTF-8\"><style>body {{font-family: Arial; font-size: 12pt; margin: 1cm;}} "
+            "table {{width: 100%; border-collapse: collapse;}} th, td {{border: 1px solid black; padding: 8px; "
+            "text-align: left;}} th {{background-color: #f2f2f2;}}</style></head><body>{}</body></html>")
+
+# Прежнее локальное меню-шаблон (generate_local_menu до оптимизатора)
+LEGACY_TEMPLATE = _WRAPPER.format("""
+    <h2>Меню на 17.10.2026 (суббота)</h2>
+
+    <table border="1" width="100%">
+        <tr><th style="background-color: #f2f2f2; text-align: left;">Приём пищи</th><th style="background-color: #f2f2f2; text-align: left;">Блюдо</th><th style="background-color: #f2f2f2; text-align: left;">Граммы</th><th style="background-color: #f2f2f2; text-align: left;">Ккал</th></tr>
+        <tr><td style="text-align: left;">🍳 Завтрак</td><td style="text-align: left;">Овсянка с фруктами</td><td style="text-align: left;">150г</td><td style="text-align: left;">300</td></tr>
+        <tr><td style="text-align: left;">🍲 Обед</td><td style="text-align: left;">Курица с овощами</td><td style="text-align: left;">200г</td><td style="text-align: left;">500</td></tr>
+        <tr><td style="text-align: left;">🍽️ Ужин</td><td style="text-align: left;">Рыба с салатом</td><td style="text-align: left;">150г</td><td style="text-align: left;">400</td></tr>
+        <tr><td style="text-align: left;">🥨 Перекусы</td><td style="text-align: left;">Орехи и йогурт</td><td style="text-align: left;">100г</td><td style="text-align: left;">300</td></tr>
+    </table>
+
+    <h3>📊 Общий КБЖУ:</h3>
+    <p>Калории: 2031 ккал</p>
+    <p>Белки: 152.3 г</p>
+    <p>Жиры: 56.4 г</p>
+    <p>Углеводы: 228.5 г</p>
+
+    <h3>🛒 Список продуктов для покупки:</h3>
+    <ul class="shopping-list">
+        <li>Овсянка - 150г</li>
+        <li>Фрукты (яблоки, бананы) - 200г</li>
+        <li>Куриное филе - 250г</li>
+        <li>Овощи (морковь, брокколи) - 300г</li>
+        <li>Рыба (лосось) - 200г</li>
+        <li>Салат (листовой) - 150г</li>
+        <li>Орехи (миндаль) - 100г</li>
+        <li>Йогурт греческий - 200г</li>
+        <li>Масло оливковое - 50мл</li>
+        <li>Специи - по вкусу</li>
+    </ul>
+
+    <p>💡 Рекомендация: Пейте достаточное количество воды в течение дня!</p>
+    """)
+
+# Ответ LLM в духе реальных: markdown-обёртка, скрипт, комментарий, thead/tbody, сущности, <br>
+LLM_MENU = """```html
+<!DOCTYPE html><html><head><title>Меню</title><meta charset="utf-8"><style>td{padding:6px}</style>
+<script>var x = "<b>нет</b>";</script></head>
+<body><p style="font-size:14pt"><b>Сегодня суббота, 17.10.2026.</b></p><p><b>Калории: 1800</b></p>
+<!-- комментарий -->
+<h2>🍳 ЗАВТРАК</h2>
+<table width="100%" style="border-collapse: collapse; margin-bottom: 15px;">
+<thead><tr style="background-color: #f2f2f2;"><th style="width:35%">Блюдо</th><th>Вес</th><th>Калорийность</th><th>КБЖУ</th></tr></thead>
+<tbody>
+<tr><td>Омлет&nbsp;из 2 яиц <i>с зеленью</i></td><td>150 г</td><td> 220 ккал </td><td>Белки: 14г,<br>Жиры: 16г, Углеводы: 2г</td></tr>
+<tr>
+  <td>Чай &amp; лимон</td>
+  <td>200 мл</td><td></td>
+  <td>—</td>
+</tr>
+</tbody></table>
+<h2>📊 Итого за день</h2><p>Калории: 1800 ккал.   Белки:  90г</p>
+<h2>🛒 Список продуктов</h2>
+<ul class="shopping-list">
+ <li>Яйца — 2 шт</li>
+ <li><b>Молоко</b> 200 мл</li>
+</ul>
+<ol><li>Пункт один</li><li>Пункт два</li></ol>
+<div>Свободный   текст\tс табом</div>
+<h3>Рекомендации</h3><ul><li>Пейте воду</li></ul>
+</body></html>
+```"""
+
+# Вложенный список и незакрытый <li> (html.parser вкладывает следующий пункт в него):
+# прежняя реализация на них падала и возвращала исходный HTML
+NESTED_LIST = '<ul><li>Завтрак<ul><li>Каша</li><li>Чай</li></ul></li><li>Обед</li></ul>'
+UNCLOSED_ITEM = '<ul class="shopping-list">\n <li>Яйца 2 шт\n <li>Молоко 200 мл</li>\n</ul>'
+
+EDGE_CASES = [
+    "Просто текст без разметки",
+    "<p>Незакрытый абзац <b>жирный<table><tr><td>A<td>B</tr></table>",
+    "<table><caption>Подпись</caption><tr><td>a</td></tr><tr><td>b<table><tr><td>x</td></tr></table></td></tr></table>",
+]
+
+
+def optimizer_menus(count: int = 30) -> List[str]:
+    """HTML меню локального оптимизатора для разных профилей."""
+    optimizer = MenuOptimizer(load_foods())
+    rng = random.Random(0)
+    menus = []
+    for seed in range(count):
+        goals = calculate_calories(rng.choice(('мужчина', 'женщина')), 20 + seed, 50 + seed * 2, 160 + seed,
+                                   rng.choice(('низкий', 'средний', 'высокий')), rng.choice(('похудеть', 'набрать массу')))
+        title = f"Сегодня суббота, 17.10.2026. Калории: {int(goals['daily_calories'])}"
+        menus.append(render_menu_html(optimizer.build(goals, seed, title)))
+    return menus
+
+
+def random_html(rng: random.Random, depth: int = 0) -> str:
+    """Случайный документ из элементов, которые встречаются в меню: таблицы, списки, заголовки, абзацы."""
+    def words() -> str:
+        return rng.choice(['Каша', ' овсяная ', 'Белки: 10г', '\n  ', '150 г', '&amp; чай', '  ', 'Ужин\t'])
+
+    parts = []
+    for _ in range(rng.randint(1, 5)):
+        kind = rng.random()
+        if kind < 0.25 or depth > 2:
+            parts.append(words())
+        elif kind < 0.45:
+            rows = ''.join(
+                '<tr>' + ''.join(f'<t{rng.choice("dh")}>{words()}<b>{words()}</b></td>' for _ in range(rng.randint(0, 4)))
+                + '</tr>\n'
+                for _ in range(rng.randint(0, 4))
+            )
+            parts.append(f'\n<table>{rng.choice(["", "<tbody>"])}{rows}</table>')
+        elif kind < 0.6:
+            parts.append('<ul>' + ''.join(f'\n <li>{words()}<i>{words()}</i></li>' for _ in range(rng.randint(0, 4))) + '\n</ul>')
+        elif kind < 0.75:
+            level = rng.randint(1, 6)
+            parts.append(f'<h{level}>{words()}</h{level}>')
+        elif kind < 0.9:
+            parts.append(f'<p>{random_html(rng, depth + 1)}</p>')
+        else:
+            parts.append(f'<div>{random_html(rng, depth + 1)}</div>')
+    return ''.join(parts)
+
+
+def menus() -> List[str]:
+    """Реалистичные меню: шаблон, ответы оптимизатора и LLM."""
+    return [LEGACY_TEMPLATE, LLM_MENU] + optimizer_menus()
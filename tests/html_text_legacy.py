@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+# Прежний html_to_text из razdel.py на BeautifulSoup — эталон для tests/test_html_text.py
+# и tests/bench_html_text.py. В боте не используется.
+
+import re
+import logging
+
+from bs4 import BeautifulSoup
+
+logger = logging.getLogger(__name__)
+
+
+def html_to_text(html_content: str) -> str:
+    try:
+        # Убедитесь, что контент в правильной кодировке
+        if isinstance(html_content, bytes):
+            html_content = html_content.decode('utf-8', errors='ignore')
+        
+        soup = BeautifulSoup(html_content, 'html.parser')
+        
+        # Удаляем скрипты и стили
+        for script in soup(["script", "style"]):
+            script.decompose()
+        
+        # Обрабатываем таблицы для лучшего форматирования
+        for table in soup.find_all('table'):
+            # Добавляем переносы строк вокруг таблиц
+            table.insert_before(soup.new_string('\n\n'))
+            table.insert_after(soup.new_string('\n\n'))
+            
+            # Обрабатываем строки таблицы
+            for i, row in enumerate(table.find_all('tr')):
+                if i == 0:  # Заголовок таблицы
+                    row.insert_before(soup.new_string('\n'))
+                cells = row.find_all(['th', 'td'])
+                row_text = ' | '.join(cell.get_text(strip=True) for cell in cells)
+                row.string = row_text
+                row.insert_after(soup.new_string('\n'))
+        
+        # Обрабатываем списки
+        for ul in soup.find_all('ul'):
+            ul.insert_before(soup.new_string('\n'))
+            for li in ul.find_all('li'):
+                li.string = '• ' + li.get_text(strip=True)
+                li.insert_after(soup.new_string('\n'))
+            ul.insert_after(soup.new_string('\n'))
+        
+        # Обрабатываем заголовки
+        for tag in soup.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6']):
+            tag.insert_before(soup.new_string('\n\n'))
+            tag.insert_after(soup.new_string('\n\n'))
+        
+        # Обрабатываем параграфы
+        for p in soup.find_all('p'):
+            p.insert_before(soup.new_string('\n'))
+            p.insert_after(soup.new_string('\n'))
+        
+        # Получаем текст с сохранением структуры
+        text = soup.get_text()
+        
+        # Заменяем множественные переносы на двойные для лучшей читаемости
+        text = re.sub(r'\n\s*\n\s*\n', '\n\n', text)
+        text = re.sub(r'\n\s*\n', '\n\n', text)
+        
+        # Убираем лишние пробелы, но сохраняем структуру
+        text = re.sub(r'[ \t]+', ' ', text)
+        
+        return text.strip()
+    except Exception as e:
+        logger.error(f"Ошибка конвертации HTML в текст: {e}")
+        return html_content  # Возвращаем оригинал в случае ошибки
+
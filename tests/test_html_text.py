@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+import random
+
+import pytest
+
+from html_text import html_to_text, parse_menu_html
+from html_menus import EDGE_CASES, LEGACY_TEMPLATE, LLM_MENU, NESTED_LIST, UNCLOSED_ITEM, menus, random_html
+
+legacy = pytest.importorskip('html_text_legacy', reason="эталон требует beautifulsoup4")
+
+
+@pytest.mark.parametrize("html", menus() + EDGE_CASES)
+def test_same_text_as_legacy(html):
+    assert html_to_text(html) == legacy.html_to_text(html)
+
+
+def test_same_text_as_legacy_on_random_documents():
+    rng = random.Random(1)
+    for _ in range(3000):
+        html = random_html(rng)
+        assert html_to_text(html) == legacy.html_to_text(html), html
+
+
+@pytest.mark.parametrize("html, expected", [
+    (NESTED_LIST, "• ЗавтракКашаЧай\n• Обед"),
+    (UNCLOSED_ITEM, "• Яйца 2 штМолоко 200 мл"),
+])
+def test_nested_list_is_converted(html, expected):
+    # Прежняя реализация падала на вложенных пунктах и отдавала пользователю исходный HTML
+    assert legacy.html_to_text(html) == html
+    assert html_to_text(html) == expected
+
+
+def test_shopping_items_captured_in_same_pass():
+    text, items = parse_menu_html(LEGACY_TEMPLATE)
+    assert text == html_to_text(LEGACY_TEMPLATE)
+    assert items[0] == "Овсянка - 150г" and items[-1] == "Специи - по вкусу" and len(items) == 10
+    # Пункты обычных списков (рекомендации) в покупки не попадают
+    assert parse_menu_html(LLM_MENU)[1] == ["Яйца — 2 шт", "Молоко200 мл"]
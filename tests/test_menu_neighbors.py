@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from menu_neighbors import _scale_amount, rescale_menu
+
+
+@pytest.mark.parametrize("amount, factor, expected", [
+    ("0.3 кг", 1.2, "0.4 кг"),
+    ("0.5 л", 1.1, "0.6 л"),
+    ("1.5 кг", 1.1, "1.7 кг"),
+    ("0,5 л", 1.5, "0,8 л"),
+    ("1 кг", 1.26, "1.3 кг"),
+    ("1 л", 0.5, "0.5 л"),
+    ("200г", 1.13, "226г"),
+    ("2 шт", 1.3, "3 шт"),
+    ("по вкусу", 2.0, "по вкусу"),
+])
+def test_scale_amount_keeps_precision(amount, factor, expected):
+    assert _scale_amount(amount, factor) == expected
+
+
+def test_small_amount_does_not_round_to_zero():
+    assert _scale_amount("0.1 кг", 0.04) == "0.004 кг"
+
+
+def test_rescale_menu_shopping_list_fractional():
+    menu = {
+        "title": "",
+        "meals": [{"name": "Обед", "emoji": "", "drink": "Вода",
+                   "dishes": [{"name": "Гречка", "grams": 200, "kcal": 1000, "protein": 20, "fat": 10, "carbs": 150}]}],
+        "shopping_list": [{"product": "Гречка", "amount": "0.3 кг"}, {"product": "Молоко", "amount": "0.5 л"}],
+        "tips": []
+    }
+    scaled = rescale_menu(menu, 1200)
+    assert [item["amount"] for item in scaled["shopping_list"]] == ["0.4 кг", "0.6 л"]
+    assert scaled["meals"][0]["dishes"][0]["grams"] == 240
+    # Исходное меню не меняется
+    assert menu["shopping_list"][0]["amount"] == "0.3 кг"
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+import itertools
+import logging
+import random
+
+import numpy as np
+import pytest
+
+from nutrition import calculate_calories, encode_labels, targets, targets_batch
+from user_profile import ACTIVITY_LABELS, GENDER_LABELS, GOAL_LABELS, Activity, Gender, Goal, parse_gender
+
+COMBINATIONS = list(itertools.product(Gender, Activity, Goal))
+
+# Вес, кратный 1/8 кг, даёт белок ровно на границе x.x5 (60.125 * 2 * 10 = 1202.5)
+TIES = [60.125, 60.375, 75.625, 99.875, 45.0625]
+
+
+def assert_same(batch, profiles):
+    for i, profile in enumerate(profiles):
+        single = targets(*profile)
+        for key, value in single.items():
+            # Поэлементное точное сравнение: пакетный путь должен совпадать побитно
+            assert batch[key][i] == value, (key, profile)
+
+
+def grid(rng, count):
+    profiles = []
+    for _ in range(count):
+        gender, activity, goal = rng.choice(COMBINATIONS)
+        age = rng.randint(14, 90)
+        weight = rng.choice([round(rng.uniform(35, 180), 1), rng.randint(280, 1440) / 8, rng.choice(TIES)])
+        height = rng.choice([round(rng.uniform(140, 215), 1), rng.randint(1120, 1720) / 8])
+        profiles.append((gender, age, weight, height, activity, goal))
+    return profiles
+
+
+def batch_of(profiles):
+    gender, age, weight, height, activity, goal = zip(*profiles)
+    return targets_batch(np.array(gender), age, weight, height, np.array(activity), np.array(goal))
+
+
+def test_batch_matches_scalar_on_random_grid():
+    profiles = grid(random.Random(19), 20000)
+    assert_same(batch_of(profiles), profiles)
+
+
+@pytest.mark.parametrize("gender, activity, goal", COMBINATIONS)
+def test_batch_matches_scalar_for_every_combination(gender, activity, goal):
+    profiles = [(gender, age, weight, height, activity, goal)
+                for age in (18, 35, 61) for weight in [50.0, 82.3] + TIES for height in (155.0, 172.5, 190.125)]
+    assert_same(batch_of(profiles), profiles)
+
+
+# Профили, где значение *10 попадает ровно на .5 (мужчина, 20 лет, рост 170, низкая активность, поддержание)
+@pytest.mark.parametrize("key, weight, expected", [
+    ('protein', 60.125, 120.2), ('protein', 60.375, 120.8),
+    ('fat', 51.0, 49.2), ('fat', 52.5, 49.8),
+    ('carbs', 50.25, 230.2), ('carbs', 52.25, 230.8),
+])
+def test_half_tenths_round_to_even(key, weight, expected):
+    # Банковское округление в обоих путях, а не round(x, 1) по десятичной записи
+    profile = (Gender.MALE, 20, weight, 170.0, Activity.LOW, Goal.MAINTAIN)
+    assert targets(*profile)[key] == expected
+    assert batch_of([profile])[key][0] == expected
+
+
+def test_batch_matches_scalar_on_binary_grid():
+    # Вес и рост, кратные 1/8, точно представимы и часто дают границы x.x5 во всех трёх БЖУ
+    profiles = [(gender, age, weight / 8, height / 8, activity, goal)
+                for gender, activity, goal in COMBINATIONS
+                for age in (20, 33) for weight in range(400, 480) for height in range(1360, 1368)]
+    assert_same(batch_of(profiles), profiles)
+
+
+@pytest.mark.parametrize("gender, activity, goal", COMBINATIONS)
+def test_calculate_calories_parses_labels(gender, activity, goal):
+    expected = targets(gender, 40, 70.5, 178, activity, goal)
+    labels = GENDER_LABELS[gender], ACTIVITY_LABELS[activity], GOAL_LABELS[goal]
+    assert calculate_calories(labels[0], 40, 70.5, 178, labels[1], labels[2]) == expected
+    # Подписи из анкеты сравниваются без учёта регистра и пробелов по краям
+    assert calculate_calories(f" {labels[0].upper()} ", 40, 70.5, 178, f"{labels[1].title()} ", f" {labels[2]}") == expected
+
+
+@pytest.mark.parametrize("field, labels, expected", [
+    ('gender', ('мужик', 'средний', 'похудеть'), (Gender.MALE, Activity.MEDIUM, Goal.LOSE)),
+    ('activity', ('женщина', 'очень высокий', 'похудеть'), (Gender.FEMALE, Activity.MEDIUM, Goal.LOSE)),
+    ('goal', ('женщина', 'низкий', 'сушка'), (Gender.FEMALE, Activity.LOW, Goal.MAINTAIN)),
+])
+def test_calculate_calories_falls_back_on_unknown_labels(caplog, field, labels, expected):
+    gender, activity, goal = labels
+    with caplog.at_level(logging.WARNING, logger='nutrition'):
+        result = calculate_calories(gender, 40, 70.5, 178, activity, goal)
+    assert result == targets(expected[0], 40, 70.5, 178, expected[1], expected[2])
+    unknown = dict(zip(('gender', 'activity', 'goal'), labels))[field]
+    assert [record.getMessage() for record in caplog.records] == [f"Некорректный {field}: {unknown}"]
+
+
+def test_calculate_calories_all_fallbacks():
+    assert calculate_calories('', 25, 80, 180, '', '') == targets(Gender.MALE, 25, 80, 180, Activity.MEDIUM, Goal.MAINTAIN)
+
+
+def test_encode_labels_uses_default_for_unknown():
+    codes = encode_labels(['женщина', 'Мужчина', '?', 'женщина', None], parse_gender, Gender.MALE)
+    assert codes.tolist() == [Gender.FEMALE, Gender.MALE, Gender.MALE, Gender.FEMALE, Gender.MALE]
+    assert codes.dtype == np.int8
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from products import load_product_index, merge_shopping_list, split_item
+
+
+@pytest.fixture(scope='module')
+def index():
+    return load_product_index()
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Куриное филе - 250г", ("Куриное филе", "250г")),
+    ("Специи: по вкусу", ("Специи", "по вкусу")),
+    ("Лук 1 шт (100 г)", ("Лук", "1 шт 100 г")),
+    ("Яйца (2 шт)", ("Яйца", "2 шт")),
+])
+def test_split_item_removes_every_quantity(text, expected):
+    assert split_item(text) == expected
+
+
+def test_merge_prefers_unit_already_used_for_product(index):
+    merged = merge_shopping_list([
+        {'product': 'Лук репчатый 50г'},
+        {'product': 'Лук 1 шт (100 г)'},
+        {'product': 'Яйца 2 шт'},
+        {'product': 'Яйца', 'amount': '3 шт (150 г)'},
+    ], index)
+    assert merged == [{'product': 'Лук репчатый', 'amount': '150г'}, {'product': 'Яйца', 'amount': '5 шт'}]
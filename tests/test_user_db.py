@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+# Общие проверки хранилищ пользователей. PostgreSQL проверяется, если задан USER_DB_TEST_DSN
+# (отдельная тестовая база: таблицы в ней пересоздаются), например:
+#   USER_DB_TEST_DSN=postgresql://postgres@localhost/nutri_test python -m pytest tests
+
+import os
+import asyncio
+import sqlite3
+
+import pytest
+
+from user_db import PROFILE_FIELDS, SQLiteUserDB, UserDB
+
+USER_DB_TEST_DSN = os.getenv('USER_DB_TEST_DSN')
+
+PROFILE = {'gender': 'женщина', 'age': 31, 'weight': 62.5, 'height': 168.0, 'activity': 'средний', 'goal': 'похудеть'}
+
+
+class Backend:
+    """Создание хранилища на чистой базе и прямые запросы к ней в обход UserDB."""
+
+    def __init__(self, name, tmp_path):
+        self.name = name
+        self.path = str(tmp_path / 'users.db')
+
+    def make(self, **kwargs) -> UserDB:
+        if self.name == 'sqlite':
+            return SQLiteUserDB(self.path, **kwargs)
+        from user_db_postgres import PostgresUserDB
+        return PostgresUserDB(USER_DB_TEST_DSN, min_size=1, max_size=4, **kwargs)
+
+    async def fetch(self, sql: str):
+        if self.name == 'sqlite':
+            with sqlite3.connect(self.path) as conn:
+                return conn.execute(sql).fetchall()
+        import asyncpg
+        conn = await asyncpg.connect(USER_DB_TEST_DSN)
+        try:
+            return [tuple(row) for row in await conn.fetch(sql)]
+        finally:
+            await conn.close()
+
+    async def reset(self) -> None:
+        if self.name == 'postgres':
+            import asyncpg
+            conn = await asyncpg.connect(USER_DB_TEST_DSN)
+            try:
+                await conn.execute("DROP TABLE IF EXISTS users, menus, schema_migrations")
+            finally:
+                await conn.close()
+
+
+@pytest.fixture(params=['sqlite', 'postgres'])
+def backend(request, tmp_path):
+    if request.param == 'postgres':
+        if not USER_DB_TEST_DSN:
+            pytest.skip("USER_DB_TEST_DSN не задан")
+        pytest.importorskip('asyncpg')
+    backend = Backend(request.param, tmp_path)
+    asyncio.run(backend.reset())
+    return backend
+
+
+def test_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        UserDB()
+
+
+def test_migrations_applied_once(backend):
+    async def scenario():
+        for _ in range(2):
+            db = backend.make()
+            await db.open()
+            await db.close()
+        return await backend.fetch("SELECT version FROM schema_migrations")
+
+    assert asyncio.run(scenario()) == [(1,)]
+
+
+def test_concurrent_startup_migrates_under_advisory_lock(backend):
+    if backend.name != 'postgres':
+        pytest.skip("advisory-блокировка есть только в PostgreSQL")
+
+    async def scenario():
+        dbs = [backend.make() for _ in range(4)]
+        await asyncio.gather(*(db.open() for db in dbs))
+        await asyncio.gather(*(db.close() for db in dbs))
+        versions = await backend.fetch("SELECT version FROM schema_migrations")
+        locks = await backend.fetch("SELECT objid FROM pg_locks WHERE locktype = 'advisory'")
+        return versions, locks
+
+    versions, locks = asyncio.run(scenario())
+    assert versions == [(1,)]
+    assert locks == []
+
+
+def test_profiles_written_in_batches(backend):
+    async def scenario():
+        db = backend.make(flush_interval=60, flush_batch=1000)
+        await db.open()
+        for user_id in range(1, 121):
+            await db.save_profile(user_id, dict(PROFILE, age=20 + user_id % 50))
+        # Ещё не записанный профиль уже виден при чтении
+        pending = await db.get_profile(7)
+        await db.flush()
+        stats = db.stats()
+        await db.close()
+
+        reopened = backend.make()
+        await reopened.open()
+        stored = await reopened.get_profile(7)
+        missing = await reopened.get_profile(10_000)
+        await reopened.close()
+        count = await backend.fetch("SELECT COUNT(*) FROM users")
+        return pending, stats, stored, missing, count
+
+    pending, stats, stored, missing, count = asyncio.run(scenario())
+    assert pending == dict(PROFILE, age=27)
+    assert stats['writes'] == 120 and stats['batches'] == 1 and stats['pending'] == 0
+    assert {field: stored[field] for field in PROFILE_FIELDS} == dict(PROFILE, age=27)
+    assert missing is None
+    assert count == [(120,)]
+
+
+def test_latest_save_wins_within_batch(backend):
+    async def scenario():
+        db = backend.make(flush_interval=60)
+        await db.open()
+        await db.save_profile(1, PROFILE)
+        await db.save_profile(1, dict(PROFILE, weight=60.0))
+        await db.close()
+        reopened = backend.make()
+        await reopened.open()
+        try:
+            return await reopened.get_profile(1)
+        finally:
+            await reopened.close()
+
+    assert asyncio.run(scenario())['weight'] == 60.0
+
+
+def test_menu_history_paging(backend):
+    menu = {'title': 'Меню', 'meals': [], 'shopping_list': [{'product': 'Гречка', 'amount': '100г'}], 'tips': []}
+
+    async def scenario():
+        db = backend.make()
+        await db.open()
+        ids = [await db.add_menu(5, f"2025-01-{day:02d}", 'abc', 'gigachat', 1.5, 900, f"<p>{day}</p>", menu)
+               for day in range(1, 8)]
+        await db.add_menu(6, "2025-01-01", 'def', 'local', None, None, "<p>чужое</p>")
+        first, total = await db.list_menus(5, limit=5)
+        second, _ = await db.list_menus(5, limit=5, offset=5)
+        stored = await db.get_menu(5, ids[2])
+        foreign = await db.get_menu(6, ids[2])
+        await db.close()
+        return first, second, total, stored, foreign
+
+    first, second, total, stored, foreign = asyncio.run(scenario())
+    assert total == 7
+    assert [record.day for record in first] == [f"2025-01-{day:02d}" for day in range(7, 2, -1)]
+    assert [record.day for record in second] == ["2025-01-02", "2025-01-01"]
+    assert first[0].provider == 'gigachat' and first[0].tokens == 900
+    assert stored == ("<p>3</p>", menu)
+    assert foreign is None
+
+
+def test_close_waits_for_in_flight_batch(backend):
+    async def scenario():
+        db = backend.make(flush_interval=0.01)
+        await db.open()
+        write_profiles = db._write_profiles
+
+        async def slow_write(rows):
+            await asyncio.sleep(0.2)
+            await write_profiles(rows)
+
+        db._write_profiles = slow_write
+        for user_id in range(1, 6):
+            await db.save_profile(user_id, PROFILE)
+        # Фоновая запись пакета уже идёт, когда бот останавливается
+        await asyncio.sleep(0.1)
+        await db.close()
+        return db.stats(), await backend.fetch("SELECT COUNT(*) FROM users")
+
+    stats, count = asyncio.run(scenario())
+    assert stats['writes'] == 5 and stats['batches'] == 1 and stats['pending'] == 0
+    assert count == [(5,)]
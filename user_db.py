@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import sqlite3
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from menu_history import MenuRecord, pack_menu, unpack_menu
+
+logger = logging.getLogger(__name__)
+
+# Хранилище пользователей: sqlite (файл рядом с ботом) или postgres (общая база для нескольких процессов)
+USER_DB_BACKEND = os.getenv('USER_DB_BACKEND', 'sqlite').lower()
+USER_DB_PATH = os.getenv('USER_DB_PATH', 'user_data.db')
+# Ожидание блокировки другим процессом (мс) и размер страничного кэша SQLite (КиБ)
+USER_DB_BUSY_TIMEOUT = int(os.getenv('USER_DB_BUSY_TIMEOUT', '5000'))
+USER_DB_CACHE_KIB = int(os.getenv('USER_DB_CACHE_KIB', '8192'))
+# Отложенная запись профилей: пакет коммитится по таймеру (сек) или при достижении размера
+USER_DB_FLUSH_INTERVAL = float(os.getenv('USER_DB_FLUSH_INTERVAL', '0.5'))
+USER_DB_FLUSH_BATCH = int(os.getenv('USER_DB_FLUSH_BATCH', '200'))
+
+PROFILE_FIELDS = ('gender', 'age', 'weight', 'height', 'activity', 'goal')
+
+# Миграции схемы: (версия, выражения). Применяются по порядку, номер последней хранится в schema_migrations.
+# Первая версия совпадает с таблицами, которые раньше создавались при старте, поэтому старые базы подхватываются.
+SQLITE_MIGRATIONS: List[Tuple[int, List[str]]] = [
+    (1, [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            gender TEXT,
+            age INTEGER,
+            weight REAL,
+            height REAL,
+            activity TEXT,
+            goal TEXT
+        )
+        ''',
+        # История меню: payload сжат zlib с общим словарём (см. menu_history)
+        '''
+        CREATE TABLE IF NOT EXISTS menus (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            profile_hash TEXT NOT NULL,
+            provider TEXT NOT NULL,
+            latency REAL,
+            tokens INTEGER,
+            codec INTEGER NOT NULL,
+            payload BLOB NOT NULL,
+            created_at REAL NOT NULL
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_menus_user_date ON menus (user_id, date)"
+    ]),
+]
+
+# Текст запросов не меняется — sqlite3 держит их скомпилированными в кэше выражений соединения
+_INSERT_MENU = '''
+    INSERT INTO menus (user_id, date, profile_hash, provider, latency, tokens, codec, payload, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+_SELECT_MENU_PAGE = '''
+    SELECT id, date, provider, latency, tokens, created_at FROM menus
+    WHERE user_id = ? ORDER BY date DESC, id DESC LIMIT ? OFFSET ?
+'''
+_COUNT_MENUS = "SELECT COUNT(*) FROM menus WHERE user_id = ?"
+_SELECT_MENU = "SELECT codec, payload FROM menus WHERE id = ? AND user_id = ?"
+_SELECT_PROFILE = "SELECT gender, age, weight, height, activity, goal FROM users WHERE user_id = ?"
+_UPSERT_PROFILE = '''
+    INSERT OR REPLACE INTO users (user_id, gender, age, weight, height, activity, goal)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+class UserDB(ABC):
+    """Хранилище профилей и истории меню. Профили пишутся отложенно: несколько сохранений
+    объединяются в одну транзакцию. Работа с конкретной базой — в наследниках."""
+
+    name = "base"
+
+    def __init__(self, flush_interval: float = USER_DB_FLUSH_INTERVAL, flush_batch: int = USER_DB_FLUSH_BATCH):
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self._opened = False
+        self._open_lock = asyncio.Lock()
+        # Ещё не записанные профили (последняя версия на пользователя) и пакет, который пишется сейчас
+        self._pending: Dict[int, Tuple] = {}
+        self._flushing: Dict[int, Tuple] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._batch_full: Optional[asyncio.Event] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.writes = 0
+        self.batches = 0
+
+    # Операции конкретной базы
+    @abstractmethod
+    async def _connect(self) -> None:
+        """Соединение и миграции схемы."""
+
+    @abstractmethod
+    async def _disconnect(self) -> None:
+        """Закрытие соединения."""
+
+    @abstractmethod
+    async def _fetch_profile(self, user_id: int) -> Optional[Tuple]:
+        """(gender, age, weight, height, activity, goal) или None."""
+
+    @abstractmethod
+    async def _write_profiles(self, rows: List[Tuple]) -> None:
+        """Весь пакет (user_id, gender, age, weight, height, activity, goal) — одной транзакцией."""
+
+    @abstractmethod
+    async def _insert_menu(self, row: Tuple) -> int:
+        """Строка таблицы menus без id; возвращает id новой записи."""
+
+    @abstractmethod
+    async def _fetch_menu_page(self, user_id: int, limit: int, offset: int) -> Tuple[List[MenuRecord], int]:
+        """Страница истории (новые сверху) и общее число меню пользователя."""
+
+    @abstractmethod
+    async def _fetch_menu(self, user_id: int, menu_id: int) -> Optional[Tuple[int, bytes]]:
+        """(код упаковки, payload) меню пользователя или None."""
+
+    async def open(self) -> None:
+        async with self._open_lock:
+            if self._opened:
+                return
+            await self._connect()
+            self._wakeup = asyncio.Event()
+            self._batch_full = asyncio.Event()
+            self._stopping = False
+            self._flusher = asyncio.create_task(self._flush_loop())
+            self._opened = True
+
+    async def close(self) -> None:
+        if not self._opened:
+            return
+        if self._flusher is not None:
+            # Не отменяем фоновую запись посреди пакета: просим цикл остановиться и ждём текущую запись
+            self._stopping = True
+            self._wakeup.set()
+            self._batch_full.set()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        # Всё накопленное дописываем до закрытия соединения
+        await self.flush()
+        if self._pending:
+            logger.error(f"Не удалось сохранить {len(self._pending)} профилей при остановке.")
+        self._opened = False
+        await self._disconnect()
+
+    async def get_profile(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """Профиль пользователя {'gender', 'age', ...} или None, если данные не заполнены."""
+        # Сначала незаписанные изменения: пользователь сразу видит то, что только что сохранил
+        row = self._pending.get(user_id) or self._flushing.get(user_id)
+        if row is not None:
+            return dict(zip(PROFILE_FIELDS, row[1:]))
+        if not self._opened:
+            await self.open()
+        row = await self._fetch_profile(user_id)
+        return dict(zip(PROFILE_FIELDS, row)) if row else None
+
+    async def save_profile(self, user_id: int, data: Dict[str, Any]) -> None:
+        """Ставит профиль в очередь записи; в базу он попадёт со следующим пакетом."""
+        if not self._opened:
+            await self.open()
+        self._pending[user_id] = (user_id, *(data[field] for field in PROFILE_FIELDS))
+        self._wakeup.set()
+        if len(self._pending) >= self.flush_batch:
+            self._batch_full.set()
+
+    async def flush(self) -> None:
+        """Записывает накопленные профили одной транзакцией; при ошибке они остаются в очереди."""
+        if not self._pending or not self._opened:
+            return
+        self._flushing, self._pending = self._pending, {}
+        try:
+            # Отмена ожидающего (остановка бота) не должна обрывать уже начатую запись пакета
+            await asyncio.shield(self._write_profiles(list(self._flushing.values())))
+        except asyncio.CancelledError:
+            # Запись продолжается без нас и может не удаться — пакет остаётся в очереди (повтор безвреден)
+            self._requeue()
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка записи пакета профилей ({len(self._flushing)} шт.): {e}")
+            self._requeue()
+        else:
+            self.writes += len(self._flushing)
+            self.batches += 1
+        finally:
+            self._flushing = {}
+
+    def _requeue(self) -> None:
+        # Более свежие сохранения, пришедшие во время записи, важнее
+        for user_id, row in self._flushing.items():
+            self._pending.setdefault(user_id, row)
+
+    async def _flush_loop(self) -> None:
+        # close() допишет остаток сам после выхода из цикла
+        while not self._stopping:
+            await self._wakeup.wait()
+            if self._stopping:
+                return
+            # Копим сохранения короткое время или пока не наберётся пакет
+            try:
+                await asyncio.wait_for(self._batch_full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            self._batch_full.clear()
+            await self.flush()
+            if self._pending:
+                self._wakeup.set()
+                if len(self._pending) >= self.flush_batch:
+                    self._batch_full.set()
+
+    async def add_menu(self, user_id: int, day: str, profile_hash: str, provider: str, latency: Optional[float],
+                       tokens: Optional[int], html: str, menu: Optional[dict] = None) -> int:
+        """Сохраняет сгенерированное меню в историю; возвращает его id."""
+        if not self._opened:
+            await self.open()
+        # Сжатие — в потоке, а не в event loop
+        codec, payload = await asyncio.to_thread(pack_menu, html, menu)
+        return await self._insert_menu((user_id, day, profile_hash, provider, latency, tokens, codec, payload, time.time()))
+
+    async def list_menus(self, user_id: int, limit: int = 5, offset: int = 0) -> Tuple[List[MenuRecord], int]:
+        """Страница истории (новые сверху) без payload и общее число меню пользователя."""
+        if not self._opened:
+            await self.open()
+        return await self._fetch_menu_page(user_id, limit, offset)
+
+    async def get_menu(self, user_id: int, menu_id: int) -> Optional[Tuple[str, Optional[dict]]]:
+        """(HTML, структурированное меню или None) из истории; чужие меню не отдаются."""
+        if not self._opened:
+            await self.open()
+        row = await self._fetch_menu(user_id, menu_id)
+        return await asyncio.to_thread(unpack_menu, *row) if row else None
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.name,
+            "pending": len(self._pending) + len(self._flushing),
+            "writes": self.writes,
+            "batches": self.batches
+        }
+
+
+class SQLiteUserDB(UserDB):
+    """user_data.db: одно долгоживущее соединение в отдельном потоке, event loop не блокируется."""
+
+    name = "sqlite"
+
+    def __init__(self, path: str = USER_DB_PATH, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        # Один поток — все запросы идут через одно соединение последовательно, без гонок
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._conn: Optional[sqlite3.Connection] = None
+
+    async def _call(self, func: Callable[..., Any], *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def _connect(self) -> None:
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="user-db")
+        await self._call(self._connect_sync)
+        logger.info(f"База пользователей открыта: {self.path}")
+
+    def _connect_sync(self) -> None:
+        conn = sqlite3.connect(self.path, cached_statements=64)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={USER_DB_BUSY_TIMEOUT}")
+        conn.execute(f"PRAGMA cache_size=-{USER_DB_CACHE_KIB}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        self._migrate(conn)
+        self._conn = conn
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection) -> None:
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS schema_migrations (version INTEGER PRIMARY KEY, applied_at REAL NOT NULL)")
+        current = conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations").fetchone()[0]
+        for version, statements in SQLITE_MIGRATIONS:
+            if version <= current:
+                continue
+            with conn:
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute("INSERT INTO schema_migrations (version, applied_at) VALUES (?, ?)", (version, time.time()))
+            logger.info(f"SQLite: применена миграция {version}.")
+
+    async def _disconnect(self) -> None:
+        executor, self._executor = self._executor, None
+        await asyncio.get_running_loop().run_in_executor(executor, self._close_sync)
+        executor.shutdown(wait=True)
+
+    def _close_sync(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _fetch_profile_sync(self, user_id: int) -> Optional[Tuple]:
+        return self._conn.execute(_SELECT_PROFILE, (user_id,)).fetchone()
+
+    def _write_profiles_sync(self, rows: List[Tuple]) -> None:
+        # Весь пакет — одна транзакция и один fsync
+        with self._conn:
+            self._conn.executemany(_UPSERT_PROFILE, rows)
+
+    def _insert_menu_sync(self, row: Tuple) -> int:
+        with self._conn:
+            return self._conn.execute(_INSERT_MENU, row).lastrowid
+
+    def _fetch_menu_page_sync(self, user_id: int, limit: int, offset: int) -> Tuple[List[MenuRecord], int]:
+        rows = self._conn.execute(_SELECT_MENU_PAGE, (user_id, limit, offset)).fetchall()
+        total = self._conn.execute(_COUNT_MENUS, (user_id,)).fetchone()[0]
+        return [MenuRecord(*row) for row in rows], total
+
+    def _fetch_menu_sync(self, user_id: int, menu_id: int) -> Optional[Tuple[int, bytes]]:
+        return self._conn.execute(_SELECT_MENU, (menu_id, user_id)).fetchone()
+
+    async def _fetch_profile(self, user_id: int) -> Optional[Tuple]:
+        return await self._call(self._fetch_profile_sync, user_id)
+
+    async def _write_profiles(self, rows: List[Tuple]) -> None:
+        await self._call(self._write_profiles_sync, rows)
+
+    async def _insert_menu(self, row: Tuple) -> int:
+        return await self._call(self._insert_menu_sync, row)
+
+    async def _fetch_menu_page(self, user_id: int, limit: int, offset: int) -> Tuple[List[MenuRecord], int]:
+        return await self._call(self._fetch_menu_page_sync, user_id, limit, offset)
+
+    async def _fetch_menu(self, user_id: int, menu_id: int) -> Optional[Tuple[int, bytes]]:
+        return await self._call(self._fetch_menu_sync, user_id, menu_id)
+
+
+def create_user_db() -> UserDB:
+    """Хранилище по настройке USER_DB_BACKEND."""
+    if USER_DB_BACKEND in ('postgres', 'postgresql'):
+        from user_db_postgres import PostgresUserDB
+        return PostgresUserDB()
+    if USER_DB_BACKEND != 'sqlite':
+        raise ValueError(f"Неизвестный USER_DB_BACKEND: {USER_DB_BACKEND}")
+    return SQLiteUserDB()
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+from array import array
+from enum import IntEnum
+from typing import Dict, Optional
+
+
+class Gender(IntEnum):
+    MALE = 0
+    FEMALE = 1
+
+
+class Activity(IntEnum):
+    LOW = 0
+    MEDIUM = 1
+    HIGH = 2
+
+
+class Goal(IntEnum):
+    MAINTAIN = 0
+    LOSE = 1
+    GAIN = 2
+
+
+# Подписи в том виде, в каком их вводит пользователь (индекс = код перечисления)
+GENDER_LABELS = ("мужчина", "женщина")
+ACTIVITY_LABELS = ("низкий", "средний", "высокий")
+GOAL_LABELS = ("поддерживать форму", "похудеть", "набрать массу")
+
+ACTIVITY_COEFFS = (1.2, 1.55, 1.725)
+
+_GENDER_CODES = {label: Gender(i) for i, label in enumerate(GENDER_LABELS)}
+_ACTIVITY_CODES = {label: Activity(i) for i, label in enumerate(ACTIVITY_LABELS)}
+_GOAL_CODES = {label: Goal(i) for i, label in enumerate(GOAL_LABELS)}
+
+
+def parse_gender(text: str) -> Optional[Gender]:
+    return _GENDER_CODES.get(text.strip().lower())
+
+
+def parse_activity(text: str) -> Optional[Activity]:
+    return _ACTIVITY_CODES.get(text.strip().lower())
+
+
+def parse_goal(text: str) -> Optional[Goal]:
+    return _GOAL_CODES.get(text.strip().lower())
+
+
+class Profile:
+    """Компактный профиль: коды перечислений вместо строк, без __dict__ на каждый объект."""
+
+    __slots__ = ("gender", "age", "weight", "height", "activity", "goal")
+
+    def __init__(self, gender: Gender, age: int, weight: float, height: float, activity: Activity, goal: Goal):
+        self.gender = Gender(gender)
+        self.age = int(age)
+        self.weight = float(weight)
+        self.height = float(height)
+        self.activity = Activity(activity)
+        self.goal = Goal(goal)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Profile":
+        """Из данных анкеты: коды (int) или подписи ('мужчина', 'средний', ...)."""
+        def code(value, parse):
+            return value if isinstance(value, int) else parse(str(value))
+        return cls(code(data["gender"], parse_gender), data["age"], data["weight"], data["height"],
+                   code(data["activity"], parse_activity), code(data["goal"], parse_goal))
+
+    @property
+    def gender_label(self) -> str:
+        return GENDER_LABELS[self.gender]
+
+    @property
+    def activity_label(self) -> str:
+        return ACTIVITY_LABELS[self.activity]
+
+    @property
+    def goal_label(self) -> str:
+        return GOAL_LABELS[self.goal]
+
+    @property
+    def activity_coeff(self) -> float:
+        return ACTIVITY_COEFFS[self.activity]
+
+    def to_dict(self) -> Dict:
+        """Словарь с подписями — в формате строк таблицы users."""
+        return {
+            "gender": self.gender_label, "age": self.age, "weight": self.weight, "height": self.height,
+            "activity": self.activity_label, "goal": self.goal_label
+        }
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Profile):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self) -> str:
+        return (f"Profile({self.gender_label}, {self.age}, {self.weight}, {self.height}, "
+                f"{self.activity_label}, {self.goal_label})")
+
+
+class ProfileStore:
+    """Профили в плотных массивах (11 байт полей на пользователя) и хеш-таблица user_id -> строка
+    с открытой адресацией на массивах (ещё ~24 байта). Объект Profile создаётся только при чтении."""
+
+    _EMPTY = -1
+
+    def __init__(self, capacity: int = 1024):
+        self._count = 0
+        self._slot_keys = array('q', [self._EMPTY]) * capacity
+        self._slot_rows = array('l', [0]) * capacity
+        self._codes = array('B')      # gender | activity << 2 | goal << 4
+        self._ages = array('B')
+        self._weights = array('f')
+        self._heights = array('f')
+
+    def _slot(self, user_id: int) -> int:
+        """Слот с этим user_id или первый свободный (линейное пробирование)."""
+        mask = len(self._slot_keys) - 1
+        slot = (user_id * 0x9E3779B97F4A7C15 >> 16) & mask
+        while True:
+            key = self._slot_keys[slot]
+            if key == user_id or key == self._EMPTY:
+                return slot
+            slot = (slot + 1) & mask
+
+    def _grow(self) -> None:
+        keys, rows = self._slot_keys, self._slot_rows
+        self._slot_keys = array('q', [self._EMPTY]) * (len(keys) * 2)
+        self._slot_rows = array('l', [0]) * (len(keys) * 2)
+        for key, row in zip(keys, rows):
+            if key != self._EMPTY:
+                slot = self._slot(key)
+                self._slot_keys[slot] = key
+                self._slot_rows[slot] = row
+
+    def _row(self, user_id: int) -> Optional[int]:
+        slot = self._slot(user_id)
+        return self._slot_rows[slot] if self._slot_keys[slot] == user_id else None
+
+    def put(self, user_id: int, profile: Profile) -> None:
+        codes = profile.gender | profile.activity << 2 | profile.goal << 4
+        row = self._row(user_id)
+        if row is None:
+            # Заполненность таблицы не выше половины — пробы остаются короткими
+            if (self._count + 1) * 2 > len(self._slot_keys):
+                self._grow()
+            slot = self._slot(user_id)
+            self._slot_keys[slot] = user_id
+            self._slot_rows[slot] = len(self._codes)
+            self._count += 1
+            self._codes.append(codes)
+            self._ages.append(profile.age)
+            self._weights.append(profile.weight)
+            self._heights.append(profile.height)
+        else:
+            self._codes[row] = codes
+            self._ages[row] = profile.age
+            self._weights[row] = profile.weight
+            self._heights[row] = profile.height
+
+    def get(self, user_id: int) -> Optional[Profile]:
+        row = self._row(user_id)
+        if row is None:
+            return None
+        codes = self._codes[row]
+        # float32 хранит вес и рост с точностью до 0.01, подписи в сообщениях не меняются
+        return Profile(codes & 3, self._ages[row], round(self._weights[row], 2), round(self._heights[row], 2),
+                       codes >> 2 & 3, codes >> 4 & 3)
+
+    def __contains__(self, user_id: int) -> bool:
+        return self._row(user_id) is not None
+
+    def __len__(self) -> int:
+        return self._count